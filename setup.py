@@ -28,7 +28,11 @@ setup(name='wormcat3',
         'gseapy==1.1.8',
         'plotnine==0.14.5',
         'statsmodels==0.14.4',
-        'XlsxWriter==3.2.2'
+        'XlsxWriter==3.2.2',
+        'openpyxl==3.1.5'
       ],
+      extras_require={
+        'parquet': ['pyarrow']
+      },
       include_package_data=True,
       zip_safe=False)
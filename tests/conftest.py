@@ -0,0 +1,12 @@
+"""
+Shared test configuration
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir_path(tmp_path, monkeypatch):
+    """ Keep the annotation and result caches of each test in its own directory. """
+    cache_dir_path = tmp_path / "wormcat_cache"
+    monkeypatch.setenv("WORMCAT_CACHE_PATH", str(cache_dir_path))
+    return cache_dir_path
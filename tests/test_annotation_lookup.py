@@ -0,0 +1,100 @@
+"""
+Annotating gene sets by index lookup against the left merge it replaced
+"""
+import pandas as pd
+import pytest
+from wormcat3.annotations_manger import AnnotationsManager
+
+# WBGene00000002 is on two rows, WBGene00000004 has no categories, WBGene00000005 only some
+ANNOTATION_ROWS = [
+    ("Y1.1", "WBGene00000001", "Metabolism", "Metabolism: lipid", "Metabolism: lipid: sterol"),
+    ("Y1.2", "WBGene00000002", "Signaling", "Signaling: lipid", "Signaling: lipid"),
+    ("Y1.2", "WBGene00000002", "Stress response", "Stress response: heat", "Stress response: heat"),
+    ("Y1.3", "WBGene00000003", "Unassigned", "Unassigned", "Unassigned"),
+    ("Y1.4", "WBGene00000004", None, None, None),
+    ("Y1.5", "WBGene00000005", "Metabolism", None, None),
+    ("Y1.6", "WBGene00000006", "Neuronal function", "Neuronal function: synaptic", "Neuronal function: synaptic"),
+]
+ANNOTATION_COLUMNS = ["Sequence ID", "Wormbase ID", "Category 1", "Category 2", "Category 3"]
+
+# Duplicate and unknown IDs, in no particular order
+WORMBASE_GENES = ["WBGene00000006", "WBGene00000099", "WBGene00000002", "WBGene00000004", "WBGene00000001",
+                  "WBGene00000002", "WBGene00000005", "WBGene00000098", "WBGene00000099", "WBGene00000003"]
+SEQUENCE_GENES = ["Y1.6", "Y9.9", "Y1.2", "Y1.1", "Y1.2", "Y1.4", "Y1.5"]
+
+
+def write_annotations(tmp_path, rows):
+    annotation_file_path = tmp_path / "annotations.csv"
+    pd.DataFrame(rows, columns=ANNOTATION_COLUMNS).to_csv(annotation_file_path, index=False)
+    return str(annotation_file_path)
+
+
+@pytest.fixture(params=["duplicate_rows", "unique_rows"])
+def annotation_manager(request, tmp_path):
+    rows = ANNOTATION_ROWS if request.param == "duplicate_rows" else [row for i, row in enumerate(ANNOTATION_ROWS) if i != 2]
+    return AnnotationsManager(write_annotations(tmp_path, rows), use_cache=False)
+
+
+def left_merge(annotation_manager, gene_set_list, gene_type):
+    """ The merge add_annotations used to do. """
+    return pd.merge(pd.DataFrame(gene_set_list, columns=[gene_type]), annotation_manager.annotations_df, on=gene_type, how='left')
+
+
+def left_merge_segments(annotation_manager, gene_set_list, gene_type):
+    """ The split segment_genes_by_annotation_match used to do. """
+    merged_df = left_merge(annotation_manager, gene_set_list, gene_type)
+    annotation_columns = [col for col in annotation_manager.annotations_df.columns if col != gene_type]
+    genes_matched_df = merged_df.dropna(subset=annotation_columns)
+    genes_not_matched_df = merged_df[merged_df[annotation_columns].isnull().all(axis=1)][[gene_type]]
+    return genes_matched_df, genes_not_matched_df
+
+
+@pytest.mark.parametrize("gene_set_list, gene_type", [(WORMBASE_GENES, "Wormbase.ID"), (SEQUENCE_GENES, "Sequence.ID")])
+def test_add_annotations_matches_left_merge(annotation_manager, gene_set_list, gene_type):
+    annotated_df = annotation_manager.add_annotations(gene_set_list, gene_type)
+
+    pd.testing.assert_frame_equal(annotated_df.reset_index(drop=True), left_merge(annotation_manager, gene_set_list, gene_type))
+
+
+@pytest.mark.parametrize("gene_set_list, gene_type", [(WORMBASE_GENES, "Wormbase.ID"), (SEQUENCE_GENES, "Sequence.ID")])
+def test_segments_match_left_merge(annotation_manager, gene_set_list, gene_type):
+    genes_matched_df, genes_not_matched_df = annotation_manager.segment_genes_by_annotation_match(gene_set_list, gene_type)
+    expected_matched_df, expected_not_matched_df = left_merge_segments(annotation_manager, gene_set_list, gene_type)
+
+    pd.testing.assert_frame_equal(genes_matched_df.reset_index(drop=True), expected_matched_df.reset_index(drop=True))
+    pd.testing.assert_frame_equal(genes_not_matched_df.reset_index(drop=True), expected_not_matched_df.reset_index(drop=True))
+
+
+def test_lookup_rows(tmp_path):
+    annotation_manager = AnnotationsManager(write_annotations(tmp_path, ANNOTATION_ROWS), use_cache=False)
+
+    gene_ids, rows = annotation_manager._lookup_annotation_rows(WORMBASE_GENES, "Wormbase.ID")
+    # Every row of a gene on several rows, in file order; unknown genes at -1 in gene set order
+    assert rows.tolist() == [6, -1, 1, 2, 4, 0, 1, 2, 5, -1, -1, 3]
+    assert gene_ids.tolist() == ["WBGene00000006", "WBGene00000099", "WBGene00000002", "WBGene00000002", "WBGene00000004",
+                                 "WBGene00000001", "WBGene00000002", "WBGene00000002", "WBGene00000005", "WBGene00000098",
+                                 "WBGene00000099", "WBGene00000003"]
+
+    # The rows are kept as the index of the annotated gene set
+    annotated_df = annotation_manager.add_annotations(WORMBASE_GENES, "Wormbase.ID")
+    assert annotated_df.index.tolist() == rows.tolist()
+    assert annotated_df.loc[annotated_df.index < 0, "Category.1"].isna().all()
+
+
+def test_compact_lookup_matches_full(tmp_path):
+    annotation_file_path = write_annotations(tmp_path, ANNOTATION_ROWS)
+    full_manager = AnnotationsManager(annotation_file_path, use_cache=False)
+    compact_manager = AnnotationsManager(annotation_file_path, use_cache=False, compact=True)
+
+    for full_df, compact_df in zip(full_manager.segment_genes_by_annotation_match(WORMBASE_GENES, "Wormbase.ID"),
+                                   compact_manager.segment_genes_by_annotation_match(WORMBASE_GENES, "Wormbase.ID")):
+        pd.testing.assert_frame_equal(compact_df, full_df[compact_df.columns], check_dtype=False)
+
+
+def test_unknown_gene_type(tmp_path):
+    annotation_manager = AnnotationsManager(write_annotations(tmp_path, ANNOTATION_ROWS), use_cache=False)
+
+    with pytest.raises(ValueError, match="Gene.Name"):
+        annotation_manager.add_annotations(WORMBASE_GENES, "Gene.Name")
+    with pytest.raises(ValueError, match="Gene.Name"):
+        annotation_manager.segment_genes_by_annotation_match(WORMBASE_GENES, "Gene.Name")
@@ -0,0 +1,79 @@
+"""
+AnnotationsRegistry sharing, reloading on file changes and LRU eviction
+"""
+import os
+import pandas as pd
+import pytest
+from wormcat3.annotations_manger import AnnotationsRegistry
+
+ANNOTATION_COLUMNS = ["Sequence ID", "Wormbase ID", "Category 1", "Category 2", "Category 3"]
+
+
+def write_annotations(annotation_file_path, n_genes):
+    rows = [(f"Y1.{i}", f"WBGene{i:08d}", "Metabolism", "Metabolism: lipid", "Metabolism: lipid: sterol") for i in range(1, n_genes + 1)]
+    pd.DataFrame(rows, columns=ANNOTATION_COLUMNS).to_csv(annotation_file_path, index=False)
+    return str(annotation_file_path)
+
+
+@pytest.fixture
+def annotation_file_path(tmp_path):
+    return write_annotations(tmp_path / "annotations.csv", 5)
+
+
+def test_same_file_and_flag_share_a_manager(annotation_file_path):
+    registry = AnnotationsRegistry()
+
+    annotation_manager = registry.get(annotation_file_path)
+    assert registry.get(annotation_file_path) is annotation_manager
+    # The same file reached through another path is the same file
+    assert registry.get(os.path.join(os.path.dirname(annotation_file_path), ".", "annotations.csv")) is annotation_manager
+
+    compact_manager = registry.get(annotation_file_path, compact=True)
+    assert compact_manager is not annotation_manager
+    assert compact_manager.compact
+    assert registry.get(annotation_file_path, compact=True) is compact_manager
+    assert len(registry) == 2
+
+
+def test_changed_mtime_reloads(annotation_file_path):
+    registry = AnnotationsRegistry()
+    annotation_manager = registry.get(annotation_file_path)
+
+    stat = os.stat(annotation_file_path)
+    os.utime(annotation_file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert registry.get(annotation_file_path) is not annotation_manager
+
+
+def test_changed_size_reloads(annotation_file_path):
+    registry = AnnotationsRegistry()
+    annotation_manager = registry.get(annotation_file_path)
+    stat = os.stat(annotation_file_path)
+
+    write_annotations(annotation_file_path, 7)
+    # Keep the modification time, so only the size tells the versions apart
+    os.utime(annotation_file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    reloaded_manager = registry.get(annotation_file_path)
+    assert reloaded_manager is not annotation_manager
+    assert len(reloaded_manager.annotations_df) == 7
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    registry = AnnotationsRegistry(max_size=2)
+    first_path, second_path, third_path = (write_annotations(tmp_path / f"annotations_{i}.csv", 5) for i in range(3))
+
+    first_manager = registry.get(first_path)
+    second_manager = registry.get(second_path)
+    assert registry.get(first_path) is first_manager  # The second file is now the least recently used
+
+    registry.get(third_path)
+    assert len(registry) == 2
+    assert registry.get(first_path) is first_manager
+    assert registry.get(second_path) is not second_manager
+
+
+def test_invalid_registry():
+    with pytest.raises(ValueError, match="max_size"):
+        AnnotationsRegistry(max_size=0)
+    with pytest.raises(FileNotFoundError):
+        AnnotationsRegistry().get("/no/such/annotations.csv")
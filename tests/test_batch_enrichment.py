@@ -0,0 +1,88 @@
+"""
+The batch enrichment test against the single gene set test, category by category
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.stats.multitest import multipletests
+from wormcat3.annotations_manger import AnnotationsManager
+from wormcat3.constants import PAdjustMethod
+from wormcat3.output_sink import NullSink
+from wormcat3.statistical_analysis import EnrichmentAnalyzer
+
+N_GENES = 600
+
+
+@pytest.fixture(scope="module")
+def annotation_manager(tmp_path_factory):
+    """ Random three-level annotations; some genes are on two rows and some are Unassigned. """
+    rng = np.random.default_rng(8)
+    gene_ids = [f"WBGene{i:08d}" for i in range(1, N_GENES + 1)]
+    rows = []
+    for gene_id in gene_ids + list(rng.choice(gene_ids, size=60, replace=False)):
+        cat1 = f"Cat{rng.integers(1, 6)}"
+        cat2 = f"{cat1}: sub{rng.integers(1, 4)}"
+        cat3 = f"{cat2}: leaf{rng.integers(1, 4)}" if rng.random() < 0.8 else cat2
+        rows.append((gene_id.replace("WBGene", "Y"), gene_id, cat1, cat2, cat3))
+    rows += [(f"Z{i}", f"WBGene{N_GENES + i:08d}", "Unassigned", "Unassigned", "Unassigned") for i in range(1, 21)]
+
+    annotation_file_path = tmp_path_factory.mktemp("annotations") / "random_annotations.csv"
+    pd.DataFrame(rows, columns=["Sequence ID", "Wormbase ID", "Category 1", "Category 2", "Category 3"]).to_csv(annotation_file_path, index=False)
+    return AnnotationsManager(str(annotation_file_path), use_cache=False)
+
+
+@pytest.fixture(scope="module")
+def gene_sets(annotation_manager):
+    """ Gene sets enriched for different categories, one of them tiny. """
+    rng = np.random.default_rng(80)
+    annotations_df = annotation_manager.annotations_df
+    gene_lists = {
+        "random": list(rng.choice(annotations_df["Wormbase.ID"].unique(), size=150, replace=False)),
+        "cat1": annotations_df.loc[annotations_df["Category.1"] == "Cat1", "Wormbase.ID"].unique().tolist()[:80],
+        "cat2_sub2": annotations_df.loc[annotations_df["Category.2"] == "Cat2: sub2", "Wormbase.ID"].unique().tolist(),
+        "tiny": annotations_df["Wormbase.ID"].unique().tolist()[:3],
+    }
+    return {name: annotation_manager.segment_genes_by_annotation_match(gene_list, "Wormbase.ID")[0] for name, gene_list in gene_lists.items()}
+
+
+def new_analyzer(annotation_manager):
+    return EnrichmentAnalyzer(None, ".", "test", background_profile=annotation_manager.get_background_profile(), output_sink=NullSink())
+
+
+@pytest.mark.parametrize("p_adjust_method, padj_col", [(PAdjustMethod.BONFERRONI, "Bonferroni"), (PAdjustMethod.FDR, "FDR")])
+@pytest.mark.parametrize("p_adjust_threshold", [0.05, 1.0])
+def test_batch_matches_single_test(annotation_manager, gene_sets, p_adjust_method, padj_col, p_adjust_threshold):
+    batch_df = new_analyzer(annotation_manager).perform_batch_enrichment_test(gene_sets, p_adjust_method=p_adjust_method,
+                                                                              p_adjust_threshold=p_adjust_threshold)
+    columns = ["Category", "RGS", "AC", "PValue", padj_col]
+
+    n_rows = 0
+    for name, gene_set_df in gene_sets.items():
+        test_results = new_analyzer(annotation_manager).perform_enrichment_test(gene_set_df, p_adjust_method=p_adjust_method,
+                                                                               p_adjust_threshold=p_adjust_threshold)
+        for category, test_result in zip([1, 2, 3], test_results):
+            single_df = next(iter(test_result.values())) if isinstance(test_result, dict) else test_result.assign(**{padj_col: []})
+            single_df = single_df[columns].sort_values(["PValue", "Category"], kind="stable", ignore_index=True)
+            set_df = batch_df[(batch_df["Gene Set"] == name) & (batch_df["Category Level"] == category)][columns].reset_index(drop=True)
+
+            pd.testing.assert_frame_equal(set_df.astype({"RGS": int, "AC": int}), single_df.astype({"RGS": int, "AC": int}),
+                                          check_dtype=False, rtol=1e-12)
+            n_rows += len(set_df)
+
+    assert n_rows == len(batch_df)
+    if p_adjust_threshold == 1.0:
+        assert n_rows > 0
+
+
+@pytest.mark.parametrize("method", ["bonferroni", "fdr_bh"])
+def test_grouped_adjustment_matches_multipletests(method):
+    rng = np.random.default_rng(81)
+    pvalues = rng.choice(np.r_[rng.random(50) ** 3, 1.0, 0.5, 0.5], size=300)  # Ties and p-values of 1
+    groups = rng.integers(0, 7, size=300)
+
+    adjusted = EnrichmentAnalyzer._adjust_pvalues_grouped(pvalues, groups, method=method)
+    for group in np.unique(groups):
+        in_group = groups == group
+        np.testing.assert_allclose(adjusted[in_group], multipletests(pvalues[in_group], method=method)[1], rtol=1e-12)
+
+    assert len(EnrichmentAnalyzer._adjust_pvalues_grouped([], np.array([], dtype=int), method=method)) == 0
@@ -0,0 +1,57 @@
+"""
+BatchManifest run directory clean-up and unreadable manifests
+"""
+import pytest
+from wormcat3.batch_manifest import BatchManifest
+
+
+def record_run(manifest, gene_set_nm, run_number):
+    run_dir_path = manifest.batch_dir_path / f"{gene_set_nm}_{run_number}"
+    run_dir_path.mkdir()
+    fisher_result_path = run_dir_path / f"category_1_fisher_{gene_set_nm}_{run_number}.csv"
+    fisher_result_path.write_text("Category,RGS,AC,PValue\n")
+    manifest.record(gene_set_nm, BatchManifest.gene_set_hash([gene_set_nm]), "annotations", {}, run_number,
+                    run_dir_path, {1: fisher_result_path})
+    return run_dir_path
+
+
+def test_discard_removes_run_dir(tmp_path):
+    manifest = BatchManifest(tmp_path)
+    run_dir_path = record_run(manifest, "neurons", "00001")
+    kept_run_dir_path = record_run(manifest, "muscle", "00002")
+
+    manifest.discard("neurons")
+    manifest.discard("intestine")
+    assert not run_dir_path.exists()
+    assert kept_run_dir_path.exists()
+    assert list(BatchManifest(tmp_path).entries) == ["muscle"]
+
+
+def test_retain_removes_dropped_run_dirs(tmp_path):
+    manifest = BatchManifest(tmp_path)
+    run_dir_path = record_run(manifest, "neurons", "00001")
+    kept_run_dir_path = record_run(manifest, "muscle", "00002")
+
+    manifest.retain({"muscle"})
+    assert not run_dir_path.exists()
+    assert kept_run_dir_path.exists()
+    assert list(BatchManifest(tmp_path).entries) == ["muscle"]
+
+
+def test_run_dir_outside_batch_dir_is_kept(tmp_path):
+    outside_dir_path = tmp_path / "outside_00001"
+    outside_dir_path.mkdir()
+    manifest = BatchManifest(tmp_path / "batch")
+    manifest.batch_dir_path.mkdir()
+    manifest.entries["neurons"] = {'run_dir_path': "../outside_00001"}
+
+    manifest.discard("neurons")
+    assert outside_dir_path.exists()
+
+
+def test_unreadable_manifest_warns(tmp_path):
+    (tmp_path / BatchManifest.MANIFEST_FILE_NM).write_text("{not json")
+
+    with pytest.warns(RuntimeWarning, match="Batch manifest ignored"):
+        manifest = BatchManifest(tmp_path)
+    assert manifest.entries == {}
@@ -0,0 +1,59 @@
+"""
+The vectorized one-sided Fisher's exact test against scipy.stats.fisher_exact
+"""
+import numpy as np
+import pytest
+from scipy.stats import fisher_exact
+from wormcat3.statistical_analysis import EnrichmentAnalyzer
+
+# (genes_in_both, gene_set_size, category_size, background_size)
+EDGE_CASE_TABLES = [
+    (12, 40, 12, 1000),     # RGS equal to AC
+    (1, 40, 25, 1000),      # RGS of 1
+    (1, 1, 1, 1000),        # A single gene in a single-gene category
+    (0, 40, 25, 1000),      # No overlap
+    (25, 1000, 25, 1000),   # Gene set the size of the background
+    (7, 1000, 7, 1000),     # Gene set the size of the background, RGS equal to AC
+    (40, 40, 1000, 1000),   # Category the size of the background
+    (40, 40, 40, 1000),     # Gene set and category are the same genes
+    (3, 500, 6, 1000),
+]
+
+
+def fisher_exact_pvalues(tables):
+    """ p-values of scipy's fisher_exact on the contingency tables the test was written against. """
+    return np.array([
+        fisher_exact(EnrichmentAnalyzer._create_contingency(*map(int, table)), alternative="greater")[1]
+        for table in tables
+    ])
+
+
+@pytest.mark.parametrize("table", EDGE_CASE_TABLES)
+def test_edge_cases_match_fisher_exact(table):
+    genes_in_both, gene_set_size, category_size, background_size = table
+    pvalues = EnrichmentAnalyzer._fisher_exact_greater(np.array([genes_in_both]), gene_set_size, np.array([category_size]), background_size)
+    assert pvalues[0] == pytest.approx(fisher_exact_pvalues([table])[0], rel=1e-12, abs=1e-300)
+
+
+def test_arrays_match_fisher_exact():
+    rng = np.random.default_rng(6)
+    background_size = 2000
+    category_size = rng.integers(1, 300, size=200)
+    gene_set_size = rng.integers(1, 500, size=200)
+    genes_in_both = rng.integers(0, np.minimum(category_size, gene_set_size) + 1)
+    tables = list(zip(genes_in_both, gene_set_size, category_size, [background_size] * 200))
+
+    pvalues = EnrichmentAnalyzer._fisher_exact_greater(genes_in_both, gene_set_size, category_size, background_size)
+    np.testing.assert_allclose(pvalues, fisher_exact_pvalues(tables), rtol=1e-12, atol=1e-300)
+
+
+def test_edge_cases_in_one_call():
+    tables = np.array(EDGE_CASE_TABLES)
+    pvalues = EnrichmentAnalyzer._fisher_exact_greater(tables[:, 0], tables[:, 1], tables[:, 2], 1000)
+    np.testing.assert_allclose(pvalues, fisher_exact_pvalues(EDGE_CASE_TABLES), rtol=1e-12, atol=1e-300)
+
+
+def test_missing_counts_give_nan():
+    pvalues = EnrichmentAnalyzer._fisher_exact_greater(np.array([3.0, 2.0]), 40, np.array([np.nan, 10.0]), 1000)
+    assert np.isnan(pvalues[0])
+    assert pvalues[1] == pytest.approx(fisher_exact_pvalues([(2, 40, 10, 1000)])[0], rel=1e-12)
@@ -0,0 +1,85 @@
+"""
+GSEAAnalyzer result accessors after single and collection runs
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from wormcat3.constants import GSEAEngine
+from wormcat3.gsea_analyzer import GSEAAnalyzer
+
+GENES = [f"WBGene{i:08d}" for i in range(1, 1001)]
+
+# "Shared term" is in both collections, with different genes
+GENE_SET_COLLECTIONS = {
+    1: {"Top term": GENES[:40], "Scattered term": GENES[::25], "Shared term": GENES[100:140]},
+    2: {"Bottom term": GENES[-40:], "Shared term": GENES[500:540]},
+}
+
+
+@pytest.fixture
+def ranked_genes():
+    rng = np.random.default_rng(0)
+    ranks = np.sort(rng.normal(size=len(GENES)))[::-1]
+    return pd.DataFrame({"Gene": GENES, "Rank": ranks})
+
+
+def run_shared_null(ranked_genes, tmp_path):
+    gsea_analyzer = GSEAAnalyzer(str(tmp_path))
+    gsea_analyzer.run_category_gsea(ranked_genes, GENE_SET_COLLECTIONS, "test", engine=GSEAEngine.NATIVE,
+                                    shared_null=True, write_reports=False)
+    return gsea_analyzer
+
+
+def test_accessors_after_shared_null_run(ranked_genes, tmp_path):
+    gsea_analyzer = run_shared_null(ranked_genes, tmp_path)
+    assert gsea_analyzer.gsea_result is None
+
+    enriched_df = gsea_analyzer.get_enriched_terms(1.0)
+    assert list(enriched_df.columns[:2]) == ["Category Level", "Term"]
+    assert len(enriched_df) == 5
+    assert enriched_df["FDR"].is_monotonic_increasing
+    pd.testing.assert_frame_equal(gsea_analyzer.get_enriched_terms(1.0, collection=2),
+                                  gsea_analyzer.collection_gsea_results[2].enriched_terms(1.0))
+
+    lead_genes = gsea_analyzer.get_leading_edge_genes("Top term")
+    assert lead_genes == gsea_analyzer.collection_results[1].results["Top term"]["lead_genes"].split(";")
+    assert gsea_analyzer.get_leading_edge_genes("Shared term", collection=2)[0] in GENES[500:540]
+
+    leading_edges_df = gsea_analyzer.get_leading_edges(1.0)
+    assert list(leading_edges_df.columns) == ["Category Level", "Term", "Gene"]
+    assert set(leading_edges_df["Category Level"]) == {1, 2}
+    pd.testing.assert_frame_equal(gsea_analyzer.get_leading_edges(1.0, collection=1),
+                                  gsea_analyzer.collection_gsea_results[1].leading_edges(1.0))
+
+
+def test_collection_accessor_errors(ranked_genes, tmp_path):
+    gsea_analyzer = run_shared_null(ranked_genes, tmp_path)
+
+    with pytest.raises(ValueError, match="several collections"):
+        gsea_analyzer.get_leading_edge_genes("Shared term")
+    with pytest.raises(ValueError, match="not found"):
+        gsea_analyzer.get_leading_edge_genes("Missing term")
+    with pytest.raises(ValueError, match="Collection '3' not found"):
+        gsea_analyzer.get_enriched_terms(collection=3)
+
+
+def test_accessors_after_collections_run(ranked_genes, tmp_path):
+    gsea_analyzer = GSEAAnalyzer(str(tmp_path))
+    gsea_analyzer.run_preranked_gsea_collections(ranked_genes, GENE_SET_COLLECTIONS, permutation_num=200)
+
+    assert len(gsea_analyzer.get_enriched_terms(1.0)) == 5
+    assert gsea_analyzer.get_leading_edge_genes("Bottom term")
+    assert len(gsea_analyzer.get_term_overlap(1.0).terms_df) == 5
+
+
+def test_accessors_after_single_run(ranked_genes, tmp_path):
+    gsea_analyzer = GSEAAnalyzer(str(tmp_path))
+    with pytest.raises(ValueError, match="No GSEA analysis"):
+        gsea_analyzer.get_enriched_terms()
+
+    gsea_analyzer.run_preranked_gsea(ranked_genes, GENE_SET_COLLECTIONS[1], "single", engine=GSEAEngine.NATIVE,
+                                     permutation_num=200, write_reports=False)
+    assert list(gsea_analyzer.get_leading_edges(1.0).columns) == ["Term", "Gene"]
+    assert gsea_analyzer.get_leading_edge_genes("Shared term")[0] in GENES[100:140]
+    with pytest.raises(ValueError, match="collection applies"):
+        gsea_analyzer.get_enriched_terms(collection=1)
@@ -0,0 +1,43 @@
+"""
+Wormcat.gsea_batch on inputs with and without DESeq2 tables
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from wormcat3 import Wormcat
+from wormcat3.constants import GSEAEngine
+
+GENES = [f"WBGene{i:08d}" for i in range(1, 401)]
+
+
+@pytest.fixture
+def wormcat(tmp_path):
+    categories = [(f"Cat{i % 4}", f"Cat{i % 4}: sub{i % 8}", f"Cat{i % 4}: sub{i % 8}") for i in range(len(GENES))]
+    annotations_df = pd.DataFrame([(gene_id.replace("WBGene", "Y"), gene_id, *category) for gene_id, category in zip(GENES, categories)],
+                                  columns=["Sequence ID", "Wormbase ID", "Category 1", "Category 2", "Category 3"])
+    annotation_file_path = tmp_path / "annotations.csv"
+    annotations_df.to_csv(annotation_file_path, index=False)
+    return Wormcat(working_dir_path=str(tmp_path / "out"), annotation_file_name=str(annotation_file_path))
+
+
+def test_no_deseq2_tables_gives_empty_summary(wormcat, tmp_path):
+    empty_dir_path = tmp_path / "empty"
+    empty_dir_path.mkdir()
+
+    summary_df = wormcat.gsea_batch(str(empty_dir_path), gsea_engine=GSEAEngine.NATIVE)
+    assert isinstance(summary_df, pd.DataFrame)
+    assert summary_df.empty
+    assert list(summary_df.columns) == ["Category Level", "Term"]
+
+
+def test_summary_of_contrasts(wormcat, tmp_path):
+    input_dir_path = tmp_path / "contrasts"
+    input_dir_path.mkdir()
+    rng = np.random.default_rng(14)
+    for contrast in ["A", "B"]:
+        pd.DataFrame({"ID": GENES, "log2FoldChange": rng.normal(size=len(GENES)), "pvalue": rng.uniform(size=len(GENES))}) \
+            .to_csv(input_dir_path / f"{contrast}.csv", index=False)
+
+    summary_df = wormcat.gsea_batch(str(input_dir_path), gsea_engine=GSEAEngine.NATIVE, shared_null=True, permutation_num=50, max_workers=1)
+    assert list(summary_df.columns) == ["Category Level", "Term", "A NES", "A FDR", "B NES", "B FDR"]
+    assert set(summary_df["Category Level"]) == {1, 2, 3}
@@ -0,0 +1,106 @@
+"""
+NativePrerank enrichment scores, shared-null collections and adaptive permutations
+"""
+import gseapy as gp
+import numpy as np
+import pandas as pd
+import pytest
+from wormcat3.constants import GSEAEngine
+from wormcat3.gsea_analyzer import GSEAAnalyzer
+from wormcat3.gsea_engine import NativePrerank
+
+GENES = [f"WBGene{i:08d}" for i in range(1, 1001)]
+
+# "Top term" sits at the top of the list, "Scattered term" is spread evenly over it
+GENE_SETS = {"Top term": GENES[:40], "Scattered term": GENES[::25]}
+
+# Gene sets at the top, middle and bottom of the list, mixed, and with genes missing from the list;
+# none is spaced so regularly that its running sum peaks at several hits with the same score
+SCORING_GENE_SETS = {
+    "Top term": GENES[:20] + GENES[600:610],
+    "Middle term": GENES[430:470],
+    "Bottom term": GENES[-25:],
+    "Scattered term": list(np.random.default_rng(3).choice(GENES, size=40, replace=False)),
+    "Partly listed term": GENES[300:320] + [f"WBGene{i:08d}" for i in range(5001, 5011)],
+}
+
+
+@pytest.fixture
+def ranked_genes():
+    rng = np.random.default_rng(0)
+    ranks = np.sort(rng.normal(size=len(GENES)))[::-1]
+    return pd.DataFrame({"Gene": GENES, "Rank": ranks})
+
+
+def hand_computed_es(ranked_genes, genes, weight):
+    """ The larger deviation from zero, up or down, of the weighted running sum over the whole ranked list. """
+    in_set = ranked_genes["Gene"].isin(genes).to_numpy()
+    weights = np.abs(ranked_genes["Rank"].to_numpy()) ** weight
+    steps = np.where(in_set, weights * in_set / (weights * in_set).sum(), -1.0 / (~in_set).sum())
+    running_sum = np.cumsum(steps)
+    return running_sum.max() if abs(running_sum.max()) > abs(running_sum.min()) else running_sum.min()
+
+
+@pytest.mark.parametrize("weight", [0, 1.0, 1.5])
+def test_enrichment_scores_match_gseapy(ranked_genes, weight):
+    prerank = NativePrerank(permutation_num=0, weight=weight).run(ranked_genes, SCORING_GENE_SETS)
+    gseapy_results = gp.prerank(rnk=ranked_genes, gene_sets=SCORING_GENE_SETS, outdir=None, no_plot=True, permutation_num=0,
+                                weight=weight, seed=1, threads=1, verbose=False).results
+
+    assert set(prerank.results) == set(gseapy_results)
+    for term, results in prerank.results.items():
+        assert results["es"] == pytest.approx(gseapy_results[term]["es"], abs=1e-12)
+        assert results["es"] == pytest.approx(hand_computed_es(ranked_genes, SCORING_GENE_SETS[term], weight), abs=1e-12)
+        assert results["lead_genes"] == gseapy_results[term]["lead_genes"]
+        assert results["tag %"] == gseapy_results[term]["tag %"]
+        assert results["gene %"] == gseapy_results[term]["gene %"]
+        assert list(results["hits"]) == list(gseapy_results[term]["hits"])
+        np.testing.assert_allclose(prerank.running_enrichment_score(term), gseapy_results[term]["RES"], atol=1e-12)
+
+
+def test_shared_null_matches_separate_runs(ranked_genes):
+    gene_set_collections = {1: dict(list(SCORING_GENE_SETS.items())[:3]), 2: dict(list(SCORING_GENE_SETS.items())[3:])}
+    prerank = NativePrerank(permutation_num=300, seed=7, batch_size=64)
+
+    collection_results = prerank.run_collections(ranked_genes, gene_set_collections)
+    for key, gene_sets in gene_set_collections.items():
+        separate_results = NativePrerank(permutation_num=300, seed=7, batch_size=64).run(ranked_genes, gene_sets)
+        pd.testing.assert_frame_equal(collection_results[key].res2d, separate_results.res2d)
+
+    with pytest.raises(ValueError, match="collection 3"):
+        prerank.run_collections(ranked_genes, {**gene_set_collections, 3: {"Tiny term": GENES[:2]}})
+
+
+def test_adaptive_permutations_within_bounds(ranked_genes):
+    prerank = NativePrerank(permutation_num=200, adaptive=True, max_permutation_num=1000).run(ranked_genes, GENE_SETS)
+
+    permutations = {term: results["permutations"] for term, results in prerank.results.items()}
+    assert all(prerank.batch_size <= n <= 1000 for n in permutations.values())
+    # The enriched term never sees a permuted score as extreme, so it runs to the cap, past permutation_num
+    assert permutations["Top term"] == 1000
+    assert permutations["Scattered term"] < 200
+    assert prerank.results["Top term"]["pval"] < 1 / 200
+
+
+def test_adaptive_cap_defaults_to_ten_times_permutation_num(ranked_genes):
+    prerank = NativePrerank(permutation_num=100, adaptive=True).run(ranked_genes, GENE_SETS)
+
+    assert prerank.max_permutation_num == 1000
+    assert prerank.results["Top term"]["permutations"] == 1000
+    with pytest.raises(AssertionError, match="max_permutation_num"):
+        NativePrerank(permutation_num=100, adaptive=True, max_permutation_num=50)
+
+
+def test_entry_points_pass_permutation_counts(ranked_genes, tmp_path):
+    gsea_analyzer = GSEAAnalyzer(str(tmp_path), use_cache=True)
+    gsea_analyzer.result_cache.cache_dir_path = tmp_path / "cache"
+
+    category_results = gsea_analyzer.run_category_gsea(ranked_genes, {1: GENE_SETS}, "test", engine=GSEAEngine.NATIVE, shared_null=True,
+                                                       permutation_num=100, adaptive=True, max_permutation_num=300)
+    assert category_results[1].set_index("Term").loc["Top term", "Permutations"] == 300
+
+    # A different cap is a different cache entry
+    category_results = gsea_analyzer.run_category_gsea(ranked_genes, {1: GENE_SETS}, "test", engine=GSEAEngine.NATIVE, shared_null=True,
+                                                       permutation_num=100, adaptive=True, max_permutation_num=500)
+    assert category_results[1].set_index("Term").loc["Top term", "Permutations"] == 500
+    assert gsea_analyzer.result_cache.stats()["misses"] == 2
@@ -0,0 +1,84 @@
+"""
+Enrichment counts for annotation files that list a gene on several rows
+"""
+import pandas as pd
+import pytest
+from wormcat3.annotations_manger import AnnotationsManager
+from wormcat3.output_sink import NullSink
+from wormcat3.statistical_analysis import EnrichmentAnalyzer
+
+# WBGene00000003 is annotated on three rows, WBGene00000005 on two, each with different categories
+ANNOTATION_ROWS = [
+    ("Y1.1", "WBGene00000001", "Metabolism", "Metabolism: lipid", "Metabolism: lipid: fatty acid"),
+    ("Y1.2", "WBGene00000002", "Metabolism", "Metabolism: lipid", "Metabolism: lipid: sterol"),
+    ("Y1.3", "WBGene00000003", "Metabolism", "Metabolism: lipid", "Metabolism: lipid: fatty acid"),
+    ("Y1.3", "WBGene00000003", "Signaling", "Signaling: lipid", "Signaling: lipid"),
+    ("Y1.3", "WBGene00000003", "Stress response", "Stress response: pathogen", "Stress response: pathogen"),
+    ("Y1.4", "WBGene00000004", "Signaling", "Signaling: lipid", "Signaling: lipid"),
+    ("Y1.5", "WBGene00000005", "Neuronal function", "Neuronal function: synaptic", "Neuronal function: synaptic"),
+    ("Y1.5", "WBGene00000005", "Stress response", "Stress response: heat", "Stress response: heat"),
+    ("Y1.6", "WBGene00000006", "Stress response", "Stress response: heat", "Stress response: heat"),
+    ("Y1.7", "WBGene00000007", "Unassigned", "Unassigned", "Unassigned"),
+    ("Y1.8", "WBGene00000008", "Unassigned", "Unassigned", "Unassigned"),
+]
+GENE_SET = ["WBGene00000003", "WBGene00000005", "WBGene00000006", "WBGene00000001"]
+BACKGROUND = ["WBGene00000001", "WBGene00000003", "WBGene00000004", "WBGene00000005", "WBGene00000006", "WBGene00000008"]
+
+
+@pytest.fixture
+def annotation_file_path(tmp_path):
+    annotations_df = pd.DataFrame(ANNOTATION_ROWS, columns=["Sequence ID", "Wormbase ID", "Category 1", "Category 2", "Category 3"])
+    annotation_file_path = tmp_path / "multi_row_annotations.csv"
+    annotations_df.to_csv(annotation_file_path, index=False)
+    return str(annotation_file_path)
+
+
+def expected_counts(gene_ids, category):
+    """ Rows per term over every annotation row of the genes, as a groupby over the annotation file gives them. """
+    annotations_df = pd.DataFrame(ANNOTATION_ROWS, columns=["Sequence.ID", "Wormbase.ID", "Category.1", "Category.2", "Category.3"])
+    rows_df = annotations_df[annotations_df["Wormbase.ID"].isin(gene_ids)]
+    return rows_df.groupby(f"Category.{category}").size().sort_index()
+
+
+def fisher_counts(analyzer, category, column):
+    return analyzer.fisher_results[category].set_index("Category")[column].astype(int).sort_index()
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("category", [1, 2, 3])
+def test_counts_every_row_of_multi_row_genes(annotation_file_path, compact, category):
+    annotation_manager = AnnotationsManager(annotation_file_path, use_cache=False, compact=compact)
+    gene_set_df, _ = annotation_manager.segment_genes_by_annotation_match(GENE_SET, "Wormbase.ID")
+
+    analyzer = EnrichmentAnalyzer(None, ".", "test", background_profile=annotation_manager.get_background_profile(), output_sink=NullSink())
+    analyzer.perform_enrichment_test(gene_set_df)
+
+    rgs = expected_counts(GENE_SET, category)
+    pd.testing.assert_series_equal(fisher_counts(analyzer, category, "RGS"), rgs, check_names=False)
+    pd.testing.assert_series_equal(fisher_counts(analyzer, category, "AC"), expected_counts(annotation_manager.annotations_df["Wormbase.ID"], category).loc[rgs.index], check_names=False)
+
+
+@pytest.mark.parametrize("category", [1, 2, 3])
+def test_background_list_counts_every_row(annotation_file_path, category):
+    annotation_manager = AnnotationsManager(annotation_file_path, use_cache=False)
+    gene_set_df, _ = annotation_manager.segment_genes_by_annotation_match(GENE_SET, "Wormbase.ID")
+    background_profile = annotation_manager.get_background_profile(BACKGROUND)
+
+    counts = background_profile.category_counts(category).astype(int).sort_index()
+    pd.testing.assert_series_equal(counts, expected_counts(BACKGROUND, category), check_names=False)
+
+    # Frames without annotation rows in their index are matched on gene ID and categories
+    analyzer = EnrichmentAnalyzer(None, ".", "test", background_profile=background_profile, output_sink=NullSink())
+    analyzer.perform_enrichment_test(gene_set_df.reset_index(drop=True))
+    pd.testing.assert_series_equal(fisher_counts(analyzer, category, "RGS"), expected_counts(GENE_SET, category), check_names=False)
+
+
+def test_batch_counts_match_single_test(annotation_file_path):
+    annotation_manager = AnnotationsManager(annotation_file_path, use_cache=False)
+    gene_set_df, _ = annotation_manager.segment_genes_by_annotation_match(GENE_SET, "Wormbase.ID")
+    analyzer = EnrichmentAnalyzer(None, ".", "test", background_profile=annotation_manager.get_background_profile(), output_sink=NullSink())
+
+    counts = analyzer._get_term_counts(gene_set_df)
+    batch_counts = analyzer._get_incidence_matrix().term_counts(analyzer._get_incidence_matrix().row_counts_matrix([gene_set_df, gene_set_df]))
+    assert (batch_counts.toarray()[:, 0] == counts).all()
+    assert (batch_counts.toarray()[:, 1] == counts).all()
@@ -0,0 +1,79 @@
+"""
+Tie-breaking of ranks in create_ranked_list against the loop it replaced
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from wormcat3.gsea_analyzer import GSEAAnalyzer
+
+
+def make_ranks_unique_loop(ranked_list):
+    """ The previous, loop based implementation of GSEAAnalyzer._make_ranks_unique. """
+    duplicate_ranks = ranked_list['Rank'].duplicated(keep=False)
+    if duplicate_ranks.sum() > 0:
+        ranked_list['original_order'] = range(len(ranked_list))
+        for rank, group in ranked_list[duplicate_ranks].groupby('Rank'):
+            idx = ranked_list['Rank'].unique().tolist().index(rank)
+            if idx < len(ranked_list['Rank'].unique()) - 1:
+                next_smaller_rank = sorted(ranked_list['Rank'].unique(), reverse=True)[idx + 1]
+                epsilon = abs(rank - next_smaller_rank) / (len(group) * 2)
+            else:
+                epsilon = abs(rank) / 1000000 if rank != 0 else 0.0000001
+            for i, (idx, row) in enumerate(group.iterrows()):
+                adjustment = epsilon * (i + 1) / (len(group) + 1)
+                ranked_list.at[idx, 'Rank'] = rank - adjustment
+        ranked_list = ranked_list.sort_values(by='Rank', ascending=False)
+        ranked_list = ranked_list.drop('original_order', axis=1)
+    return ranked_list
+
+
+def sorted_ranked_list(ranks):
+    ranked_list = pd.DataFrame({'Gene': [f"WBGene{i:08d}" for i in range(len(ranks))], 'Rank': np.asarray(ranks, dtype=float)})
+    return ranked_list.sort_values(by='Rank', ascending=False)
+
+
+def simulated_ranks(n_genes, seed):
+    """ Ranks as create_ranked_list computes them from DESeq2 p-values reported to 4 decimals, 10% of them 1. """
+    rng = np.random.default_rng(seed)
+    pvalue = rng.uniform(0, 1, n_genes) ** 2
+    pvalue[rng.random(n_genes) < 0.1] = 1.0
+    return np.sign(rng.normal(0, 1, n_genes)) * -np.log10(np.maximum(pvalue.round(4), 0.0001))
+
+
+RANK_CASES = {
+    "tied group at the bottom": [5.0, 3.0, 2.0, -1.5, -1.5, -1.5],
+    "tied zeros at the bottom": [2.0, 1.0, 0.0, 0.0, 0.0],
+    "tied zeros of both signs": [2.0, 0.0, -0.0, 0.0, -1.0, -0.0, -3.0],
+    "adjacent tied groups": [4.0, 4.0, 3.0, 3.0, 3.0, 2.0, 2.0, 1.0, 1.0],
+    "one tied group": [1.0, 1.0, 1.0],
+    "no ties": [3.0, 2.0, 1.0],
+    "simulated DESeq2 ranks": simulated_ranks(3000, 13),
+}
+
+
+@pytest.mark.parametrize("ranks", RANK_CASES.values(), ids=RANK_CASES.keys())
+def test_matches_loop(ranks):
+    ranked_list = sorted_ranked_list(ranks)
+
+    unique_df = GSEAAnalyzer._make_ranks_unique(ranked_list.copy())
+    loop_df = make_ranks_unique_loop(ranked_list.copy())
+
+    assert unique_df['Gene'].tolist() == loop_df['Gene'].tolist()
+    assert np.array_equal(unique_df['Rank'].to_numpy(), loop_df['Rank'].to_numpy())
+    assert unique_df['Rank'].is_unique
+    # Ties are broken without moving any gene past a different rank
+    assert unique_df['Gene'].tolist() == ranked_list['Gene'].tolist()
+
+
+def test_create_ranked_list_has_unique_ranks():
+    deseq2_df = pd.DataFrame({
+        'ID': [f"WBGene{i:08d}" for i in range(8)],
+        'log2FoldChange': [1.2, -0.4, 0.0, 2.0, -1.0, 0.3, np.nan, -2.2],
+        'pvalue': [0.01, 0.01, 0.5, 0.001, 1.0, 1.0, 0.2, 0.001],
+    })
+
+    ranked_list = GSEAAnalyzer.create_ranked_list(deseq2_df)
+    assert ranked_list['Rank'].is_unique
+    assert ranked_list['Rank'].is_monotonic_decreasing
+    assert ranked_list['Gene'].tolist()[:2] == ["WBGene00000003", "WBGene00000000"]
+    assert ranked_list['Gene'].tolist()[-1] == "WBGene00000007"
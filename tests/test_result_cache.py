@@ -0,0 +1,26 @@
+"""
+ResultCache failures are warnings, not errors
+"""
+import pandas as pd
+import pytest
+from wormcat3.result_cache import ResultCache
+
+
+def test_unreadable_entry_warns_and_misses(tmp_path):
+    result_cache = ResultCache("test", cache_dir_path=tmp_path)
+    key = ResultCache.make_key("test", 1)
+    assert result_cache.put(key, {"results": pd.DataFrame({"PValue": [0.01]})})
+    result_cache._entry_file_path(key).write_bytes(b"not a pickle")
+
+    with pytest.warns(RuntimeWarning, match="Result cache entry ignored"):
+        assert result_cache.get(key) is None
+    assert result_cache.stats()["misses"] == 1
+
+
+def test_failed_write_warns(tmp_path):
+    # The cache directory can't be created where a file already is
+    (tmp_path / "test").write_text("")
+    result_cache = ResultCache("test", cache_dir_path=tmp_path)
+
+    with pytest.warns(RuntimeWarning, match="Result cache not written"):
+        assert not result_cache.put(ResultCache.make_key("test", 1), {"results": pd.DataFrame()})
@@ -0,0 +1,127 @@
+"""
+The summary spreadsheet pivoted in one step against the per-file merge it replaced
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from wormcat3.annotations_manger import AnnotationsManager
+from wormcat3.wormcat_excel import WormcatExcel
+
+ANNOTATION_ROWS = [
+    ("Y1.1", "WBGene00000001", "Metabolism", "Metabolism: lipid", "Metabolism: lipid: sterol"),
+    ("Y1.2", "WBGene00000002", "Metabolism", "Metabolism: lipid", "Metabolism: lipid: fatty acid"),
+    ("Y1.3", "WBGene00000003", "Signaling", "Signaling: lipid", "Signaling: lipid"),
+    ("Y1.4", "WBGene00000004", "Stress response", "Stress response: heat", "Stress response: heat"),
+    ("Y1.5", "WBGene00000005", "Neuronal function", "Neuronal function: synaptic", "Neuronal function: synaptic"),
+    ("Y1.6", "WBGene00000006", "Unassigned", "Unassigned", "Unassigned"),
+]
+ANNOTATION_COLUMNS = ["Sequence ID", "Wormbase ID", "Category 1", "Category 2", "Category 3"]
+
+
+def fisher_table(rows):
+    return pd.DataFrame(rows, columns=["Category", "RGS", "AC", "PValue"])
+
+
+# Category 1 results of four runs, out of label order: not significant and missing p-values,
+# an RGS of 0, an empty table and a category that is not in the annotations
+FISHER_RESULTS = {
+    "run_b": {1: fisher_table([("Metabolism", 2, 2, 0.001), ("Signaling", 1, 1, 0.2)])},
+    "run_a": {1: fisher_table([("Signaling", 1, 1, 0.04), ("Stress response", 0, 1, np.nan), ("Unassigned", 1, 1, 0.05)])},
+    "run_c": {1: fisher_table([])},
+    "run_d": {1: fisher_table([("Metabolism", 1, 2, 0.01), ("Transcription", 3, 3, 0.0001)])},
+}
+
+
+@pytest.fixture
+def annotation_file_path(tmp_path):
+    annotation_file_path = tmp_path / "annotations.csv"
+    pd.DataFrame(ANNOTATION_ROWS, columns=ANNOTATION_COLUMNS).to_csv(annotation_file_path, index=False)
+    return str(annotation_file_path)
+
+
+def merge_per_file(wormcat_excel, category_sheet, fisher_results, category):
+    """ The summary _process_sheet used to build, one outer merge and row-wise apply per run. """
+    def significant(value):
+        if pd.isna(value):
+            return 'NV'
+        return value if value < wormcat_excel.significance_threshold else 'NS'
+
+    for label in sorted(fisher_results):
+        label_category = f"Category {category}"
+        label_pvalue = f"{label}_PValue"
+        label_rgs = f"{label}_RGS"
+        cat_results = fisher_results[label][category].copy()
+        cat_results.rename(columns={'Category': label_category, 'RGS': label_rgs, 'PValue': label_pvalue}, inplace=True)
+        cat_results.drop([col for col in ['Unnamed: 0', 'AC'] if col in cat_results.columns], axis=1, inplace=True)
+
+        category_sheet = pd.merge(category_sheet, cat_results, on=label_category, how='outer')
+        category_sheet[label_pvalue] = category_sheet[label_pvalue].apply(significant)
+        category_sheet[label_rgs] = category_sheet[label_rgs].apply(lambda x: x if pd.notna(x) and x > 0 else 0)
+    return category_sheet
+
+
+def with_absent_categories_filled(merged_sheet, category_sheet, category):
+    """
+    The one deliberate difference: a category missing from the annotations reads 0/NV for every run,
+    where the per-file merge left it blank for the runs merged before the first that reported it.
+    """
+    merged_sheet = merged_sheet.copy()
+    absent = ~merged_sheet[f"Category {category}"].isin(category_sheet[f"Category {category}"])
+    for col in merged_sheet.columns:
+        if col.endswith("_RGS"):
+            merged_sheet.loc[absent & merged_sheet[col].isna(), col] = 0
+        elif col.endswith("_PValue"):
+            merged_sheet.loc[absent & merged_sheet[col].isna(), col] = 'NV'
+    return merged_sheet
+
+
+def test_pivot_matches_per_file_merge(annotation_file_path):
+    wormcat_excel = WormcatExcel()
+    incidence_matrix = AnnotationsManager(annotation_file_path, use_cache=False).get_incidence_matrix()
+    category_sheet = wormcat_excel._create_category_summary(incidence_matrix, 1)
+
+    labels = sorted(FISHER_RESULTS)
+    results_df = pd.concat([wormcat_excel._read_category_results(pd.Series({'file': f"{label} Category 1", 'label': label,
+                                                                                  'data': FISHER_RESULTS[label][1]}))
+                            for label in labels], ignore_index=True)
+    summary_df = wormcat_excel._summarize_category_results(category_sheet, results_df, labels, 1)
+
+    merged_sheet = merge_per_file(wormcat_excel, category_sheet, FISHER_RESULTS, 1)
+    # Before the run that reported it, the per-file merge left the unannotated category blank
+    transcription = merged_sheet.set_index("Category 1").loc["Transcription"]
+    assert transcription[["run_a_PValue", "run_b_PValue", "run_c_PValue"]].isna().all()
+    assert transcription["run_d_PValue"] == 0.0001
+
+    expected_df = with_absent_categories_filled(merged_sheet, category_sheet, 1)
+    assert list(summary_df.columns) == list(expected_df.columns)
+    pd.testing.assert_frame_equal(summary_df.reset_index(drop=True), expected_df.reset_index(drop=True), check_dtype=False)
+    assert summary_df.set_index("Category 1").loc["Stress response", "run_a_PValue"] == 'NV'
+    assert summary_df.set_index("Category 1").loc["Unassigned", "run_a_PValue"] == 'NS'
+
+
+def test_results_read_from_files_match_results_in_memory(tmp_path):
+    wormcat_excel = WormcatExcel()
+    fisher_df = FISHER_RESULTS["run_a"][1]
+    # Category files are written with their index, read back as an "Unnamed: 0" column
+    file_path = tmp_path / "run_a_cat1.csv"
+    fisher_df.to_csv(file_path)
+
+    from_file_df = wormcat_excel._read_category_results(pd.Series({'file': str(file_path), 'label': "run_a"}))
+    in_memory_df = wormcat_excel._read_category_results(pd.Series({'file': "run_a Category 1", 'label': "run_a", 'data': fisher_df}))
+    pd.testing.assert_frame_equal(from_file_df, in_memory_df)
+    assert list(in_memory_df.columns) == ['label', 'Category', 'RGS', 'PValue']
+
+
+def test_written_summary_matches_per_file_merge(annotation_file_path, tmp_path):
+    wormcat_excel = WormcatExcel()
+    summary_file_path = tmp_path / "summary.xlsx"
+    wormcat_excel.create_summary_spreadsheet_from_results(FISHER_RESULTS, annotation_file_path, str(summary_file_path))
+
+    incidence_matrix = AnnotationsManager(annotation_file_path, use_cache=False).get_incidence_matrix()
+    category_sheet = wormcat_excel._create_category_summary(incidence_matrix, 1)
+    expected_df = with_absent_categories_filled(merge_per_file(wormcat_excel, category_sheet, FISHER_RESULTS, 1), category_sheet, 1)
+    # Compare the cells as they are written, through the same round trip
+    expected_file_path = tmp_path / "expected.xlsx"
+    expected_df.to_excel(expected_file_path, sheet_name="Cat1", index=False)
+
+    pd.testing.assert_frame_equal(pd.read_excel(summary_file_path, sheet_name="Cat1"), pd.read_excel(expected_file_path, sheet_name="Cat1"))
@@ -0,0 +1,76 @@
+"""
+TermOverlap on terms with and without shared genes, and with no terms at all
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from wormcat3.constants import GSEAEngine, OverlapMetric
+from wormcat3.gsea_analyzer import GSEAAnalyzer
+from wormcat3.term_overlap import TermOverlap
+
+PAIR_COLUMNS = ['Category Level A', 'Category B', 'Shared', 'Jaccard', 'Overlap']
+CLUSTER_COLUMNS = ['Category Level', 'Category', 'Genes', 'Cluster', 'Representative']
+
+
+def term_genes_df(rows):
+    return pd.DataFrame(rows, columns=['Category Level', 'Category', 'Gene'])
+
+
+def test_overlap_and_clusters():
+    term_overlap = TermOverlap(term_genes_df([
+        (2, 'Metabolism: lipid', 'g1'), (2, 'Metabolism: lipid', 'g2'), (2, 'Metabolism: lipid', 'g3'),
+        (3, 'Metabolism: lipid: sterol', 'g2'), (3, 'Metabolism: lipid: sterol', 'g3'),
+        (2, 'Signaling: lipid', 'g9'),
+    ]))
+
+    pairs_df = term_overlap.pairs()
+    assert len(pairs_df) == 1
+    assert pairs_df.loc[0, 'Shared'] == 2
+    assert pairs_df.loc[0, 'Jaccard'] == pytest.approx(2 / 3)
+    assert pairs_df.loc[0, 'Overlap'] == pytest.approx(1.0)
+
+    clusters_df = term_overlap.clusters(0.5)
+    assert clusters_df['Cluster'].tolist() == [1, 1, 2]
+    assert clusters_df['Representative'].tolist() == [True, False, True]
+    assert term_overlap.clusters(0.9, OverlapMetric.JACCARD)['Cluster'].nunique() == 3
+
+
+def test_no_terms():
+    term_overlap = TermOverlap(term_genes_df([]))
+
+    assert term_overlap.coefficients().shape == (0, 0)
+    pairs_df = term_overlap.pairs()
+    assert pairs_df.empty
+    assert [col for col in PAIR_COLUMNS if col not in pairs_df.columns] == []
+    clusters_df = term_overlap.clusters()
+    assert clusters_df.empty
+    assert list(clusters_df.columns) == CLUSTER_COLUMNS
+
+
+def test_no_enriched_terms():
+    annotated_df = pd.DataFrame({
+        'Wormbase.ID': ['g1', 'g2'],
+        'Category.1': ['Metabolism', 'Signaling'],
+        'Category.2': ['Metabolism: lipid', 'Signaling: lipid'],
+        'Category.3': ['Metabolism: lipid', 'Signaling: lipid'],
+    })
+    empty_result = pd.DataFrame(columns=['Category', 'RGS', 'AC', 'PValue'])
+    enrichment_results = [{'category_1.csv': empty_result}, empty_result, {'category_3.csv': empty_result}]
+
+    clusters_df = TermOverlap.from_enrichment_results(annotated_df, enrichment_results).clusters()
+    assert clusters_df.empty
+    assert list(clusters_df.columns) == CLUSTER_COLUMNS
+    assert TermOverlap.from_enrichment_results(annotated_df, pd.DataFrame()).pairs().empty
+
+
+def test_no_gsea_term_passes_threshold(tmp_path):
+    genes = [f"WBGene{i:08d}" for i in range(1, 501)]
+    ranked_genes = pd.DataFrame({"Gene": genes, "Rank": np.linspace(3, -3, len(genes))})
+    gene_set_collections = {1: {"Top term": genes[:30]}, 2: {"Bottom term": genes[-30:]}}
+
+    gsea_analyzer = GSEAAnalyzer(str(tmp_path))
+    gsea_analyzer.run_preranked_gsea_collections(ranked_genes, gene_set_collections, permutation_num=100)
+
+    term_overlap = gsea_analyzer.get_term_overlap(fdr_threshold=-1)
+    assert term_overlap.pairs().empty
+    assert list(term_overlap.clusters().columns) == ['Category Level', 'Term', 'Genes', 'Cluster', 'Representative']
@@ -0,0 +1,103 @@
+"""
+Gene lists read from workbooks against the CSV round trip they replaced
+"""
+from pathlib import Path
+import pandas as pd
+import pytest
+from pandas.errors import EmptyDataError
+from wormcat3 import file_util
+from wormcat3.wormcat_excel import ExcelConversionError, WormcatExcel
+
+DATA_PATH = Path(__file__).parent / "data"
+
+# gene_lists.xlsx and gene_lists.xls hold the same sheets:
+#   "neurons"      gene IDs with more columns, an empty cell, a padded ID and a cell of spaces
+#   "numeric ids"  IDs stored as whole numbers, a decimal, zero-padded text and a date
+#   "integer ids"  whole numbers with an empty cell between them
+#   "header only"  a header and no rows
+#   "empty"        no cells at all
+EXPECTED_GENE_LISTS = {
+    "neurons": ["WBGene00000001", "WBGene00000002", "WBGene00000003", "WBGene00000004", "WBGene00000006",
+                "WBGene00000007", "WBGene00000008", "WBGene00000009", "WBGene00000010", "WBGene00000012"],
+    "numeric ids": ["12345", "67890", "1.5", "00042", "2021-03-01 00:00:00"],
+    "integer ids": ["12345", "67890"],
+    "header only": [],
+    "empty": [],
+}
+
+
+def csv_round_trip(excel_path, csv_dir_path):
+    """ The gene lists of the previous path: a CSV file per sheet, read back with read_gene_set_file. """
+    gene_lists = {}
+    for sheet, csv_file_path in WormcatExcel.extract_csv_files(str(excel_path), str(csv_dir_path)).items():
+        try:
+            gene_lists[sheet] = file_util.read_gene_set_file(csv_file_path)
+        except EmptyDataError:
+            gene_lists[sheet] = None
+    return gene_lists
+
+
+def test_streamed_gene_lists():
+    gene_lists = WormcatExcel.read_first_columns(str(DATA_PATH / "gene_lists.xlsx"))
+
+    assert gene_lists == EXPECTED_GENE_LISTS
+    assert list(gene_lists) == list(EXPECTED_GENE_LISTS)
+
+
+def test_streamed_gene_lists_match_csv_round_trip(tmp_path):
+    gene_lists = WormcatExcel.read_first_columns(str(DATA_PATH / "gene_lists.xlsx"))
+    round_trip_lists = csv_round_trip(DATA_PATH / "gene_lists.xlsx", tmp_path / "csv")
+
+    assert list(gene_lists) == list(round_trip_lists)
+    # Without empty cells, the IDs are those of the round trip as text
+    assert gene_lists["numeric ids"] == round_trip_lists["numeric ids"]
+    assert gene_lists["header only"] == round_trip_lists["header only"] == []
+    # Empty cells came back as NaN and padded IDs unstripped; both are now cleaned up
+    assert pd.isna(round_trip_lists["neurons"][4])
+    assert gene_lists["neurons"] == [str(gene_id).strip() for gene_id in round_trip_lists["neurons"]
+                                     if pd.notna(gene_id) and str(gene_id).strip()]
+    # An empty cell made the round trip read whole numbers as floats, the streamed values stay whole
+    assert round_trip_lists["integer ids"][::2] == [12345.0, 67890.0]
+    assert gene_lists["integer ids"] == ["12345", "67890"]
+    # A sheet with no cells could not be read back at all, it is now an empty gene list
+    assert round_trip_lists["empty"] is None
+    assert gene_lists["empty"] == []
+
+
+def test_legacy_workbook_matches_streamed():
+    pytest.importorskip("xlrd")
+
+    assert WormcatExcel.read_first_columns(str(DATA_PATH / "gene_lists.xls")) == EXPECTED_GENE_LISTS
+
+
+def test_legacy_workbook_fallback(monkeypatch, tmp_path):
+    excel_path = tmp_path / "gene_lists.xls"
+    excel_path.touch()
+    sheets = {
+        "neurons": pd.DataFrame({"ID": [" WBGene00000001", None, "WBGene00000002 ", "  "]}, dtype=object),
+        "integer ids": pd.DataFrame({"Gene": [12345, None, 67890]}, dtype=object),
+        "empty": pd.DataFrame(),
+    }
+    monkeypatch.setattr(pd, "read_excel", lambda *args, **kwargs: sheets)
+
+    assert WormcatExcel.read_first_columns(str(excel_path)) == {
+        "neurons": ["WBGene00000001", "WBGene00000002"],
+        "integer ids": ["12345", "67890"],
+        "empty": [],
+    }
+
+
+def test_invalid_workbooks(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        WormcatExcel.read_first_columns(str(tmp_path / "missing.xlsx"))
+
+    not_excel_path = tmp_path / "gene_list.xlsx"
+    not_excel_path.write_text("ID\nWBGene00000001\n")
+    with pytest.raises(ExcelConversionError, match="not a valid Excel file"):
+        WormcatExcel.read_first_columns(str(not_excel_path))
+
+
+def test_gene_ids():
+    assert WormcatExcel._gene_ids([" WBGene00000001 ", "", "   ", 12345, 1.5, "00042", "WBGene00000002"]) == \
+        ["WBGene00000001", "12345", "1.5", "00042", "WBGene00000002"]
+    assert WormcatExcel._gene_ids([]) == []
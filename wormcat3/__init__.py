@@ -1,3 +1,3 @@
 from .wormcat import Wormcat
-from .annotations_manger import AnnotationsManager
-
+from .annotations_manger import AnnotationsManager, get_annotations_manager
+from .background_profile import BackgroundProfile
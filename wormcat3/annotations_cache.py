@@ -0,0 +1,227 @@
+"""
+Persistent binary cache for parsed Wormcat annotation files
+"""
+import os
+import json
+import shutil
+import hashlib
+import warnings
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from wormcat3 import file_util
+from wormcat3.gene_sets import CategoryGeneSets
+
+
+class AnnotationsCache:
+    """
+    Columnar binary cache of a parsed annotation CSV.
+
+    Every column is stored as its own .npy file so later loads read the arrays
+    directly instead of parsing the CSV again. String columns are dictionary
+    encoded: an int32 code array plus the distinct values packed into a single
+    NUL separated UTF-8 buffer.
+
+    A cache that cannot be read or written is reported as a warning and the
+    annotations are read from the CSV file instead.
+    """
+
+    CACHE_FORMAT_VERSION = 1
+    META_FILE_NM = "meta.json"
+    STRING_SEPARATOR = "\x00"
+
+    def __init__(self, annotation_file_path, cache_dir_path=None):
+        """Initialize the cache for the given annotation file."""
+        self.annotation_file_path = str(Path(annotation_file_path).resolve())
+        cache_root_path = Path(cache_dir_path) if cache_dir_path else file_util.get_cache_dir_path()
+
+        # The cache location is keyed on the resolved path of the annotation file
+        path_key = hashlib.sha1(self.annotation_file_path.encode('utf-8')).hexdigest()[:16]
+        self.cache_dir_path = cache_root_path / f"{Path(annotation_file_path).stem}_{path_key}"
+        self.content_hash = None
+
+    def load(self, columns=None, categorical_columns=()):
+        """
+        Load the cached annotations.
+        Only the given columns are loaded when columns is set, and string columns listed in
+        categorical_columns are returned as pandas Categoricals built directly from the cached codes.
+        Returns None when there is no cache or it no longer matches the annotation file.
+        """
+        meta = self._read_meta()
+        if meta is None or not self._is_valid(meta):
+            return None
+
+        try:
+            data = {}
+            for index, column in enumerate(meta['columns']):
+                if columns is not None and column['name'] not in columns:
+                    continue
+                categorical = column['name'] in categorical_columns
+                data[column['name']] = self._load_column(index, column['kind'], column['n_values'], categorical)
+            df = pd.DataFrame(data)
+        except (OSError, ValueError, KeyError, EOFError) as e:
+            warnings.warn(f"Annotation cache ignored: {e}", RuntimeWarning, stacklevel=2)
+            return None
+
+        if len(df) != meta['n_rows']:
+            warnings.warn("Annotation cache ignored: row count does not match.", RuntimeWarning, stacklevel=2)
+            return None
+
+        self.content_hash = meta['content_hash']
+        return df
+
+    def save(self, df):
+        """
+        Write the annotations to the cache.
+        Returns True if the cache was written; a failure to write is not fatal.
+        """
+        columns = []
+        for column_nm in df.columns:
+            kind = self._column_kind(df[column_nm])
+            if kind is None:
+                warnings.warn(f"Annotation cache not written: column '{column_nm}' has an unsupported type.", RuntimeWarning, stacklevel=2)
+                return False
+            columns.append({'name': column_nm, 'kind': kind})
+
+        stat = os.stat(self.annotation_file_path)
+        self.content_hash = file_util.file_content_hash(self.annotation_file_path)
+        meta = {
+            'format_version': self.CACHE_FORMAT_VERSION,
+            'source_path': self.annotation_file_path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'content_hash': self.content_hash,
+            'n_rows': len(df),
+            'columns': columns
+        }
+
+        # Build the cache in a private directory and move it into place so
+        # concurrent workers never see a partially written cache
+        tmp_dir_path = self.cache_dir_path.with_name(f"{self.cache_dir_path.name}.tmp{os.getpid()}")
+        try:
+            shutil.rmtree(tmp_dir_path, ignore_errors=True)
+            tmp_dir_path.mkdir(parents=True)
+            for index, column in enumerate(columns):
+                column['n_values'] = self._save_column(tmp_dir_path, index, column['kind'], df[column['name']])
+            with open(tmp_dir_path / self.META_FILE_NM, 'w') as file:
+                json.dump(meta, file, indent=2)
+
+            shutil.rmtree(self.cache_dir_path, ignore_errors=True)
+            os.rename(tmp_dir_path, self.cache_dir_path)
+            return True
+        except OSError as e:
+            warnings.warn(f"Annotation cache not written: {e}", RuntimeWarning, stacklevel=2)
+            return False
+        finally:
+            shutil.rmtree(tmp_dir_path, ignore_errors=True)
+
+    def load_gene_sets(self, category):
+        """ Load the stored gene sets for a category, or None if they have not been built. """
+        if self.content_hash is None:
+            return None
+        return CategoryGeneSets.load(self._gene_sets_file_path(category), self.content_hash)
+
+    def save_gene_sets(self, category, gene_sets):
+        """
+        Store the gene sets for a category alongside the cached annotations.
+        Returns True if the gene sets were written.
+        """
+        if self.content_hash is None or not (self.cache_dir_path / self.META_FILE_NM).exists():
+            return False
+
+        gene_sets_file_path = self._gene_sets_file_path(category)
+        tmp_file_path = gene_sets_file_path.with_name(f"{gene_sets_file_path.name}.tmp{os.getpid()}")
+        try:
+            gene_sets.save(tmp_file_path, self.content_hash)
+            os.replace(tmp_file_path, gene_sets_file_path)
+            return True
+        except (OSError, TypeError) as e:
+            warnings.warn(f"Gene set cache not written: {e}", RuntimeWarning, stacklevel=2)
+            if tmp_file_path.exists():
+                tmp_file_path.unlink()
+            return False
+
+    def clear(self):
+        """Remove the cache directory."""
+        shutil.rmtree(self.cache_dir_path, ignore_errors=True)
+
+    def _read_meta(self):
+        """Read the cache metadata or return None if it is missing or unreadable."""
+        meta_file_path = self.cache_dir_path / self.META_FILE_NM
+        try:
+            with open(meta_file_path) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get('format_version') != self.CACHE_FORMAT_VERSION:
+            return None
+        return meta
+
+    def _gene_sets_file_path(self, category):
+        return self.cache_dir_path / f"gene_sets_cat_{category}.npz"
+
+    def _is_valid(self, meta):
+        """ Check the cache against the size, mtime and content hash of the annotation file. """
+        try:
+            stat = os.stat(self.annotation_file_path)
+        except OSError:
+            return False
+
+        if meta['source_path'] != self.annotation_file_path or meta['size'] != stat.st_size:
+            return False
+
+        if meta['mtime_ns'] != stat.st_mtime_ns:
+            # The file was touched; only the content hash can tell if it changed
+            if file_util.file_content_hash(self.annotation_file_path) != meta['content_hash']:
+                return False
+            meta['mtime_ns'] = stat.st_mtime_ns
+            try:
+                with open(self.cache_dir_path / self.META_FILE_NM, 'w') as file:
+                    json.dump(meta, file, indent=2)
+            except OSError:
+                pass
+        return True
+
+    def _column_kind(self, series):
+        """ Return how a column is stored, or None if it cannot be cached. """
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            return 'numeric'
+
+        if series.dtype == object:
+            values = series.dropna()
+            if values.map(type).eq(str).all() and not values.str.contains(self.STRING_SEPARATOR, regex=False).any():
+                return 'string'
+        return None
+
+    def _save_column(self, dir_path, index, kind, series):
+        """Write a single column to the cache directory and return its number of distinct values."""
+        if kind == 'numeric':
+            np.save(dir_path / f"col_{index}_data.npy", series.to_numpy())
+            return None
+
+        codes, uniques = pd.factorize(series)
+        values = self.STRING_SEPARATOR.join(uniques).encode('utf-8')
+        np.save(dir_path / f"col_{index}_codes.npy", codes.astype(np.int32))
+        np.save(dir_path / f"col_{index}_values.npy", np.frombuffer(values, dtype=np.uint8))
+        return len(uniques)
+
+    def _load_column(self, index, kind, n_values, categorical=False):
+        """
+        Read a single column from the cache directory.
+        The arrays are read into memory rather than memory-mapped, as the DataFrame built from
+        them holds its own copy (and string columns are expanded from their codes) anyway.
+        """
+        if kind == 'numeric':
+            return np.load(self.cache_dir_path / f"col_{index}_data.npy")
+
+        codes = np.load(self.cache_dir_path / f"col_{index}_codes.npy")
+        values = np.load(self.cache_dir_path / f"col_{index}_values.npy")
+        uniques = values.tobytes().decode('utf-8').split(self.STRING_SEPARATOR)[:n_values]
+
+        if categorical:
+            return pd.Categorical.from_codes(codes, categories=uniques)
+
+        # Append NaN so that the missing value code (-1) selects it
+        uniques = np.array(uniques + [np.nan], dtype=object)
+        return uniques.take(codes)
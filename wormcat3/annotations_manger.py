@@ -1,36 +1,137 @@
 import pandas as pd
+import numpy as np
 import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
 from wormcat3 import file_util
+from wormcat3.annotations_cache import AnnotationsCache
+from wormcat3.background_profile import BackgroundProfile
+from wormcat3.gene_sets import CategoryGeneSets
+from wormcat3.incidence_matrix import CategoryIncidenceMatrix
 import wormcat3.constants as cs
 
 class AnnotationsManager:
     """ Manages gene annotations and preprocessing. """
     
-    def __init__(self, annotation_file=cs.DEFAULT_ANNOTATION_FILE_NAME):
-        """Initialize with the path to the annotation file."""
-        if file_util.is_file_path(annotation_file):
-            self.annotation_file_path = annotation_file
-        else:
-            self.annotation_file_path = file_util.find_file_path(annotation_file)
-            if not self.annotation_file_path:
-                raise FileNotFoundError(f"Annotation file not found: {annotation_file}")
-                        
+    # Columns kept in compact mode
+    GENE_ID_COLUMNS = ["Sequence.ID", "Wormbase.ID"]
+    CATEGORY_COLUMNS = ["Category.1", "Category.2", "Category.3"]
+    
+    def __init__(self, annotation_file=cs.DEFAULT_ANNOTATION_FILE_NAME, *, use_cache=True, compact=False):
+        """
+        Initialize with the path to the annotation file.
+        When use_cache is True the parsed annotations are kept in a binary cache
+        so that later loads skip the CSV parsing.
+        When compact is True only the gene ID and category columns are kept, with
+        the categories stored as pandas Categoricals and the gene IDs interned.
+        """
+        self.annotation_file_path = self.resolve_annotation_file(annotation_file)
+        self.compact = compact
+        
+        self.annotations_cache = AnnotationsCache(self.annotation_file_path) if use_cache else None
         self.annotations_df = self._load_annotations()
+        self._build_gene_index()
+        self._category_gene_sets = {}
+        self._incidence_matrix = None
+        self._background_profiles = OrderedDict()
+        self._background_profiles_lock = threading.Lock()
+        self._content_hash = None
             
      
         
+    @staticmethod
+    def resolve_annotation_file(annotation_file):
+        """ Return the path of an annotation file given either a path or a file name. """
+        
+        if file_util.is_file_path(annotation_file):
+            return annotation_file
+        
+        annotation_file_path = file_util.find_file_path(annotation_file)
+        if not annotation_file_path:
+            raise FileNotFoundError(f"Annotation file not found: {annotation_file}")
+        return annotation_file_path
+    
     def _load_annotations(self):
-        """ Load annotations from file. """
+        """ Load annotations from the cache or, failing that, from file. """
         
         try:
-            df = pd.read_csv(self.annotation_file_path)
-            df.columns = df.columns.str.replace(' ', '.')
-            if df.empty:
-                raise ValueError(f"Annotation file '{self.annotation_file_path}' is empty.")
-            return df
+            df = None
+            if self.annotations_cache is not None:
+                if self.compact:
+                    df = self.annotations_cache.load(
+                        columns=self.GENE_ID_COLUMNS + self.CATEGORY_COLUMNS,
+                        categorical_columns=self.CATEGORY_COLUMNS
+                    )
+                else:
+                    df = self.annotations_cache.load()
+            
+            if df is None:
+                df = pd.read_csv(self.annotation_file_path)
+                df.columns = df.columns.str.replace(' ', '.')
+                if df.empty:
+                    raise ValueError(f"Annotation file '{self.annotation_file_path}' is empty.")
+                
+                if self.annotations_cache is not None:
+                    self.annotations_cache.save(df)
+            
+            if self.compact:
+                df = self._compact_annotations(df)
+            
+            # Annotation rows identify the matrix rows of annotated gene sets (see CategoryIncidenceMatrix)
+            return df.rename_axis(CategoryIncidenceMatrix.ROW_INDEX_NAME)
         except Exception as e:
             raise ValueError(f"Failed to load annotation file: {e}")
     
+    def _compact_annotations(self, df):
+        """ Reduce the annotations to the gene ID and category columns with compact dtypes. """
+        
+        columns = [col for col in self.GENE_ID_COLUMNS + self.CATEGORY_COLUMNS if col in df.columns]
+        compact_df = df[columns].copy()
+        
+        for col in columns:
+            if col in self.CATEGORY_COLUMNS:
+                if not isinstance(compact_df[col].dtype, pd.CategoricalDtype):
+                    compact_df[col] = compact_df[col].astype('category')
+            else:
+                compact_df[col] = [sys.intern(gene) if isinstance(gene, str) else gene for gene in compact_df[col]]
+        
+        return compact_df
+    
+    def content_hash(self):
+        """ Hash of the annotation file's content, computed once (taken from the annotations cache when it has one). """
+        if self._content_hash is None:
+            if self.annotations_cache is not None and self.annotations_cache.content_hash is not None:
+                self._content_hash = self.annotations_cache.content_hash
+            else:
+                self._content_hash = file_util.file_content_hash(self.annotation_file_path)
+        return self._content_hash
+    
+    def memory_usage(self):
+        """ Return the memory used by the annotations in bytes. """
+        return int(self.annotations_df.memory_usage(deep=True).sum())
+    
+    @staticmethod
+    def memory_report(annotation_file=cs.DEFAULT_ANNOTATION_FILE_NAME):
+        """
+        Compare the memory used by the full and compact annotation representations.
+        Returns a dataframe with the bytes used by each column in both modes.
+        """
+        full_df = AnnotationsManager(annotation_file).annotations_df
+        compact_df = AnnotationsManager(annotation_file, compact=True).annotations_df
+        
+        full_usage = full_df.memory_usage(deep=True, index=False)
+        compact_usage = compact_df.memory_usage(deep=True, index=False)
+        report_df = pd.DataFrame({
+            'Full': full_usage,
+            'Compact': compact_usage.reindex(full_usage.index, fill_value=0)
+        })
+        report_df.loc['Total'] = report_df.sum()
+        report_df['Reduction %'] = (100 * (1 - report_df['Compact'] / report_df['Full'])).round(1)
+        report_df.index.name = 'Column'
+        return report_df.reset_index()
+    
     def get_gene_id_type(self, gene_set):
         """ Determine the gene ID type from the gene set. """
         
@@ -57,38 +158,102 @@ class AnnotationsManager:
                 seen.add(item)
         return deduped_list
     
+    def _build_gene_index(self):
+        """
+        Index the gene ID columns so gene sets can be annotated by lookup
+        rather than by merging against the whole annotation file.
+        """
+        self.gene_index = {}
+        self._annotated_rows = {}
+        self._unannotated_rows = {}
+        
+        for gene_type in ["Wormbase.ID", "Sequence.ID"]:
+            if gene_type in self.annotations_df.columns:
+                self._index_gene_column(gene_type)
+    
+    def _index_gene_column(self, gene_type):
+        """ Index a single gene ID column of the annotations. """
+        
+        # Rows with every annotation column filled, and rows with none filled
+        annotation_columns = [col for col in self.annotations_df.columns if col != gene_type]
+        annotation_present = self.annotations_df[annotation_columns].notna().to_numpy()
+        self._annotated_rows[gene_type] = annotation_present.all(axis=1)
+        self._unannotated_rows[gene_type] = ~annotation_present.any(axis=1)
+        self.gene_index[gene_type] = pd.Index(self.annotations_df[gene_type])
+    
+    def _lookup_annotation_rows(self, gene_set_list, gene_type):
+        """
+        Find the annotation rows for each gene in the gene set.
+        Returns the gene ID and annotation row position (-1 if not found) for each output row,
+        matching the row order of a left merge of the gene set with the annotations.
+        """
+        if gene_type not in self.gene_index:
+            self._index_gene_column(gene_type)
+        
+        gene_index = self.gene_index[gene_type]
+        genes = pd.Index(gene_set_list, dtype=object)
+        
+        if gene_index.is_unique:
+            rows = gene_index.get_indexer(genes)
+            return genes.to_numpy(), rows
+        
+        # A gene can match several annotation rows; unmatched genes are reported in order
+        rows, missing = gene_index.get_indexer_non_unique(genes)
+        gene_ids = np.empty(len(rows), dtype=object)
+        gene_ids[rows >= 0] = gene_index.to_numpy()[rows[rows >= 0]]
+        gene_ids[rows < 0] = genes.to_numpy()[missing]
+        return gene_ids, rows
+    
+    def _take_annotation_rows(self, gene_ids, rows, gene_type):
+        """
+        Build the annotated gene set from annotation row positions; rows of -1 are left empty.
+        The positions are kept as the index, so counting matches each row to its own annotation row.
+        """
+        
+        annotated = {gene_type: gene_ids}
+        for col in self.annotations_df.columns:
+            if col == gene_type:
+                continue
+            
+            values = self.annotations_df[col].array
+            if isinstance(values, pd.Categorical):
+                # Only the selected rows are expanded to strings
+                categories = np.append(values.categories.to_numpy(dtype=object), np.nan)
+                codes = np.where(rows >= 0, values.codes.take(rows), -1)
+                annotated[col] = categories.take(codes)
+            else:
+                annotated[col] = pd.api.extensions.take(values.to_numpy(), rows, allow_fill=True)
+        return pd.DataFrame(annotated, index=pd.Index(rows, name=CategoryIncidenceMatrix.ROW_INDEX_NAME))
+    
     def add_annotations(self, gene_set_list, gene_type):
         """ Add annotations to the gene set. """
         
-        gene_set_df = pd.DataFrame(gene_set_list, columns=[gene_type])
-        
         # Verify if 'gene_type' is a column in the DataFrame
         if gene_type not in self.annotations_df.columns:
             raise ValueError(f"Column '{gene_type}' not found in the DataFrame.")
         
-        return pd.merge(gene_set_df, self.annotations_df, on=gene_type, how='left')
+        gene_ids, rows = self._lookup_annotation_rows(gene_set_list, gene_type)
+        return self._take_annotation_rows(gene_ids, rows, gene_type)
 
 
     def segment_genes_by_annotation_match(self, gene_set_list, gene_type):
         """ Split background genes into those with and without annotations. """
         
-        gene_set_df = pd.DataFrame(gene_set_list, columns=[gene_type])
-        
-        # Check if gene_type is in both dataframes
-        if gene_type not in gene_set_df.columns:
-            raise ValueError(f"'{gene_type}' not found in gene_set_df.")
         if gene_type not in self.annotations_df.columns:
             raise ValueError(f"'{gene_type}' not found in annotations_df.")
         
-        # Perform the left merge
-        merged_df = pd.merge(gene_set_df, self.annotations_df, on=gene_type, how='left')
+        gene_ids, rows = self._lookup_annotation_rows(gene_set_list, gene_type)
+        annotated_df = self._take_annotation_rows(gene_ids, rows, gene_type)
         
-        # Split based on presence of annotation (assuming at least one non-key column in annotations_df)
-        annotation_columns = [col for col in self.annotations_df.columns if col != gene_type]
+        # Split based on presence of annotation using the per-row masks computed at load time
+        found = rows >= 0
+        matched = found.copy()
+        matched[found] = self._annotated_rows[gene_type][rows[found]]
+        not_matched = ~found
+        not_matched[found] = self._unannotated_rows[gene_type][rows[found]]
         
-        genes_matched_df = merged_df.dropna(subset=annotation_columns)
-        genes_not_matched_df = merged_df[merged_df[annotation_columns].isnull().all(axis=1)]
-        genes_not_matched_df = genes_not_matched_df[[gene_type]]
+        genes_matched_df = annotated_df[matched]
+        genes_not_matched_df = annotated_df.loc[not_matched, [gene_type]]
 
         return genes_matched_df, genes_not_matched_df
 
@@ -99,44 +264,78 @@ class AnnotationsManager:
             output_file_path = f"{output_dir_path}/{output_file_nm_prefix}_cat_{category}.gmt"
             self.save_gmt_to_file(gmt_format, output_file_path)    
 
-    def category_to_gmt_format(self, category):
-        """ Convert an annotation dataframe category to GMT format. """
-        category_col = f"Category.{category}"
-        gene_col = "Wormbase.ID"
-        id_col = "Function.ID"
-                
-        category_df = self.annotations_df[[gene_col, category_col]]
-        category_df = category_df.rename(columns={category_col: id_col})
+    def get_category_gene_sets(self, category):
+        """
+        Return the gene sets for a category as a CategoryGeneSets object.
+        The gene sets are built once per annotation version, stored next to the
+        annotation cache and then served from memory.
+        """
+        gene_sets = self._category_gene_sets.get(category)
+        if gene_sets is not None:
+            return gene_sets
         
-        # Validate that required columns exist
-        required_cols = [id_col, gene_col]        
-        missing_cols = [col for col in required_cols if col not in category_df.columns]
-        if missing_cols:
-            raise ValueError(f"Missing required columns: {', '.join(missing_cols)}")
+        if self.annotations_cache is not None:
+            gene_sets = self.annotations_cache.load_gene_sets(category)
         
-        # Assert ID column has no NaN values
-        assert not category_df[id_col].isna().any(), f"Column '{id_col}' contains NaN values"
+        if gene_sets is None:
+            gene_sets = CategoryGeneSets.from_annotations(self.annotations_df, category)
+            
+            # Assert there's at least one gene set
+            assert len(gene_sets) > 0, "No gene sets were generated"
+            
+            if self.annotations_cache is not None:
+                self.annotations_cache.save_gene_sets(category, gene_sets)
         
-        # Use ID column as description if desc_col is None
-        grouped = category_df.groupby([id_col])[gene_col].apply(list).reset_index()
+        self._category_gene_sets[category] = gene_sets
+        return gene_sets
+
+    def get_incidence_matrix(self):
+        """ Return the gene by term incidence matrix for all categories, built once per annotation load. """
+        if self._incidence_matrix is None:
+            self._incidence_matrix = CategoryIncidenceMatrix(self.annotations_df)
+        return self._incidence_matrix
+
+    def get_background_profile(self, background_list=None):
+        """
+        Return the BackgroundProfile for a background gene list, or for the whole
+        annotation file when background_list is None.
+        Profiles are cached by the content of the list, so repeated runs with the
+        same background annotate and count it only once.
+        """
+        if background_list is None:
+            content_key = BackgroundProfile.WHOLE_GENOME_KEY
+        else:
+            content_key = BackgroundProfile.content_key_for(background_list)
         
-        # Assert there's at least one gene set
-        assert len(grouped) > 0, "No gene sets found after grouping"
+        with self._background_profiles_lock:
+            background_profile = self._background_profiles.get(content_key)
+            if background_profile is not None:
+                self._background_profiles.move_to_end(content_key)
+                return background_profile
         
-        # Create GMT formatted dictionary
-        gmt_format = {}
-        for _, row in grouped.iterrows():            
-            # Filter out any None or NaN values from gene list
-            gene_list = [str(gene) for gene in row[gene_col] if pd.notna(gene)]
-            
-            # Only include if there are genes in the set
-            if gene_list:
-                gmt_format[row[id_col]] = gene_list
+        if background_list is None:
+            background_profile = BackgroundProfile.whole_genome(self)
+        else:
+            background_profile = BackgroundProfile.from_gene_list(self, background_list)
         
-        # Final assertion to ensure data was processed
-        assert len(gmt_format) > 0, "No gene sets were generated"
+        with self._background_profiles_lock:
+            self._background_profiles[content_key] = background_profile
+            while len(self._background_profiles) > cs.DEFAULT_BACKGROUND_PROFILE_CACHE_SIZE:
+                self._background_profiles.popitem(last=False)
         
-        return gmt_format
+        return background_profile
+
+    def category_to_gmt_format(self, category):
+        """ Convert an annotation dataframe category to GMT format. """
+        return self.get_category_gene_sets(category).to_gmt_format()
+
+    def category_to_index_format(self, category):
+        """
+        Return the gene sets for a category as a dictionary of term to an integer array,
+        together with the gene ID array those integers index into.
+        """
+        gene_sets = self.get_category_gene_sets(category)
+        return gene_sets.index_arrays(), gene_sets.genes
 
     def save_gmt_to_file(self, gmt_format, output_file_path='wormcat.gmt'):
         """ Write GMT formatted dictionary to disk. """
@@ -158,3 +357,67 @@ class AnnotationsManager:
         print(f"Successfully created GMT file: {output_file_path}")
         
         return output_file_path
+
+
+class AnnotationsRegistry:
+    """
+    Process-wide registry of shared AnnotationsManager instances.
+    
+    Managers are keyed on the resolved annotation file path and its version
+    (size and modification time) and evicted least recently used first.
+    The managers handed out are shared, so callers must treat them and their
+    annotations_df as read-only.
+    """
+    
+    def __init__(self, max_size=cs.DEFAULT_ANNOTATION_REGISTRY_SIZE):
+        """Initialize with the maximum number of annotation versions to keep."""
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1.")
+        
+        self.max_size = max_size
+        self._managers = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, annotation_file=cs.DEFAULT_ANNOTATION_FILE_NAME, *, compact=False):
+        """ Return the shared manager for the annotation file, loading it if needed. """
+        
+        annotation_file_path = AnnotationsManager.resolve_annotation_file(annotation_file)
+        key = self._registry_key(annotation_file_path) + (compact,)
+        
+        with self._lock:
+            annotation_manager = self._managers.get(key)
+            if annotation_manager is not None:
+                self._managers.move_to_end(key)
+                return annotation_manager
+            
+            annotation_manager = AnnotationsManager(annotation_file_path, compact=compact)
+            self._managers[key] = annotation_manager
+            while len(self._managers) > self.max_size:
+                self._managers.popitem(last=False)
+            
+            return annotation_manager
+    
+    def clear(self):
+        """ Drop all registered managers. """
+        with self._lock:
+            self._managers.clear()
+    
+    def __len__(self):
+        return len(self._managers)
+    
+    @staticmethod
+    def _registry_key(annotation_file_path):
+        """ Key a manager on the resolved path and version of its annotation file. """
+        resolved_path = Path(annotation_file_path).resolve()
+        try:
+            stat = resolved_path.stat()
+        except OSError:
+            raise FileNotFoundError(f"Annotation file not found: {annotation_file_path}")
+        return (str(resolved_path), stat.st_size, stat.st_mtime_ns)
+
+
+_annotations_registry = AnnotationsRegistry()
+
+def get_annotations_manager(annotation_file=cs.DEFAULT_ANNOTATION_FILE_NAME, *, compact=False):
+    """ Return the process-wide shared AnnotationsManager for the annotation file. """
+    return _annotations_registry.get(annotation_file, compact=compact)
@@ -0,0 +1,76 @@
+"""
+Precomputed background used by the enrichment test
+"""
+import hashlib
+import pandas as pd
+
+
+class BackgroundProfile:
+    """
+    Background of an enrichment test, computed once and shared between runs.
+
+    Holds the deduplicated background gene IDs, their annotation rows, the IDs
+    with no annotation and the per-term totals for Category 1, 2 and 3.
+    Profiles are keyed on a hash of the background content so any run using the
+    same background list can reuse them; treat them as read-only.
+    """
+
+    WHOLE_GENOME_KEY = "whole_genome"
+
+    def __init__(self, annotated_df, not_annotated_df, incidence_matrix, *, gene_ids=None, gene_type=None, content_key=WHOLE_GENOME_KEY):
+        """Initialize from the annotated background and the incidence matrix used for counting."""
+        self.annotated_df = annotated_df
+        self.not_annotated_df = not_annotated_df
+        self.incidence_matrix = incidence_matrix
+        self.gene_ids = gene_ids
+        self.gene_type = gene_type
+        self.content_key = content_key
+        self.term_counts = incidence_matrix.term_counts(incidence_matrix.row_counts(annotated_df))
+
+    @classmethod
+    def whole_genome(cls, annotation_manager):
+        """ Profile of the whole annotation file, used when no background is given. """
+        return cls(
+            annotation_manager.annotations_df,
+            pd.DataFrame(),
+            annotation_manager.get_incidence_matrix()
+        )
+
+    @classmethod
+    def from_gene_list(cls, annotation_manager, gene_list):
+        """ Build the profile of a background gene list. """
+        gene_ids = annotation_manager.dedup_list(gene_list)
+        gene_type = annotation_manager.get_gene_id_type(gene_ids)
+        annotated_df, not_annotated_df = annotation_manager.segment_genes_by_annotation_match(gene_ids, gene_type)
+        return cls(
+            annotated_df,
+            not_annotated_df,
+            annotation_manager.get_incidence_matrix(),
+            gene_ids=gene_ids,
+            gene_type=gene_type,
+            content_key=cls.content_key_for(gene_ids)
+        )
+
+    @staticmethod
+    def content_key_for(gene_list):
+        """ Hash of a background gene list after deduplication, in order. """
+        content_hash = hashlib.sha256()
+        seen = set()
+        for gene_id in gene_list:
+            if gene_id not in seen:
+                seen.add(gene_id)
+                content_hash.update(f"{gene_id}\n".encode('utf-8'))
+        return content_hash.hexdigest()
+
+    @property
+    def is_whole_genome(self):
+        return self.content_key == self.WHOLE_GENOME_KEY
+
+    def __len__(self):
+        """ Number of annotation rows in the background. """
+        return len(self.annotated_df)
+
+    def category_counts(self, category):
+        """ Return the number of background genes per term of a category level. """
+        counts = self.incidence_matrix.level_counts(self.term_counts, category)
+        return counts[counts > 0]
@@ -0,0 +1,124 @@
+"""
+Manifest of the completed runs of a Wormcat batch, for resuming it
+"""
+import os
+import json
+import shutil
+import hashlib
+import warnings
+import pandas as pd
+from pathlib import Path
+
+
+class BatchManifest:
+    """
+    Record of the gene set runs of a batch that completed, kept in its directory.
+
+    Each entry holds what a run's results depend on (a hash of the gene list, a
+    hash of the annotation file and the run parameters) and where the results
+    were written. When a batch is run again in the same directory, a gene set
+    whose entry still matches and whose Fisher tables are still on disk is not
+    run again; its tables are read back for the summary instead.
+
+    The manifest is rewritten after every completed run, so a batch that stops
+    part way keeps the runs it finished. The run directory of a gene set that is
+    run again, or that is no longer part of the batch, is removed with its entry
+    so that no stale results are left next to the current ones.
+    """
+
+    MANIFEST_FORMAT_VERSION = 1
+    MANIFEST_FILE_NM = "batch_manifest.json"
+
+    def __init__(self, batch_dir_path):
+        """Initialize with the batch directory, reading the manifest there if there is one."""
+        self.batch_dir_path = Path(batch_dir_path)
+        self.manifest_file_path = self.batch_dir_path / self.MANIFEST_FILE_NM
+        self.entries = self._read_entries()
+
+    @staticmethod
+    def gene_set_hash(gene_list):
+        """ Hash of a gene list, in order. """
+        content_hash = hashlib.sha256()
+        for gene_id in gene_list:
+            content_hash.update(f"{gene_id}\n".encode('utf-8'))
+        return content_hash.hexdigest()
+
+    def completed_entry(self, gene_set_nm, gene_set_hash, annotation_hash, params):
+        """
+        Return the entry of a gene set if its run completed with the same gene list, annotations
+        and parameters and its Fisher tables are still there, otherwise None.
+        """
+        entry = self.entries.get(gene_set_nm)
+        if entry is None:
+            return None
+        if (entry['gene_set_hash'], entry['annotation_hash'], entry['params']) != (gene_set_hash, annotation_hash, params):
+            return None
+        if not all((self.batch_dir_path / path).exists() for path in entry['fisher_result_paths'].values()):
+            return None
+        return entry
+
+    def record(self, gene_set_nm, gene_set_hash, annotation_hash, params, run_number, run_dir_path, fisher_result_paths):
+        """ Record a completed run and rewrite the manifest. """
+        self.entries[gene_set_nm] = {
+            'gene_set_hash': gene_set_hash,
+            'annotation_hash': annotation_hash,
+            'params': params,
+            'run_number': run_number,
+            'run_dir_path': self._relative_path(run_dir_path),
+            'fisher_result_paths': {str(category): self._relative_path(path) for category, path in fisher_result_paths.items()}
+        }
+        self.save()
+
+    def load_fisher_results(self, entry):
+        """ Read back the Fisher tables of a completed run, by category. """
+        fisher_results = {}
+        for category, path in entry['fisher_result_paths'].items():
+            file_path = self.batch_dir_path / path
+            fisher_results[int(category)] = pd.read_parquet(file_path) if file_path.suffix == ".parquet" else pd.read_csv(file_path)
+        return fisher_results
+
+    def discard(self, gene_set_nm):
+        """ Drop the entry of a gene set that is about to be run again, and remove its run directory. """
+        entry = self.entries.pop(gene_set_nm, None)
+        if entry is not None:
+            self._remove_run_dir(entry)
+            self.save()
+
+    def retain(self, gene_set_nms):
+        """ Drop the entries, and remove the run directories, of gene sets that are no longer part of the batch. """
+        for name in [name for name in self.entries if name not in gene_set_nms]:
+            self._remove_run_dir(self.entries.pop(name))
+        self.save()
+
+    def save(self):
+        """ Write the manifest, replacing the old one in a single step. """
+        tmp_file_path = self.manifest_file_path.with_name(f"{self.MANIFEST_FILE_NM}.tmp{os.getpid()}")
+        with open(tmp_file_path, 'w') as file:
+            json.dump({'format_version': self.MANIFEST_FORMAT_VERSION, 'entries': self.entries}, file, indent=1)
+        os.replace(tmp_file_path, self.manifest_file_path)
+
+    def _read_entries(self):
+        """ The entries of the manifest on disk; none if it is missing, unreadable or of another version. """
+        try:
+            with open(self.manifest_file_path) as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            warnings.warn(f"Batch manifest ignored: {e}", RuntimeWarning, stacklevel=3)
+            return {}
+
+        if manifest.get('format_version') != self.MANIFEST_FORMAT_VERSION:
+            return {}
+        return manifest['entries']
+
+    def _remove_run_dir(self, entry):
+        """ Remove the run directory of an entry; only a directory inside the batch directory is removed. """
+        batch_dir_path = self.batch_dir_path.resolve()
+        run_dir_path = (self.batch_dir_path / entry['run_dir_path']).resolve()
+        if run_dir_path.parent == batch_dir_path and run_dir_path.is_dir():
+            shutil.rmtree(run_dir_path, ignore_errors=True)
+
+    def _relative_path(self, path):
+        """ A path relative to the batch directory, so the batch can be moved. """
+        return os.path.relpath(path, self.batch_dir_path)
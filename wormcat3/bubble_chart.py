@@ -14,14 +14,18 @@ def preprocess_bubble_data(data_file_path, add_calibration=False):
     Preprocess CSV data for bubble plot visualization.
     
     Args:
-        csv_file_name (str): Path to the CSV file containing the data.
+        data_file_path (str | pd.DataFrame): Path to the CSV file containing the data,
+            or the data itself as a DataFrame.
         
     Returns:
         pd.DataFrame: Processed DataFrame ready for plotting.
     """
     try:
-        # Read the CSV file
-        bubbles_data = pd.read_csv(data_file_path)
+        # Read the CSV file unless the data was passed in directly
+        if isinstance(data_file_path, pd.DataFrame):
+            bubbles_data = data_file_path.copy()
+        else:
+            bubbles_data = pd.read_csv(data_file_path)
         column_names = bubbles_data.columns.tolist()
         correction_method = 'Bonferroni' if 'Bonferroni' in column_names else 'FDR'
         
@@ -209,13 +213,16 @@ def generate_bubble_plot(df, svg_file_path, plot_title=cs.DEFAULT_TITLE, width=c
         raise IOError(f"Failed to save plot: {e}")
 
 
-def create_bubble_chart(dir_path: str, data_file_nm: str, plot_title="RGS", add_calibration=False) -> None:
+def create_bubble_chart(dir_path: str, data_file_nm: str, plot_title="RGS", add_calibration=False, data_df=None) -> None:
+    """
+    Create the bubble chart SVG for a results file; the SVG takes the name of the data file.
+    When data_df is given it is plotted directly and the data file is not read.
+    """
     try:
         data_file_path = Path(dir_path) / data_file_nm
-        svg_file_nm = data_file_nm[:-3] + 'svg'
-        svg_file_path = Path(dir_path) / svg_file_nm
+        svg_file_path = data_file_path.with_suffix('.svg')
         
-        bubbles_data = preprocess_bubble_data(data_file_path, add_calibration = add_calibration)
+        bubbles_data = preprocess_bubble_data(data_file_path if data_df is None else data_df, add_calibration = add_calibration)
         
         # Scale the height of the bubble chart based on the number of items
         bubbles_data_len = len(bubbles_data)
@@ -5,6 +5,23 @@ class PAdjustMethod(Enum):
     BONFERRONI = 'bonferroni'
     FDR = 'fdr_bh'
 
+# Enum for where the intermediate tables of a run are written
+class OutputMode(Enum):
+    CSV = 'csv'
+    PARQUET = 'parquet'
+    MEMORY = 'memory'
+    NONE = 'none'
+
+# Enum for the preranked GSEA implementation
+class GSEAEngine(Enum):
+    GSEAPY = 'gseapy'
+    NATIVE = 'native'
+
+# Enum for the gene overlap coefficient between two terms
+class OverlapMetric(Enum):
+    JACCARD = 'jaccard'
+    OVERLAP = 'overlap'
+
 # Wormcat Configuration
 DEFAULT_WORKING_DIR_PATH = "./wormcat_out"
 DEFAULT_RUN_PREFIX = "run"
@@ -13,8 +30,25 @@ DEFAULT_RUN_PREFIX = "run"
 DEFAULT_P_ADJUST_THRESHOLD = 0.1
 DEFAULT_ANNOTATION_FILE_NAME = "whole_genome_v2_nov-11-2021.csv"
 
+# Annotations Cache Configuration
+DEFAULT_CACHE_DIR_PATH = "~/.cache/wormcat3"
+DEFAULT_ANNOTATION_REGISTRY_SIZE = 4
+DEFAULT_BACKGROUND_PROFILE_CACHE_SIZE = 16
+
+# Result Cache Configuration
+DEFAULT_RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+GSEA_RESULT_CACHE_NM = "gsea_results"
+ENRICHMENT_RESULT_CACHE_NM = "enrichment_results"
+
 # Gene Set Enrichment Analysis
 DEFAULT_GSEA_RESULTS_DIR = "./gsea_results"
+DEFAULT_GSEA_PERMUTATION_BATCH_SIZE = 100
+DEFAULT_GSEA_ADAPTIVE_EXCEEDANCES = 10
+DEFAULT_GSEA_MAX_PERMUTATION_FACTOR = 10
+DEFAULT_RANK_TEST_CORRELATION = 0.01
+
+# Term Overlap Configuration
+DEFAULT_TERM_OVERLAP_THRESHOLD = 0.5
 
 # Bubble Chart Configuration
 DEFAULT_TITLE = "RGS"
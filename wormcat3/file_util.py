@@ -3,6 +3,8 @@ import uuid
 from pathlib import Path
 import pandas as pd
 import re
+import hashlib
+import wormcat3.constants as cs
 
 def validate_directory_path(directory_path, not_empty_check = True):
     """
@@ -74,6 +76,23 @@ def read_gene_set_file(file_path):
     # Extract the first column as a list
     return df.iloc[:, 0].tolist()
 
+def read_gene_sets_file(file_path, sheet_name=0):
+    """
+    Read a "wide" CSV or Excel file where each column is a gene set.
+    Returns a dictionary of column name to the list of genes in that column.
+    """
+    
+    if not Path(file_path).exists():
+        raise FileNotFoundError(f"The file {file_path} does not exist.")
+    
+    if Path(file_path).suffix.lower() in ['.xlsx', '.xls', '.xlsm']:
+        df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str)
+    else:
+        df = pd.read_csv(file_path, dtype=str)
+    
+    # Columns can have different lengths, so drop the padding of each one
+    return {str(column): df[column].dropna().str.strip().tolist() for column in df.columns}
+
 def is_file_path(input_string: str) -> bool:
     """
     Check if the given string is a valid file path or just a file name.
@@ -104,3 +123,20 @@ def extract_run_number(data_file_nm):
         raise ValueError(f"Invalid file name: {data_file_nm}. It must end with 'run_00000.csv' where '00000' are any 5 digits.")
 
 
+
+def get_cache_dir_path():
+    """
+    Return the directory used for Wormcat's persistent caches.
+    The WORMCAT_CACHE_PATH environment variable overrides the default location.
+    """
+    cache_dir_path = os.environ.get("WORMCAT_CACHE_PATH", cs.DEFAULT_CACHE_DIR_PATH)
+    return Path(cache_dir_path).expanduser()
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Compute the SHA-256 hex digest of a file's content."""
+    
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
@@ -0,0 +1,107 @@
+"""
+Compact gene-set representation of the Wormcat categories
+"""
+import numpy as np
+import pandas as pd
+
+
+class CategoryGeneSets:
+    """
+    Gene sets for one Wormcat category level stored as integer index arrays.
+
+    The members of the gene set for terms[i] are genes[indices[indptr[i]:indptr[i+1]]],
+    in the order they appear in the annotation file.
+    """
+
+    GENE_COLUMN = "Wormbase.ID"
+    STRING_SEPARATOR = "\x00"
+
+    def __init__(self, category, terms, genes, indptr, indices):
+        """Initialize from the term names, gene universe and CSR style index arrays."""
+        self.category = category
+        self.terms = np.asarray(terms, dtype=object)
+        self.genes = np.asarray(genes, dtype=object)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+
+    @classmethod
+    def from_annotations(cls, annotations_df, category):
+        """ Build the gene sets for a category from an annotation dataframe. """
+        category_col = f"Category.{category}"
+        gene_col = cls.GENE_COLUMN
+
+        # Validate that required columns exist
+        missing_cols = [col for col in [category_col, gene_col] if col not in annotations_df.columns]
+        if missing_cols:
+            raise ValueError(f"Missing required columns: {', '.join(missing_cols)}")
+
+        # Assert category column has no NaN values
+        assert not annotations_df[category_col].isna().any(), f"Column '{category_col}' contains NaN values"
+
+        term_codes, terms = pd.factorize(annotations_df[category_col], sort=True)
+        gene_codes, genes = pd.factorize(annotations_df[gene_col])
+
+        # Genes without an ID are not members of any gene set
+        has_gene = gene_codes >= 0
+        term_codes = term_codes[has_gene]
+        gene_codes = gene_codes[has_gene]
+
+        # A stable sort groups the genes by term while keeping annotation file order
+        order = np.argsort(term_codes, kind='stable')
+        counts = np.bincount(term_codes, minlength=len(terms))
+
+        # Only keep terms that have at least one gene
+        non_empty = counts > 0
+        indptr = np.concatenate([[0], np.cumsum(counts[non_empty])])
+        genes = np.array([str(gene) for gene in genes], dtype=object)
+
+        return cls(category, np.asarray(terms, dtype=object)[non_empty], genes, indptr, gene_codes[order])
+
+    def __len__(self):
+        return len(self.terms)
+
+    def sizes(self):
+        """ Number of genes in each gene set. """
+        return np.diff(self.indptr)
+
+    def index_arrays(self):
+        """ Return a dictionary of term to an integer array of indices into genes. """
+        return {term: self.indices[start:end] for term, start, end in zip(self.terms, self.indptr[:-1], self.indptr[1:])}
+
+    def to_gmt_format(self):
+        """ Return the gene sets as a GMT formatted dictionary of term to gene list. """
+        members = self.genes.take(self.indices).tolist()
+        return {term: members[start:end] for term, start, end in zip(self.terms, self.indptr[:-1], self.indptr[1:])}
+
+    def save(self, file_path, content_hash=""):
+        """ Write the gene sets to a .npz file. """
+        terms = self.STRING_SEPARATOR.join(self.terms).encode('utf-8')
+        genes = self.STRING_SEPARATOR.join(self.genes).encode('utf-8')
+        with open(file_path, 'wb') as file:
+            np.savez(
+                file,
+                category=np.array(self.category),
+                content_hash=np.array(content_hash),
+                n_terms=np.array(len(self.terms)),
+                n_genes=np.array(len(self.genes)),
+                terms=np.frombuffer(terms, dtype=np.uint8),
+                genes=np.frombuffer(genes, dtype=np.uint8),
+                indptr=self.indptr,
+                indices=self.indices
+            )
+
+    @classmethod
+    def load(cls, file_path, content_hash=""):
+        """
+        Read gene sets written by save.
+        Returns None if the file is missing or was built from a different annotation file.
+        """
+        try:
+            with np.load(file_path) as data:
+                if str(data['content_hash']) != content_hash:
+                    return None
+                terms = data['terms'].tobytes().decode('utf-8').split(cls.STRING_SEPARATOR)[:int(data['n_terms'])]
+                genes = data['genes'].tobytes().decode('utf-8').split(cls.STRING_SEPARATOR)[:int(data['n_genes'])]
+                return cls(int(data['category']), terms, genes, data['indptr'], data['indices'])
+        except (OSError, ValueError, KeyError):
+            return None
@@ -2,18 +2,26 @@ import gseapy as gp
 import pandas as pd
 import numpy  as np
 import os
+import hashlib
 from pathlib import Path
-from typing import Union, Dict, List
+from typing import Any, Union, Dict, List
 import wormcat3.constants as cs
+from wormcat3.constants import GSEAEngine
 from wormcat3 import file_util
+from wormcat3.gene_sets import CategoryGeneSets
+from wormcat3.gsea_engine import NativePrerank, RankSumTest
+from wormcat3.gsea_result import GSEAResult
+from wormcat3.term_overlap import TermOverlap
+from wormcat3.result_cache import ResultCache
 
 
 class GSEAAnalyzer:
     """
-    A class to perform and manage Gene Set Enrichment Analysis (GSEA) using gseapy.
+    A class to perform and manage Gene Set Enrichment Analysis (GSEA) using gseapy
+    or the built-in NumPy engine.
     """
     
-    def __init__(self, output_dir: str = cs.DEFAULT_GSEA_RESULTS_DIR):
+    def __init__(self, output_dir: str = cs.DEFAULT_GSEA_RESULTS_DIR, *, use_cache: bool = False):
         """
         Initialize the GSEAAnalyzer.
         
@@ -21,10 +29,18 @@ class GSEAAnalyzer:
         -----------
         output_dir : str, optional
             Directory where GSEA results will be saved, default is 'gsea_results'
+        use_cache : bool, optional
+            Keep results in an on-disk cache keyed by the ranked list, the content of the
+            gene sets, the engine and the parameters, so an unchanged run returns them
+            without repeating the permutation test (default: False).
         """
         self.output_dir = output_dir
         self._ensure_output_directory()
         self.results = None
+        self.collection_results = None
+        self.gsea_result = None
+        self.collection_gsea_results = None
+        self.result_cache = ResultCache(cs.GSEA_RESULT_CACHE_NM) if use_cache else None
     
     def _ensure_output_directory(self) -> None:
         """Create output directory if it doesn't exist."""
@@ -33,7 +49,7 @@ class GSEAAnalyzer:
     
     def run_preranked_gsea(self, 
                            ranked_genes: Union[str, pd.DataFrame], 
-                           gene_sets: Union[str, Dict],
+                           gene_sets: Union[str, Dict, CategoryGeneSets],
                            output_dir: str,
                            *,
                            min_size: int = 15, 
@@ -42,7 +58,11 @@ class GSEAAnalyzer:
                            weight: float = 1.0,
                            seed: int = 123, 
                            threads: int = 4,
-                           verbose: bool = False) -> pd.DataFrame:
+                           verbose: bool = False,
+                           engine: GSEAEngine = GSEAEngine.GSEAPY,
+                           write_reports: bool = True,
+                           adaptive: bool = False,
+                           max_permutation_num: int = None) -> pd.DataFrame:
         """
         Perform pre-ranked GSEA analysis and return results as a DataFrame.
         
@@ -50,8 +70,9 @@ class GSEAAnalyzer:
         -----------
         ranked_genes : str or pd.DataFrame
             Ranked gene list. Can be a file path or a pandas DataFrame with 'Gene' and 'Rank' columns.
-        gene_sets : str or dict
-            Gene sets to analyze. Can be a GMT file path or a dictionary.
+        gene_sets : str, dict or CategoryGeneSets
+            Gene sets to analyze. Can be a GMT file path, a dictionary or (native engine
+            only) a CategoryGeneSets object.
         min_size : int, optional
             Minimum size of gene sets to analyze (default: 15).
         max_size : int, optional
@@ -66,6 +87,22 @@ class GSEAAnalyzer:
             Number of processes to use (default: 4).
         verbose : bool, optional
             Whether to display detailed output (default: True).
+        engine : GSEAEngine, optional
+            GSEAPY runs gseapy.prerank and writes its reports to output_dir; NATIVE runs the
+            built-in NumPy engine, which writes nothing and ignores threads (default: GSEAPY).
+        write_reports : bool, optional
+            Whether gseapy writes its report files and enrichment plots to output_dir. When
+            False nothing is written to disk; see plot_top_terms (default: True). A cached
+            result can't recreate the reports, so gseapy runs only use the result cache
+            without them.
+        adaptive : bool, optional
+            Native engine only: give each gene set its own number of permutations, stopping
+            early for clearly null sets and continuing up to max_permutation_num for the others;
+            the results then include a 'Permutations' column (default: False).
+        max_permutation_num : int, optional
+            With adaptive, the most permutations a gene set gets; it takes precedence over
+            permutation_num, which it must not be less than (default: ten times permutation_num).
+            Ignored without adaptive.
         
         Returns:
         --------
@@ -90,58 +127,360 @@ class GSEAAnalyzer:
             if not required_columns.issubset(ranked_genes.columns):
                 raise ValueError(f"ranked_genes DataFrame must contain columns: {required_columns}")
         
-        outdir = file_util.validate_directory_path(Path(self.output_dir)/output_dir)
+        if not isinstance(engine, GSEAEngine):
+            raise ValueError(f"Invalid engine: {engine}. Must be a valid GSEAEngine.")
+        
+        if adaptive and engine != GSEAEngine.NATIVE:
+            raise ValueError("Adaptive permutations require engine=GSEAEngine.NATIVE.")
+        
+        if engine == GSEAEngine.GSEAPY and isinstance(gene_sets, CategoryGeneSets):
+            gene_sets = gene_sets.to_gmt_format()
+        
+        params = {"min_size": min_size, "max_size": max_size, "permutation_num": permutation_num, "weight": weight, "seed": seed,
+                  "adaptive": adaptive, "max_permutation_num": max_permutation_num}
+        cache_key = None
+        if self.result_cache is not None and (engine == GSEAEngine.NATIVE or not write_reports):
+            cache_key = self._cache_key(engine, ranked_genes, {None: gene_sets}, params)
+            cached_results = self._load_cached_results(cache_key, [None], params)
+            if cached_results is not None:
+                self.results = cached_results[None]
+                return self._store_gsea_result(self.results, engine, params)
         
         try:
             # Run pre-ranked GSEA
-            prerank_results = gp.prerank(
-                rnk = ranked_genes,
-                gene_sets = gene_sets,
-                outdir = outdir,
-                min_size = min_size,
-                max_size = max_size,
-                permutation_num = permutation_num,
-                weight = weight,
-                seed = seed,
-                threads = threads,
-                verbose = verbose
-            )
+            if engine == GSEAEngine.NATIVE:
+                prerank_results = NativePrerank(**params).run(ranked_genes, gene_sets)
+            else:
+                # Without an outdir gseapy keeps the results in memory and writes no files
+                outdir = file_util.validate_directory_path(Path(self.output_dir)/output_dir) if write_reports else None
+                prerank_results = gp.prerank(
+                    rnk = ranked_genes,
+                    gene_sets = gene_sets,
+                    outdir = outdir,
+                    no_plot = not write_reports,
+                    min_size = min_size,
+                    max_size = max_size,
+                    permutation_num = permutation_num,
+                    weight = weight,
+                    seed = seed,
+                    threads = threads,
+                    verbose = verbose
+                )
 
             # Store the full results object
             self.results = prerank_results
+            if cache_key is not None:
+                self._save_cached_results(cache_key, {None: prerank_results})
             
-            # Extract relevant results into a DataFrame
-            results_list = []
-            for term in list(prerank_results.results):
-                term_results = prerank_results.results[term]
-                results_list.append([
-                    term,
-                    term_results['fdr'],
-                    term_results['es'],
-                    term_results['nes'],
-                    term_results['pval'],
-                    term_results['tag %']
-                ])
-            
-            # Create and sort the results DataFrame
-            results_df = pd.DataFrame(
-                results_list, 
-                columns=['Term', 'FDR', 'ES', 'NES', 'P-value', 'Tag %']
-            ).sort_values('FDR').reset_index(drop=True)
-            
-            return results_df
+            return self._store_gsea_result(prerank_results, engine, params)
             
         except Exception as e:
             raise RuntimeError(f"GSEA analysis failed: {str(e)}")
     
-    def get_enriched_terms(self, fdr_threshold: float = 0.25) -> pd.DataFrame:
+    def run_preranked_gsea_collections(self,
+                                       ranked_genes: Union[str, pd.DataFrame],
+                                       gene_set_collections: Dict[str, Union[str, Dict, CategoryGeneSets]],
+                                       *,
+                                       min_size: int = 15,
+                                       max_size: int = 500,
+                                       permutation_num: int = 1000,
+                                       weight: float = 1.0,
+                                       seed: int = 123,
+                                       adaptive: bool = False,
+                                       max_permutation_num: int = None) -> Dict[str, pd.DataFrame]:
+        """
+        Perform pre-ranked GSEA for several gene set collections against one shared null.
+        
+        Uses the native engine: one set of permutations of the ranked list is drawn and the
+        gene sets of every collection are scored against it in a single pass. Each collection
+        gets its own NES, p-values and FDR, identical to a separate native run with the same
+        seed. The full results objects are stored in collection_results and a GSEAResult for
+        each collection in collection_gsea_results.
+        
+        Parameters:
+        -----------
+        ranked_genes : str or pd.DataFrame
+            Ranked gene list. Can be a file path or a pandas DataFrame with 'Gene' and 'Rank' columns.
+        gene_set_collections : dict
+            Collection name (e.g. 'Category.1') to its gene sets, as accepted by run_preranked_gsea.
+        min_size, max_size, permutation_num, weight, seed, adaptive, max_permutation_num :
+            As for run_preranked_gsea.
+        
+        Returns:
+        --------
+        Dict[str, pd.DataFrame]
+            Collection name to a DataFrame of its GSEA results sorted by FDR.
+        
+        Raises:
+        -------
+        ValueError
+            If ranked_genes DataFrame doesn't have required columns.
+        RuntimeError
+            If GSEA analysis fails.
+        """
+        if isinstance(ranked_genes, pd.DataFrame):
+            required_columns = {'Gene', 'Rank'}
+            if not required_columns.issubset(ranked_genes.columns):
+                raise ValueError(f"ranked_genes DataFrame must contain columns: {required_columns}")
+        
+        params = {"min_size": min_size, "max_size": max_size, "permutation_num": permutation_num, "weight": weight, "seed": seed,
+                  "adaptive": adaptive, "max_permutation_num": max_permutation_num}
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self._cache_key(GSEAEngine.NATIVE, ranked_genes, gene_set_collections, params)
+            self.collection_results = self._load_cached_results(cache_key, list(gene_set_collections), params)
+            if self.collection_results is not None:
+                return self._store_collection_gsea_results(params)
+        
+        try:
+            self.collection_results = NativePrerank(**params).run_collections(ranked_genes, gene_set_collections)
+        except Exception as e:
+            raise RuntimeError(f"GSEA analysis failed: {str(e)}")
+        
+        if cache_key is not None:
+            self._save_cached_results(cache_key, self.collection_results)
+        
+        return self._store_collection_gsea_results(params)
+    
+    def run_category_gsea(self,
+                          ranked_genes: Union[str, pd.DataFrame],
+                          category_gene_sets: Dict[int, Union[str, Dict, CategoryGeneSets]],
+                          run_number: str,
+                          *,
+                          engine: GSEAEngine = GSEAEngine.GSEAPY,
+                          shared_null: bool = False,
+                          threads: int = 4,
+                          write_reports: bool = True,
+                          plot_top_n: int = 0,
+                          permutation_num: int = 1000,
+                          adaptive: bool = False,
+                          max_permutation_num: int = None) -> Dict[int, pd.DataFrame]:
+        """
+        Perform pre-ranked GSEA of one ranked list against the gene sets of each category level.
+        
+        With shared_null (native engine only) all levels are scored against one set of
+        permutations, otherwise each level is a separate run_preranked_gsea call whose
+        gseapy reports (unless write_reports is False) go to gsea_category_<level>_<run_number>.
+        plot_top_n renders enrichment plots for that many top terms of each level into the
+        same directory. permutation_num, adaptive and max_permutation_num (the last two native
+        engine only) are passed on to the runs, as for run_preranked_gsea.
+        The GSEAResult of each level is kept in collection_gsea_results.
+        
+        Returns:
+        --------
+        Dict[int, pd.DataFrame]
+            Category level to a DataFrame of its GSEA results sorted by FDR.
+        """
+        if shared_null:
+            category_results = self.run_preranked_gsea_collections(ranked_genes, category_gene_sets, permutation_num=permutation_num,
+                                                                   adaptive=adaptive, max_permutation_num=max_permutation_num)
+            if plot_top_n > 0:
+                for category, prerank_results in self.collection_results.items():
+                    self.plot_top_terms(plot_top_n, f"gsea_category_{category}_{run_number}", prerank_results=prerank_results)
+            return category_results
+        
+        category_results = {}
+        category_gsea_results = {}
+        for category, gene_sets in category_gene_sets.items():
+            results_name = f"gsea_category_{category}_{run_number}"
+            category_results[category] = self.run_preranked_gsea(ranked_genes, gene_sets, results_name, permutation_num=permutation_num, threads=threads,
+                                                                  engine=engine, write_reports=write_reports, adaptive=adaptive,
+                                                                  max_permutation_num=max_permutation_num)
+            category_gsea_results[category] = self.gsea_result
+            if plot_top_n > 0:
+                self.plot_top_terms(plot_top_n, results_name)
+        self.collection_gsea_results = category_gsea_results
+        return category_results
+    
+    def run_rank_sum_test(self,
+                          ranked_genes: Union[str, pd.DataFrame],
+                          gene_set_collections: Dict[str, Union[str, Dict, CategoryGeneSets]],
+                          *,
+                          min_size: int = 15,
+                          max_size: int = 500,
+                          correlation: float = cs.DEFAULT_RANK_TEST_CORRELATION) -> Dict[str, pd.DataFrame]:
+        """
+        Perform a competitive rank-sum test of every gene set in each collection.
+        
+        A closed-form, permutation free alternative to GSEA (see RankSumTest) that takes
+        milliseconds per collection, for a quick look at a contrast before a full GSEA run.
+        
+        Parameters:
+        -----------
+        ranked_genes : str or pd.DataFrame
+            Ranked gene list, as for run_preranked_gsea (e.g. from create_ranked_list).
+        gene_set_collections : dict
+            Collection name (e.g. a category level) to its gene sets, as accepted by run_preranked_gsea.
+        min_size, max_size : int
+            Gene set size limits, as for run_preranked_gsea.
+        correlation : float
+            Assumed correlation between the genes of a set; 0 gives the plain Wilcoxon test.
+        
+        Returns:
+        --------
+        Dict[str, pd.DataFrame]
+            Collection name to a DataFrame with Term, Size, Direction, Z, P-value and FDR, sorted by P-value.
+        """
+        rank_sum_test = RankSumTest(min_size=min_size, max_size=max_size, correlation=correlation)
+        return {name: rank_sum_test.run(ranked_genes, gene_sets) for name, gene_sets in gene_set_collections.items()}
+    
+    def plot_top_terms(self, top_n: int, output_dir: str, *, prerank_results = None, format: str = 'pdf') -> List[Path]:
+        """
+        Render enrichment plots for the top_n terms (lowest FDR, then highest |NES|) of a run.
+        
+        Plots the stored results of the last run_preranked_gsea call unless prerank_results
+        (a gseapy or native results object) is given. Files are named as gseapy names them,
+        in output_dir under the analyzer's output directory.
+        
+        Returns:
+        --------
+        List[Path]
+            The paths of the plots written.
+        
+        Raises:
+        -------
+        ValueError
+            If no analysis has been run yet.
+        """
+        if prerank_results is None:
+            prerank_results = self.results
+        if prerank_results is None:
+            raise ValueError("No GSEA analysis has been run yet. Call run_preranked_gsea first.")
+        
+        results_df = self._results_to_df(prerank_results)
+        results_df = results_df.assign(abs_nes=results_df['NES'].abs()).sort_values(['FDR', 'abs_nes'], ascending=[True, False])
+        plot_dir = Path(file_util.validate_directory_path(Path(self.output_dir)/output_dir, not_empty_check=False))
+        rank_metric = np.asarray(prerank_results.ranking, dtype=float)
+        
+        plot_paths = []
+        for term in results_df['Term'].head(top_n):
+            term_results = prerank_results.results[term]
+            if 'RES' in term_results:
+                running_es = term_results['RES']
+            else:
+                running_es = prerank_results.running_enrichment_score(term)
+            plot_path = plot_dir / f"{term.replace('/', '-').replace(':', '_')}.{format}"
+            gp.gseaplot(
+                term = term,
+                hits = term_results['hits'],
+                nes = term_results['nes'],
+                pval = term_results['pval'],
+                fdr = term_results['fdr'],
+                RES = running_es,
+                rank_metric = rank_metric,
+                ofname = str(plot_path)
+            )
+            plot_paths.append(plot_path)
+        
+        return plot_paths
+    
+    @staticmethod
+    def _cache_key(engine, ranked_genes, gene_set_collections, params):
+        """ Result cache key of a run: the engine, the ranked list, the content of the gene sets and the parameters. """
+        if isinstance(ranked_genes, str):
+            ranked_genes = file_util.file_content_hash(ranked_genes)
+        elif isinstance(ranked_genes, pd.DataFrame):
+            ranked_genes = ranked_genes[['Gene', 'Rank']]
+        
+        engine_version = gp.__version__ if engine == GSEAEngine.GSEAPY else ""
+        gene_set_hashes = tuple((name, GSEAAnalyzer._gene_sets_content_hash(gene_sets)) for name, gene_sets in gene_set_collections.items())
+        return ResultCache.make_key("prerank", engine.value, engine_version, ranked_genes, gene_set_hashes, tuple(sorted(params.items())))
+    
+    @staticmethod
+    def _gene_sets_content_hash(gene_sets):
+        """ Hash of the terms and member genes of a set of gene sets, whatever their form. """
+        if isinstance(gene_sets, str):
+            return file_util.file_content_hash(gene_sets)
+        if isinstance(gene_sets, CategoryGeneSets):
+            gene_sets = gene_sets.to_gmt_format()
+        
+        content_hash = hashlib.sha256()
+        for term, genes in gene_sets.items():
+            content_hash.update("\t".join([str(term), *map(str, genes)]).encode('utf-8'))
+            content_hash.update(b"\n")
+        return content_hash.hexdigest()
+    
+    def _save_cached_results(self, cache_key, collection_results):
+        """ Store the per-term results (leading edges included) and the ranking of a run. """
+        frames = {}
+        for name, prerank_results in collection_results.items():
+            # The running enrichment scores are recomputed when plotting rather than stored
+            results = {
+                term: {key: value for key, value in term_results.items() if key != 'RES'}
+                for term, term_results in prerank_results.results.items()
+            }
+            frames[f"results_{name}"] = pd.DataFrame.from_dict(results, orient='index')
+            frames['ranking'] = pd.Series(prerank_results.ranking).to_frame('Rank')
+        self.result_cache.put(cache_key, frames)
+    
+    def _load_cached_results(self, cache_key, names, params):
+        """ Return results objects by collection name for a cached run, or None if it isn't cached. """
+        frames = self.result_cache.get(cache_key)
+        if frames is None:
+            return None
+        
+        ranking = frames['ranking']['Rank']
+        return {
+            name: NativePrerank.from_results(ranking, frames[f"results_{name}"].to_dict(orient='index'), **params)
+            for name in names
+        }
+    
+    def _store_gsea_result(self, prerank_results, engine, params) -> pd.DataFrame:
+        """ Keep the GSEAResult of a run in gsea_result and return its results table. """
+        results_df = self._results_to_df(prerank_results)
+        self.gsea_result = GSEAResult.from_prerank(results_df, prerank_results, {**params, "engine": engine.value})
+        self.collection_gsea_results = None
+        return results_df
+    
+    def _store_collection_gsea_results(self, params) -> Dict[str, pd.DataFrame]:
+        """ Keep a GSEAResult per collection in collection_gsea_results and return their results tables. """
+        self.collection_gsea_results = {}
+        collection_dfs = {}
+        for name, prerank_results in self.collection_results.items():
+            collection_dfs[name] = self._results_to_df(prerank_results)
+            self.collection_gsea_results[name] = GSEAResult.from_prerank(collection_dfs[name], prerank_results,
+                                                                        {**params, "engine": GSEAEngine.NATIVE.value})
+        return collection_dfs
+    
+    @staticmethod
+    def _results_to_df(prerank_results) -> pd.DataFrame:
+        """Extract the per-term statistics of a prerank results object into a DataFrame sorted by FDR."""
+        results_list = []
+        for term in list(prerank_results.results):
+            term_results = prerank_results.results[term]
+            results_list.append([
+                term,
+                term_results['fdr'],
+                term_results['es'],
+                term_results['nes'],
+                term_results['pval'],
+                term_results['tag %']
+            ] + ([term_results['permutations']] if 'permutations' in term_results else []))
+        
+        columns = ['Term', 'FDR', 'ES', 'NES', 'P-value', 'Tag %']
+        if results_list and len(results_list[0]) > len(columns):
+            # Adaptive runs report the number of permutations of each term
+            columns.append('Permutations')
+        
+        return pd.DataFrame(
+            results_list, 
+            columns=columns
+        ).sort_values('FDR').reset_index(drop=True)
+    
+    def get_enriched_terms(self, fdr_threshold: float = 0.25, *, collection = None) -> pd.DataFrame:
         """
         Extract significantly enriched terms based on FDR threshold.
         
+        After run_category_gsea or run_preranked_gsea_collections the terms of every collection
+        are returned together, with the collection (category level) in a 'Category Level'
+        column and sorted by FDR, unless collection selects one of them.
+        
         Parameters:
         -----------
         fdr_threshold : float, optional
             FDR threshold for significance (default: 0.25).
+        collection : optional
+            Collection key (category level) of a collection run to restrict the results to.
         
         Returns:
         --------
@@ -151,22 +490,30 @@ class GSEAAnalyzer:
         Raises:
         -------
         ValueError
-            If no analysis has been run yet.
+            If no analysis has been run yet or the collection was not part of it.
         """
-        if self.results is None:
-            raise ValueError("No GSEA analysis has been run yet. Call run_preranked_gsea first.")
-        
-        results_df = self.run_preranked_gsea(None, None)  # This will reuse stored results
-        return results_df[results_df['FDR'] <= fdr_threshold]
+        gsea_results = self._require_gsea_results(collection)
+        if isinstance(gsea_results, GSEAResult):
+            return gsea_results.enriched_terms(fdr_threshold)
+        
+        enriched_dfs = [gsea_result.enriched_terms(fdr_threshold).assign(**{'Category Level': key}) for key, gsea_result in gsea_results.items()]
+        enriched_df = pd.concat(enriched_dfs, ignore_index=True)
+        enriched_df.insert(0, 'Category Level', enriched_df.pop('Category Level'))
+        return enriched_df.sort_values('FDR', kind='stable').reset_index(drop=True)
     
-    def get_leading_edge_genes(self, term: str) -> List[str]:
+    def get_leading_edge_genes(self, term: str, *, collection = None) -> List[str]:
         """
         Extract leading edge genes for a specific term.
         
+        After a collection run the term is looked up in every collection; collection is
+        needed when the same term name occurs in more than one of them.
+        
         Parameters:
         -----------
         term : str
             The pathway or gene set term.
+        collection : optional
+            Collection key (category level) of a collection run to look the term up in.
         
         Returns:
         --------
@@ -176,15 +523,93 @@ class GSEAAnalyzer:
         Raises:
         -------
         ValueError
-            If no analysis has been run or term doesn't exist.
+            If no analysis has been run, the term doesn't exist or it is ambiguous.
         """
-        if self.results is None:
-            raise ValueError("No GSEA analysis has been run yet. Call run_preranked_gsea first.")
+        gsea_results = self._require_gsea_results(collection)
+        if isinstance(gsea_results, GSEAResult):
+            return gsea_results.leading_edge_genes(term)
         
-        if term not in self.results.results:
+        keys = [key for key, gsea_result in gsea_results.items() if (gsea_result.results_df['Term'] == term).any()]
+        if not keys:
             raise ValueError(f"Term '{term}' not found in GSEA results.")
+        if len(keys) > 1:
+            raise ValueError(f"Term '{term}' is in several collections ({keys}); give the collection.")
+        return gsea_results[keys[0]].leading_edge_genes(term)
+    
+    def get_leading_edges(self, fdr_threshold: float = 0.25, *, collection = None) -> pd.DataFrame:
+        """
+        Export the leading edge genes of every significant term in one call.
+        
+        After a collection run the leading edges of every collection are returned together,
+        with the collection (category level) in a 'Category Level' column, unless collection
+        selects one of them.
+        
+        Parameters:
+        -----------
+        fdr_threshold : float, optional
+            FDR threshold for significance (default: 0.25).
+        collection : optional
+            Collection key (category level) of a collection run to restrict the results to.
+        
+        Returns:
+        --------
+        pd.DataFrame
+            One row per leading edge gene of each significant term, with columns Term and Gene.
         
-        return self.results.results[term]['lead_genes']
+        Raises:
+        -------
+        ValueError
+            If no analysis has been run yet or the collection was not part of it.
+        """
+        gsea_results = self._require_gsea_results(collection)
+        if isinstance(gsea_results, GSEAResult):
+            return gsea_results.leading_edges(fdr_threshold)
+        
+        leading_edge_dfs = [gsea_result.leading_edges(fdr_threshold) for gsea_result in gsea_results.values()]
+        for key, leading_edge_df in zip(gsea_results, leading_edge_dfs):
+            leading_edge_df.insert(0, 'Category Level', key)
+        return pd.concat(leading_edge_dfs, ignore_index=True)
+    
+    def get_term_overlap(self, fdr_threshold: float = 0.25) -> TermOverlap:
+        """
+        Leading-edge overlap between the significant terms of the last run, for finding
+        redundant terms (see TermOverlap). After run_category_gsea or
+        run_preranked_gsea_collections the terms of all collections are compared together.
+        
+        Parameters:
+        -----------
+        fdr_threshold : float, optional
+            FDR threshold for significance (default: 0.25).
+        
+        Returns:
+        --------
+        TermOverlap
+            Pairwise overlap coefficients and clusters of the significant terms.
+        
+        Raises:
+        -------
+        ValueError
+            If no analysis has been run yet.
+        """
+        return TermOverlap.from_gsea_results(self._require_gsea_results(), fdr_threshold)
+    
+    def _require_gsea_results(self, collection = None) -> Union[GSEAResult, Dict[Any, GSEAResult]]:
+        """
+        The GSEAResult of the last run: the results of a collection run by collection key,
+        or the result of one of its collections when collection is given.
+        """
+        if self.collection_gsea_results is not None:
+            if collection is None:
+                return self.collection_gsea_results
+            if collection not in self.collection_gsea_results:
+                raise ValueError(f"Collection '{collection}' not found in GSEA results. Available: {list(self.collection_gsea_results)}")
+            return self.collection_gsea_results[collection]
+        
+        if self.gsea_result is None:
+            raise ValueError("No GSEA analysis has been run yet. Call run_preranked_gsea first.")
+        if collection is not None:
+            raise ValueError("collection applies to the results of run_category_gsea or run_preranked_gsea_collections.")
+        return self.gsea_result
 
     @staticmethod
     def create_ranked_list(deseq2_output_df):
@@ -300,6 +725,10 @@ class GSEAAnalyzer:
         Check for duplicates in the 'Rank' column and make them unique by adding small values
         that won't change the overall sorting order.
         
+        Each group of tied ranks is spread below its rank, in its current order, over less
+        than half of the gap to the next smaller rank, so the order of the list is unchanged.
+        The adjustments of all groups are computed with array operations over the distinct ranks.
+        
         Parameters:
         -----------
         ranked_list : pandas.DataFrame
@@ -315,35 +744,43 @@ class GSEAAnalyzer:
         num_duplicates = duplicate_ranks.sum()
         
         if num_duplicates > 0:
+            ranks = ranked_list['Rank'].to_numpy(dtype=float)
+            
+            # Position of each rank among the distinct rank values, in ascending order
+            distinct_ranks = np.unique(ranks)
+            rank_positions = np.searchsorted(distinct_ranks, ranks)
+            distinct_sizes = np.bincount(rank_positions)
+            
+            # Calculate a small value that won't change the sorting order: a fraction of the
+            # difference to the next smaller rank value, or of the rank itself for the smallest rank.
+            # The next smaller rank of a tied group is the highest adjusted rank of the group below,
+            # so the gaps of adjacent tied groups are resolved by iterating to a fixed point; each
+            # pass settles at least one more group from the bottom up.
+            distinct_epsilon = np.empty(len(distinct_ranks))
+            distinct_epsilon[0] = abs(distinct_ranks[0]) / 1000000 if distinct_ranks[0] != 0 else 0.0000001
+            highest_adjusted = distinct_ranks.copy()
+            for _ in range(len(distinct_ranks)):
+                distinct_epsilon[1:] = np.abs(distinct_ranks[1:] - highest_adjusted[:-1]) / (distinct_sizes[1:] * 2)
+                next_highest_adjusted = np.where(
+                    distinct_sizes > 1,
+                    distinct_ranks - distinct_epsilon * 1 / (distinct_sizes + 1),
+                    distinct_ranks
+                )
+                if np.array_equal(next_highest_adjusted, highest_adjusted):
+                    break
+                highest_adjusted = next_highest_adjusted
+            
+            # Add incrementally larger adjustments down each group to maintain the original order
+            group_sizes = distinct_sizes[rank_positions]
+            order_in_group = pd.Series(rank_positions).groupby(rank_positions).cumcount().to_numpy()
+            adjustment = distinct_epsilon[rank_positions] * (order_in_group + 1) / (group_sizes + 1)
             
-            # Store original order to ensure we don't change it
-            ranked_list['original_order'] = range(len(ranked_list))
+            ranked_list = ranked_list.copy()
+            ranked_list['Rank'] = np.where(group_sizes > 1, ranks - adjustment, ranks)
             
-            # Group by Rank value to find duplicates
-            for rank, group in ranked_list[duplicate_ranks].groupby('Rank'):
-                
-                # Calculate a small value that won't change the sorting order
-                # Get the difference to the next smaller rank value
-                idx = ranked_list['Rank'].unique().tolist().index(rank)
-                if idx < len(ranked_list['Rank'].unique()) - 1:
-                    next_smaller_rank = sorted(ranked_list['Rank'].unique(), reverse=True)[idx + 1]
-                    epsilon = abs(rank - next_smaller_rank) / (len(group) * 2)
-                else:
-                    # If it's the smallest rank, use a small fraction of its absolute value
-                    epsilon = abs(rank) / 1000000 if rank != 0 else 0.0000001
-                    
-                # Add incrementally smaller values to maintain the original order
-                for i, (idx, row) in enumerate(group.iterrows()):
-                    # Smaller adjustment for higher ranks (preserves descending order)
-                    adjustment = epsilon * (i + 1) / (len(group) + 1)
-                    ranked_list.at[idx, 'Rank'] = rank - adjustment
-                    
             # Resort to ensure order is maintained
             ranked_list = ranked_list.sort_values(by='Rank', ascending=False)
             
-            # Remove the temporary column
-            ranked_list = ranked_list.drop('original_order', axis=1)
-            
             # Verify no duplicates remain
             assert ranked_list['Rank'].duplicated().sum() == 0, "Failed to remove all duplicate rank values"
             print("Successfully made all Rank values unique while preserving order")
@@ -352,3 +789,17 @@ class GSEAAnalyzer:
             
         return ranked_list
 
+
+def run_contrast_gsea(deseq2_file_path, category_gene_sets, output_dir, run_number, *, engine = GSEAEngine.GSEAPY, shared_null = False, threads = 4, 
+                      write_reports = True, plot_top_n = 0, use_cache = False, permutation_num = 1000, adaptive = False,
+                      max_permutation_num = None):
+    """
+    Rank one DESeq2 results file and run GSEA against each category level.
+    Module level so it can be sent to the worker processes of a GSEA batch.
+    """
+    deseq2_df = file_util.read_deseq2_file(deseq2_file_path)
+    gsea_analyzer = GSEAAnalyzer(output_dir, use_cache=use_cache)
+    ranked_list_df = gsea_analyzer.create_ranked_list(deseq2_df)
+    return gsea_analyzer.run_category_gsea(ranked_list_df, category_gene_sets, run_number, engine=engine, shared_null=shared_null,
+                                           threads=threads, write_reports=write_reports, plot_top_n=plot_top_n, permutation_num=permutation_num,
+                                           adaptive=adaptive, max_permutation_num=max_permutation_num)
@@ -0,0 +1,103 @@
+"""
+Stored results of a preranked GSEA run
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import List
+
+
+class GSEAResult:
+    """
+    The results of one preranked GSEA run in a compact, persistable form.
+
+    Keeps the results table (one row per term, sorted by FDR), the ranked genes,
+    the leading edge of every term as positions in the ranked list and the run
+    parameters. Filtering and leading-edge queries work on these arrays, so
+    they need neither the gseapy results object nor a new run.
+
+    The leading edges are stored like the rows of a sparse matrix: the positions
+    of all terms concatenated in lead_positions, with the edge of the term in
+    row i at lead_positions[lead_offsets[i]:lead_offsets[i + 1]].
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, results_df, genes, lead_positions, lead_offsets, params=None):
+        """ Initialize from the results table and the leading edges of its terms, in table order. """
+        assert len(lead_offsets) == len(results_df) + 1, "lead_offsets needs one entry per term plus one."
+        self.results_df = results_df.reset_index(drop=True)
+        self.genes = np.asarray(genes, dtype=object)
+        self.lead_positions = np.asarray(lead_positions, dtype=np.int32)
+        self.lead_offsets = np.asarray(lead_offsets, dtype=np.int64)
+        self.params = dict(params or {})
+        self._term_rows = pd.Index(self.results_df['Term'])
+
+    @classmethod
+    def from_prerank(cls, results_df, prerank_results, params=None):
+        """
+        Build from the results table of a run and its prerank results object
+        (from gseapy.prerank or NativePrerank).
+        """
+        genes = pd.Index(prerank_results.ranking.index)
+        lead_gene_lists = [
+            str(prerank_results.results[term]['lead_genes']).split(';')
+            for term in results_df['Term']
+        ]
+        lead_sizes = np.array([len(lead_genes) if lead_genes != [''] else 0 for lead_genes in lead_gene_lists])
+        all_lead_genes = [gene for lead_genes in lead_gene_lists if lead_genes != [''] for gene in lead_genes]
+
+        # One lookup for the leading edges of all terms
+        lead_positions = genes.get_indexer(all_lead_genes)
+        assert (lead_positions >= 0).all(), "Leading edge genes must be in the ranked list."
+        lead_offsets = np.concatenate([[0], np.cumsum(lead_sizes)])
+        return cls(results_df, genes, lead_positions, lead_offsets, params)
+
+    def enriched_terms(self, fdr_threshold: float = 0.25) -> pd.DataFrame:
+        """ The rows of the results table with FDR at or below fdr_threshold. """
+        return self.results_df[self.results_df['FDR'] <= fdr_threshold].reset_index(drop=True)
+
+    def leading_edge_genes(self, term: str) -> List[str]:
+        """ The leading edge genes of a term, in the order gseapy reports them. """
+        if term not in self._term_rows:
+            raise ValueError(f"Term '{term}' not found in GSEA results.")
+        row = self._term_rows.get_loc(term)
+        return self.genes[self.lead_positions[self.lead_offsets[row]:self.lead_offsets[row + 1]]].tolist()
+
+    def leading_edges(self, fdr_threshold: float = 0.25) -> pd.DataFrame:
+        """
+        The leading edge genes of every term with FDR at or below fdr_threshold in one long
+        table with a row per (Term, Gene), terms in the order of the results table.
+        """
+        rows = np.flatnonzero(self.results_df['FDR'].to_numpy(dtype=float) <= fdr_threshold)
+        starts = self.lead_offsets[rows]
+        sizes = self.lead_offsets[rows + 1] - starts
+
+        # Positions in lead_positions of the edges of the selected rows, without a loop over terms
+        row_starts = np.repeat(starts - np.concatenate([[0], np.cumsum(sizes)[:-1]]), sizes)
+        edge_indices = row_starts + np.arange(sizes.sum())
+        return pd.DataFrame({
+            'Term': np.repeat(self.results_df['Term'].to_numpy(dtype=object)[rows], sizes),
+            'Gene': self.genes[self.lead_positions[edge_indices]]
+        })
+
+    def save(self, file_path):
+        """ Write the result to a file (pickle format) and return its path. """
+        file_path = Path(file_path)
+        pd.to_pickle({
+            'format_version': self.FORMAT_VERSION,
+            'results_df': self.results_df,
+            'genes': self.genes,
+            'lead_positions': self.lead_positions,
+            'lead_offsets': self.lead_offsets,
+            'params': self.params
+        }, file_path)
+        return file_path
+
+    @classmethod
+    def load(cls, file_path):
+        """ Read a result written by save. """
+        stored = pd.read_pickle(file_path)
+        if not isinstance(stored, dict) or stored.get('format_version') != cls.FORMAT_VERSION:
+            raise ValueError(f"Not a stored GSEA result: {file_path}")
+        return cls(stored['results_df'], stored['genes'], stored['lead_positions'], stored['lead_offsets'], stored['params'])
@@ -0,0 +1,140 @@
+"""
+Sparse gene by category incidence matrix used for enrichment counting
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class CategoryIncidenceMatrix:
+    """
+    Sparse gene by term incidence matrix covering Category 1, 2 and 3 together.
+
+    Each annotation row has one entry per category level, so the hit counts of a
+    gene set for every term at every level come from a single sparse product.
+    Terms are laid out level by level; term_slices gives the columns of each level.
+
+    Rows of an annotated gene set are matched to matrix rows by their annotation
+    row, which the annotations manager keeps as the index (named ROW_INDEX_NAME)
+    of the annotations and of every gene set annotated from them. A gene may be
+    annotated on several rows with different categories, so its gene ID alone
+    does not identify a row; frames without that index are matched on the gene
+    ID and all three categories instead.
+    """
+
+    GENE_COLUMN = "Wormbase.ID"
+    CATEGORIES = [1, 2, 3]
+    ROW_INDEX_NAME = "Annotation.Row"
+
+    def __init__(self, annotations_df):
+        """Build the incidence matrix from an annotation dataframe."""
+        missing_cols = [col for col in [self.GENE_COLUMN] + self.category_columns() if col not in annotations_df.columns]
+        if missing_cols:
+            raise ValueError(f"Missing required columns: {', '.join(missing_cols)}")
+
+        n_rows = len(annotations_df)
+        terms = []
+        self.term_slices = {}
+        row_term_codes = []
+        offset = 0
+        for category in self.CATEGORIES:
+            codes, uniques = pd.factorize(annotations_df[f"Category.{category}"], sort=True)
+
+            # Rows without a category at this level get no entry
+            row_term_codes.append(np.where(codes >= 0, codes + offset, -1))
+            terms.extend(np.asarray(uniques, dtype=object))
+            self.term_slices[category] = slice(offset, offset + len(uniques))
+            offset += len(uniques)
+
+        rows = np.repeat(np.arange(n_rows), len(self.CATEGORIES))
+        cols = np.column_stack(row_term_codes).ravel()
+        has_term = cols >= 0
+        self.matrix = sparse.csr_matrix(
+            (np.ones(has_term.sum(), dtype=np.int64), (rows[has_term], cols[has_term])),
+            shape=(n_rows, offset)
+        )
+        self.terms = np.array(terms, dtype=object)
+
+        # Matrix rows by annotation row; None when they are the annotation rows themselves
+        row_ids = annotations_df.index
+        if row_ids.name == self.ROW_INDEX_NAME and not row_ids.equals(pd.RangeIndex(n_rows)):
+            self._row_ids = pd.Index(row_ids)
+        else:
+            self._row_ids = None
+
+        # Matrix rows by gene ID and categories, for frames without annotation rows
+        row_keys = self._row_keys(annotations_df)
+        first_occurrence = ~row_keys.duplicated()
+        self._row_key_lookup = row_keys[first_occurrence]
+        self._row_key_positions = np.flatnonzero(first_occurrence)
+
+    @classmethod
+    def category_columns(cls):
+        return [f"Category.{category}" for category in cls.CATEGORIES]
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def row_counts(self, annotated_df):
+        """
+        Count how many rows of an annotated dataframe fall on each annotation row.
+        Rows whose gene ID is not in the matrix are ignored.
+        """
+        return np.bincount(self._row_positions_for(annotated_df), minlength=self.matrix.shape[0])
+
+    def row_counts_matrix(self, annotated_dfs):
+        """
+        Sparse matrix of per-row gene counts with one column per annotated dataframe,
+        for counting many gene sets in a single product.
+        """
+        positions = []
+        columns = []
+        for column, annotated_df in enumerate(annotated_dfs):
+            set_positions = self._row_positions_for(annotated_df)
+            positions.append(set_positions)
+            columns.append(np.full(len(set_positions), column))
+
+        positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+        columns = np.concatenate(columns) if columns else np.empty(0, dtype=np.int64)
+        return sparse.csc_matrix(
+            (np.ones(len(positions), dtype=np.int64), (positions, columns)),
+            shape=(self.matrix.shape[0], len(annotated_dfs))
+        )
+
+    def term_counts(self, row_counts):
+        """
+        Return the number of genes per term given per-row gene counts.
+        row_counts may be a vector or a matrix with one column per gene set.
+        """
+        return self.matrix.T @ row_counts
+
+    def term_levels(self):
+        """ Return the category level of each term column. """
+        levels = np.empty(len(self.terms), dtype=np.int64)
+        for category, term_slice in self.term_slices.items():
+            levels[term_slice] = category
+        return levels
+
+    def level_counts(self, term_counts, category):
+        """ Return the counts for one category level as a Series indexed by term. """
+        term_slice = self.term_slices[category]
+        return pd.Series(term_counts[term_slice], index=self.terms[term_slice])
+
+    def _row_positions_for(self, annotated_df):
+        """ Matrix row of each row of an annotated dataframe, skipping rows not in the matrix. """
+        if annotated_df.index.name == self.ROW_INDEX_NAME:
+            row_ids = annotated_df.index.to_numpy()
+            if self._row_ids is None:
+                return row_ids[(row_ids >= 0) & (row_ids < self.matrix.shape[0])]
+            positions = self._row_ids.get_indexer(row_ids)
+            return positions[positions >= 0]
+
+        lookup = self._row_key_lookup.get_indexer(self._row_keys(annotated_df))
+        return self._row_key_positions[lookup[lookup >= 0]]
+
+    def _row_keys(self, annotated_df):
+        """ The gene ID and categories of each row, with missing categories as empty strings. """
+        key_columns = [self.GENE_COLUMN] + self.category_columns()
+        keys_df = annotated_df[key_columns].astype(object)
+        return pd.MultiIndex.from_frame(keys_df.where(keys_df.notna(), ""))
@@ -0,0 +1,84 @@
+"""
+Output sinks for the tables produced by a Wormcat run
+"""
+import importlib.util
+from pathlib import Path
+from wormcat3.constants import OutputMode
+
+
+class OutputSink:
+    """
+    Destination for the intermediate tables of a Wormcat run.
+
+    Callers hand every table to write() with the CSV path it has always been
+    saved under; the sink decides whether and how it is stored and returns the
+    path the table is known by.
+    """
+
+    def write(self, df, file_path):
+        """ Store a table and return its path. """
+        raise NotImplementedError
+
+
+class CsvSink(OutputSink):
+    """ Write tables as CSV files (the default). """
+
+    def write(self, df, file_path):
+        df.to_csv(file_path, index=False)
+        return Path(file_path)
+
+
+class ParquetSink(OutputSink):
+    """ Write tables as Parquet files next to where the CSV would have been. """
+
+    def __init__(self):
+        """ Parquet output needs the optional pyarrow dependency. """
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("Parquet output requires pyarrow. Install it with: pip install wormcat3[parquet]")
+
+    def write(self, df, file_path):
+        parquet_file_path = Path(file_path).with_suffix(".parquet")
+        df.to_parquet(parquet_file_path, index=False)
+        return parquet_file_path
+
+
+class MemorySink(OutputSink):
+    """ Keep tables in memory, keyed by file name, instead of writing them. """
+
+    def __init__(self):
+        self.frames = {}
+
+    def write(self, df, file_path):
+        file_path = Path(file_path)
+        self.frames[file_path.name] = df
+        return file_path
+
+    def get(self, file_nm):
+        """ Return a stored table by file name, or None if it was not written. """
+        return self.frames.get(file_nm)
+
+
+class NullSink(OutputSink):
+    """ Discard tables; results are only returned to the caller. """
+
+    def write(self, df, file_path):
+        return Path(file_path)
+
+
+def create_output_sink(output_mode=OutputMode.CSV):
+    """ Return the output sink for an OutputMode (or its value, e.g. 'parquet'). """
+    if isinstance(output_mode, OutputSink):
+        return output_mode
+
+    try:
+        output_mode = OutputMode(output_mode)
+    except ValueError:
+        raise ValueError(f"Invalid output_mode: {output_mode}. Must be one of {[mode.value for mode in OutputMode]}.")
+
+    sinks = {
+        OutputMode.CSV: CsvSink,
+        OutputMode.PARQUET: ParquetSink,
+        OutputMode.MEMORY: MemorySink,
+        OutputMode.NONE: NullSink
+    }
+    return sinks[output_mode]()
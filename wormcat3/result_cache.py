@@ -0,0 +1,158 @@
+"""
+Content-addressed on-disk cache for analysis results
+"""
+import os
+import hashlib
+import warnings
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from wormcat3 import file_util
+import wormcat3.constants as cs
+
+
+class ResultCache:
+    """
+    Content-addressed cache of analysis results.
+
+    An entry is a dictionary of named DataFrames stored under a key that hashes
+    everything the result depends on (see make_key), so a changed input or
+    parameter simply misses. Entries live as one file each in a named directory
+    under the Wormcat cache directory; when their total size exceeds
+    max_size_bytes the least recently used entries are evicted.
+
+    hits and misses count the lookups made through this instance.
+    """
+
+    CACHE_FORMAT_VERSION = 2
+    ENTRY_SUFFIX = ".pkl"
+
+    def __init__(self, name, *, cache_dir_path=None, max_size_bytes=cs.DEFAULT_RESULT_CACHE_MAX_BYTES):
+        """Initialize the cache stored in the named sub-directory of the cache directory."""
+        assert max_size_bytes > 0, "max_size_bytes must be positive."
+        cache_root_path = Path(cache_dir_path) if cache_dir_path else file_util.get_cache_dir_path()
+        self.cache_dir_path = cache_root_path / name
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Hash the parts a result depends on into a cache key.
+        Parts may be DataFrames, Series, NumPy arrays, strings, numbers, None or tuples of these.
+        """
+        key_hash = hashlib.sha256(f"v{ResultCache.CACHE_FORMAT_VERSION}".encode('utf-8'))
+        for part in parts:
+            key_hash.update(ResultCache._part_bytes(part))
+            key_hash.update(b"\x1f")
+        return key_hash.hexdigest()
+
+    def get(self, key):
+        """ Return the DataFrames stored under key, or None if there is no usable entry. """
+        frames = self._read_entry(key)
+        if frames is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return frames
+
+    def stats(self):
+        """ Return the hit and miss counts of this instance and the size of the stored entries. """
+        return {'hits': self.hits, 'misses': self.misses, 'size_bytes': self.size_bytes()}
+
+    def put(self, key, frames):
+        """
+        Store a dictionary of named DataFrames under key and evict old entries if the cache is full.
+        Returns True if the entry was written; a failure to write is not fatal.
+        """
+        entry_file_path = self._entry_file_path(key)
+        tmp_file_path = entry_file_path.with_name(f"{entry_file_path.name}.tmp{os.getpid()}")
+        try:
+            self.cache_dir_path.mkdir(parents=True, exist_ok=True)
+            pd.to_pickle({'format_version': self.CACHE_FORMAT_VERSION, 'frames': frames}, tmp_file_path)
+            os.replace(tmp_file_path, entry_file_path)
+        except OSError as e:
+            warnings.warn(f"Result cache not written: {e}", RuntimeWarning, stacklevel=2)
+            if tmp_file_path.exists():
+                tmp_file_path.unlink()
+            return False
+
+        self._evict(keep=entry_file_path)
+        return True
+
+    def size_bytes(self):
+        """ Total size of the stored entries. """
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        """ Remove every entry. """
+        for entry_file_path, _, _ in self._entries():
+            entry_file_path.unlink(missing_ok=True)
+
+    def _read_entry(self, key):
+        """ The DataFrames of the entry stored under key, or None if it is missing or unusable. """
+        entry_file_path = self._entry_file_path(key)
+        try:
+            entry = pd.read_pickle(entry_file_path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A truncated or unreadable entry is a miss, not an error
+            warnings.warn(f"Result cache entry ignored: {e}", RuntimeWarning, stacklevel=3)
+            return None
+
+        if not isinstance(entry, dict) or entry.get('format_version') != self.CACHE_FORMAT_VERSION:
+            return None
+
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(entry_file_path)
+        except OSError:
+            pass
+        return entry['frames']
+
+    def _entry_file_path(self, key):
+        return self.cache_dir_path / f"{key}{self.ENTRY_SUFFIX}"
+
+    def _entries(self):
+        """ Return (path, size, last used time) for every entry. """
+        entries = []
+        if not self.cache_dir_path.exists():
+            return entries
+        for entry_file_path in self.cache_dir_path.glob(f"*{self.ENTRY_SUFFIX}"):
+            try:
+                stat = entry_file_path.stat()
+            except OSError:
+                continue
+            entries.append((entry_file_path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def _evict(self, keep=None):
+        """ Remove the least recently used entries until the cache fits in max_size_bytes. """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in entries)
+        for entry_file_path, size, _ in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            if entry_file_path == keep:
+                continue
+            entry_file_path.unlink(missing_ok=True)
+            total_size -= size
+
+    @staticmethod
+    def _part_bytes(part):
+        """ Canonical bytes of one key part. """
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            values = pd.util.hash_pandas_object(part, index=isinstance(part, pd.Series)).to_numpy()
+            names = list(part.columns) if isinstance(part, pd.DataFrame) else [part.name]
+            return f"{type(part).__name__}{names}".encode('utf-8') + values.tobytes()
+        if isinstance(part, np.ndarray):
+            if part.dtype == object:
+                return ResultCache._part_bytes(pd.Series(part))
+            return f"ndarray{part.dtype}{part.shape}".encode('utf-8') + np.ascontiguousarray(part).tobytes()
+        if isinstance(part, tuple):
+            return b"(" + b"\x1e".join(ResultCache._part_bytes(item) for item in part) + b")"
+        if isinstance(part, bytes):
+            return part
+        return repr(part).encode('utf-8')
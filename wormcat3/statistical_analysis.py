@@ -1,19 +1,66 @@
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from scipy.stats import fisher_exact
+from scipy.stats import hypergeom
 from statsmodels.stats.multitest import multipletests
 import wormcat3.constants as cs
 from wormcat3.constants import PAdjustMethod
+from wormcat3.incidence_matrix import CategoryIncidenceMatrix
+from wormcat3.output_sink import create_output_sink
     
 class EnrichmentAnalyzer:
     """Performs statistical enrichment analysis."""
     
-    def __init__(self, annotations_df, output_dir, run_number=""):
-        """Initialize with annotation dataframe and output directory."""
-        self.annotations_df = annotations_df
+    def __init__(self, annotations_df, output_dir, run_number="", *, incidence_matrix=None, background_profile=None, output_sink=None):
+        """
+        Initialize with the background annotation dataframe and output directory.
+        
+        incidence_matrix is the gene by term CategoryIncidenceMatrix used for counting,
+        normally the one for the whole annotation file. If it is not given one is built
+        from annotations_df, in which case gene set genes outside the background are not counted.
+        
+        background_profile is an optional precomputed BackgroundProfile; when given, its
+        annotation rows, incidence matrix and category totals are used and annotations_df may be None.
+        
+        output_sink is the OutputSink the result tables are written to; CSV files by default.
+        The Fisher test tables of the last run are also kept in fisher_results by category,
+        and the paths they were written to in fisher_result_paths.
+        """
         self.output_dir = output_dir
+        self.output_sink = output_sink if output_sink is not None else create_output_sink()
+        self.fisher_results = {}
+        self.fisher_result_paths = {}
         self.run_number = run_number
         self.categories = [1, 2, 3]  # Wormcat Categories
+        self._background_term_counts = None
+        
+        if background_profile is not None:
+            annotations_df = background_profile.annotated_df
+            if incidence_matrix is None:
+                incidence_matrix = background_profile.incidence_matrix
+            if incidence_matrix is background_profile.incidence_matrix:
+                self._background_term_counts = background_profile.term_counts
+        
+        self.annotations_df = annotations_df
+        self.incidence_matrix = incidence_matrix
+    
+    def _get_incidence_matrix(self):
+        """ Return the incidence matrix, building it from the background if none was given. """
+        if self.incidence_matrix is None:
+            self.incidence_matrix = CategoryIncidenceMatrix(self.annotations_df)
+        return self.incidence_matrix
+    
+    def _get_background_term_counts(self):
+        """ Per-term totals of the background, computed once per analyzer. """
+        if self._background_term_counts is None:
+            incidence_matrix = self._get_incidence_matrix()
+            self._background_term_counts = incidence_matrix.term_counts(incidence_matrix.row_counts(self.annotations_df))
+        return self._background_term_counts
+    
+    def _get_term_counts(self, gene_set_and_categories_df):
+        """ Per-term gene set counts for every category level from one sparse product. """
+        incidence_matrix = self._get_incidence_matrix()
+        return incidence_matrix.term_counts(incidence_matrix.row_counts(gene_set_and_categories_df))
     
     def perform_enrichment_test(self, gene_set_and_categories_df, p_adjust_method=PAdjustMethod.BONFERRONI, p_adjust_threshold=0.01):
         """Run enrichment test for all categories."""
@@ -21,9 +68,10 @@ class EnrichmentAnalyzer:
         assert 0 < p_adjust_threshold <= 1, "p_adjust_threshold must be between 0 and 1 (exclusive lower, inclusive upper)."
                 
         enrichment_scores_list = []
+        gene_set_term_counts = self._get_term_counts(gene_set_and_categories_df)
         
         for category in self.categories:
-            fisher_cat_df = self._run_fisher_test(gene_set_and_categories_df, category)
+            fisher_cat_df = self._run_fisher_test(gene_set_and_categories_df, category, gene_set_term_counts)
             fisher_cat_adjusted_df = self._adjust_pvalues(
                 fisher_cat_df, 
                 category, 
@@ -34,56 +82,159 @@ class EnrichmentAnalyzer:
             
         return enrichment_scores_list
     
-    def _run_fisher_test(self, gene_set_and_categories_df, category):
+    def restore_enrichment_test(self, fisher_results, adjusted_results, p_adjust_method=PAdjustMethod.BONFERRONI):
+        """
+        Write and return the results of an earlier enrichment test under this analyzer's run
+        number, in the form perform_enrichment_test returns them, without testing again.
+        
+        fisher_results and adjusted_results hold that test's Fisher and adjusted tables by
+        category; a category without an adjusted table had no p-values to adjust.
+        """
+        
+        enrichment_scores_list = []
+        for category in self.categories:
+            fisher_cat_df = fisher_results[category]
+            self._save_fisher_results(fisher_cat_df, category)
+            if category in adjusted_results:
+                enrichment_scores_list.append(self._save_adjusted_results(adjusted_results[category], category, p_adjust_method.value))
+            else:
+                enrichment_scores_list.append(fisher_cat_df.dropna())
+        
+        return enrichment_scores_list
+    
+    def perform_batch_enrichment_test(self, gene_sets_and_categories, p_adjust_method=PAdjustMethod.BONFERRONI, p_adjust_threshold=0.01):
+        """
+        Run the enrichment test for many gene sets against the same background in one pass.
+        
+        gene_sets_and_categories maps each gene set name to its annotated gene set dataframe.
+        Counts for all gene sets and all categories come from one sparse matrix product, and the
+        p-values and their adjustment (per gene set and category level) are computed over arrays.
+        Returns a long-format dataframe with one row per gene set and enriched category.
+        """
+        
+        assert 0 < p_adjust_threshold <= 1, "p_adjust_threshold must be between 0 and 1 (exclusive lower, inclusive upper)."
+        if not isinstance(p_adjust_method, PAdjustMethod):
+            raise ValueError(f"Invalid p_adjust_method: {p_adjust_method}. Must be a valid PAdjustMethod.")
+        
+        gene_set_names = list(gene_sets_and_categories)
+        gene_set_dfs = list(gene_sets_and_categories.values())
+        padj_col = 'Bonferroni' if p_adjust_method == PAdjustMethod.BONFERRONI else 'FDR'
+        
+        incidence_matrix = self._get_incidence_matrix()
+        term_counts = incidence_matrix.term_counts(incidence_matrix.row_counts_matrix(gene_set_dfs))
+        term_counts = np.asarray(term_counts.todense())
+        background_counts = self._get_background_term_counts()
+        
+        # Test every (term, gene set) pair where the gene set has at least one gene in the term
+        term_idx, set_idx = np.nonzero(term_counts)
+        gene_set_sizes = np.array([len(gene_set_df) for gene_set_df in gene_set_dfs])
+        term_levels = incidence_matrix.term_levels()[term_idx]
+        
+        ac = background_counts[term_idx].astype(float)
+        ac[ac == 0] = np.nan
+        pvalues = self._fisher_exact_greater(term_counts[term_idx, set_idx], gene_set_sizes[set_idx], ac, len(self.annotations_df))
+        
+        batch_df = pd.DataFrame({
+            "Gene Set": np.asarray(gene_set_names, dtype=object)[set_idx],
+            "Category Level": term_levels,
+            "Category": incidence_matrix.terms[term_idx],
+            "RGS": term_counts[term_idx, set_idx],
+            "AC": pd.array(ac, dtype="Int64"),
+            "PValue": pvalues
+        })
+        batch_df = batch_df.dropna(subset=["PValue"]).reset_index(drop=True)
+        
+        # Adjust within each gene set and category level, as the single gene set test does
+        groups = set_idx[~np.isnan(pvalues)] * len(self.categories) + batch_df["Category Level"].to_numpy()
+        batch_df[padj_col] = self._adjust_pvalues_grouped(batch_df["PValue"].to_numpy(), groups, method=p_adjust_method.value)
+        
+        batch_df = batch_df[batch_df[padj_col] < p_adjust_threshold]
+        batch_df = batch_df.sort_values(by=["Gene Set", "Category Level", "PValue", "Category"], kind="stable", ignore_index=True)
+        
+        # Save results
+        output_file_path = Path(self.output_dir) / f"batch_padj_{p_adjust_method.value[:3]}_{self.run_number}.csv"
+        self.output_sink.write(batch_df, output_file_path)
+        
+        return batch_df
+    
+    @staticmethod
+    def _adjust_pvalues_grouped(pvalues, groups, *, method='bonferroni'):
+        """
+        Adjust p-values independently within each group.
+        Gives the same values as statsmodels' multipletests applied to each group separately.
+        """
+        if method not in {'bonferroni', 'fdr_bh'}:
+            raise ValueError("Invalid method. Choose either 'bonferroni' or 'fdr_bh'.")
+        
+        pvalues = np.asarray(pvalues, dtype=float)
+        if len(pvalues) == 0:
+            return pvalues.copy()
+        
+        # Sort by group, then by p-value within each group
+        order = np.lexsort((pvalues, groups))
+        sorted_pvalues = pvalues[order]
+        sorted_groups = np.asarray(groups)[order]
+        
+        group_starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(sorted_pvalues)])
+        n_tests = np.repeat(group_sizes, group_sizes).astype(float)
+        
+        if method == 'bonferroni':
+            adjusted = sorted_pvalues * n_tests
+        else:
+            rank = np.arange(1, len(sorted_pvalues) + 1) - np.repeat(group_starts, group_sizes)
+            adjusted = sorted_pvalues / (rank / n_tests)
+            # Running minimum from the largest p-value down, restarting at each group
+            adjusted = pd.Series(adjusted[::-1]).groupby(sorted_groups[::-1], sort=False).cummin().to_numpy()[::-1]
+        
+        adjusted_pvalues = np.empty_like(adjusted)
+        adjusted_pvalues[order] = np.minimum(adjusted, 1.0)
+        return adjusted_pvalues
+    
+    def _run_fisher_test(self, gene_set_and_categories_df, category, gene_set_term_counts=None):
         """Run Fisher's exact test for a specific category."""
-        category_column = f"Category.{category}"
         total_annotations_count = len(self.annotations_df)
         total_gene_set_count = len(gene_set_and_categories_df)
         
-        gene_set_category_df = gene_set_and_categories_df[category_column].value_counts().reset_index()
-        annotated_category_df = self.annotations_df[category_column].value_counts().reset_index()
+        if gene_set_term_counts is None:
+            gene_set_term_counts = self._get_term_counts(gene_set_and_categories_df)
         
-        merged_categories_df = pd.merge(
-            gene_set_category_df, 
-            annotated_category_df, 
-            how="left", 
-            left_on=category_column, 
-            right_on=category_column
-        )
-        merged_categories_df = merged_categories_df.rename(
-            columns={category_column: "Category", "count_x": "RGS", "count_y": "AC"}
-        )
+        incidence_matrix = self._get_incidence_matrix()
+        rgs_counts = incidence_matrix.level_counts(gene_set_term_counts, category)
+        ac_counts = incidence_matrix.level_counts(self._get_background_term_counts(), category)
         
-        # Initialize results dataframe
-        fisher_cat_df = pd.DataFrame(columns=["Category", "RGS", "AC", "PValue"])
+        # Only categories present in the gene set are tested; categories absent
+        # from the background have no AC and get no p-value
+        in_gene_set = rgs_counts.to_numpy() > 0
+        fisher_cat_df = pd.DataFrame({
+            "Category": rgs_counts.index[in_gene_set],
+            "RGS": rgs_counts.to_numpy()[in_gene_set],
+            "AC": ac_counts.to_numpy()[in_gene_set]
+        })
+        fisher_cat_df = fisher_cat_df.sort_values(by=["RGS", "Category"], ascending=[False, True], ignore_index=True)
+        if (fisher_cat_df["AC"] == 0).any():
+            fisher_cat_df["AC"] = fisher_cat_df["AC"].astype("Int64").mask(fisher_cat_df["AC"] == 0)
         
-        # Iterate over each row of the merged data
-        for _, row in merged_categories_df.iterrows():
-            rgs_value = row["RGS"]
-            ac_value = row["AC"]
-            
-            if pd.isna(rgs_value) or pd.isna(ac_value):
-                pvalue = None
-            else:
-                contingency_table = self._create_contingency(
-                    rgs_value, 
-                    total_gene_set_count, 
-                    ac_value, 
-                    total_annotations_count
-                )
-                _, pvalue = fisher_exact(contingency_table, alternative="greater")
-                print(f"{rgs_value=}, {total_gene_set_count=}, {ac_value=}, {total_annotations_count=}")
-            
-            df_row = {"Category": row["Category"], "RGS": rgs_value, "AC": ac_value, "PValue": pvalue}
-            fisher_cat_df.loc[len(fisher_cat_df)] = df_row
+        # Compute the one-sided Fisher's exact test for every category at once
+        fisher_cat_df["PValue"] = self._fisher_exact_greater(
+            fisher_cat_df["RGS"].to_numpy(dtype=float), 
+            total_gene_set_count, 
+            fisher_cat_df["AC"].to_numpy(dtype=float, na_value=np.nan), 
+            total_annotations_count
+        )
         
         # Sort and save
-        fisher_cat_df = fisher_cat_df.sort_values(by="PValue")
-        fisher_cat_file_path = Path(self.output_dir) / f"category_{category}_fisher_{self.run_number}.csv"
-        fisher_cat_df.to_csv(fisher_cat_file_path, index=False)
+        fisher_cat_df = fisher_cat_df.sort_values(by="PValue", kind="stable")
+        self._save_fisher_results(fisher_cat_df, category)
         
         return fisher_cat_df
     
+    def _save_fisher_results(self, fisher_cat_df, category):
+        """Write a category's Fisher test table and keep it in fisher_results."""
+        fisher_cat_file_path = Path(self.output_dir) / f"category_{category}_fisher_{self.run_number}.csv"
+        self.fisher_result_paths[category] = self.output_sink.write(fisher_cat_df, fisher_cat_file_path)
+        self.fisher_results[category] = fisher_cat_df
+    
     def _adjust_pvalues(self, fisher_cat_df, category, *, method='bonferroni', threshold=0.01):
         """Adjust p-values using the specified method."""
         
@@ -110,13 +261,70 @@ class EnrichmentAnalyzer:
         # Filter by threshold
         fisher_cat_adjusted_df = fisher_cat_adjusted_df[fisher_cat_adjusted_df[padj_col] < threshold]
         
-        # Save results
+        return self._save_adjusted_results(fisher_cat_adjusted_df, category, method)
+    
+    def _save_adjusted_results(self, fisher_cat_adjusted_df, category, method):
+        """Write a category's adjusted table and return it keyed by its path."""
         output_file_path = Path(self.output_dir) / f"category_{category}_padj_{method[:3]}_{self.run_number}.csv"
-        fisher_cat_adjusted_df.to_csv(output_file_path, index=False)
+        output_file_path = self.output_sink.write(fisher_cat_adjusted_df, output_file_path)
         
         return {output_file_path: fisher_cat_adjusted_df}
     
     
+    @staticmethod
+    def _fisher_exact_greater(genes_in_both, gene_set_size, category_size, background_size):
+        """
+        Vectorized one-sided (greater) Fisher's exact test.
+        
+        Evaluates the hypergeometric tail for every category at once and returns the
+        same p-values as scipy.stats.fisher_exact(table, alternative="greater") applied to
+        each contingency table. Entries with a missing count get a NaN p-value.
+        
+        Parameters:
+        - genes_in_both: Array with the number of genes in both the gene set and each category
+        - gene_set_size: Total number of genes in the gene set (a scalar or an array matching genes_in_both)
+        - category_size: Array with the total number of genes in each category
+        - background_size: Total number of genes in the background
+        
+        Returns:
+        - An array of p-values
+        """
+        genes_in_both, gene_set_size, category_size = np.broadcast_arrays(
+            np.asarray(genes_in_both, dtype=float), 
+            np.asarray(gene_set_size, dtype=float), 
+            np.asarray(category_size, dtype=float)
+        )
+        pvalues = np.full(genes_in_both.shape, np.nan)
+        
+        valid = ~(np.isnan(genes_in_both) | np.isnan(category_size))
+        if not valid.any():
+            return pvalues
+        
+        a = genes_in_both[valid].astype(np.int64)
+        gene_set_size = gene_set_size[valid].astype(np.int64)
+        category_size = category_size[valid].astype(np.int64)
+        
+        assert background_size >= 0 and (a >= 0).all() and (gene_set_size >= 0).all() and (category_size >= 0).all(), \
+            "All input values must be non-negative integers."
+        assert (a <= category_size).all(), "genes_in_both cannot exceed category_size."
+        assert (a <= gene_set_size).all(), "genes_in_both cannot exceed gene_set_size."
+        assert (category_size <= background_size).all(), "category_size cannot exceed background_size."
+        assert (gene_set_size <= background_size).all(), "gene_set_size cannot exceed background_size."
+        
+        b = gene_set_size - a  # In gene set but not in category
+        
+        # Same formulation as scipy's fisher_exact: the lower tail of the second column
+        # of [[a, b], [c, d]], whose column total is background_size - category_size
+        not_in_category_size = background_size - category_size
+        valid_pvalues = np.minimum(hypergeom.cdf(b, background_size, gene_set_size, not_in_category_size), 1.0)
+        
+        # A table with an empty row or column has a p-value of 1
+        empty_margin = (gene_set_size == 0) | (gene_set_size == background_size) | (category_size == 0) | (not_in_category_size == 0)
+        valid_pvalues[empty_margin] = 1.0
+        
+        pvalues[valid] = valid_pvalues
+        return pvalues
+    
     @staticmethod
     def _create_contingency(genes_in_both, gene_set_size, category_size, background_size):
         """
@@ -10,15 +10,15 @@ from wormcat3.sunburst_template import sunburst_template_front, sunburst_templat
 
 def _read_input_annotations(file_nm_in):
     """
-    Read the RGS Data and create JSON based on Category 3 info
+    Read the RGS Data (a file or a DataFrame) and create JSON based on Category 3 info
     """
     nodes_dict = {}
     try:
-        df = pd.read_csv(file_nm_in)
+        df = file_nm_in if isinstance(file_nm_in, pd.DataFrame) else pd.read_csv(file_nm_in)
         node1_list= []
         nodes_dict = {"name":"rgs", "children":node1_list}
 
-        cat3 = df.groupby(["Category.3"]).count()
+        cat3 = df.groupby(["Category.3"], observed=True).count()
 
         cat3_dict={}
         for cat3_index, row in cat3.iterrows():
@@ -78,16 +78,17 @@ def __getChildrenFor2(grand_parent, parent, nodes_dict):
     return node_list
 
 
-def create_sunburst(dir_path: str, run_number: str) -> None:
+def create_sunburst(dir_path: str, run_number: str, annotated_df: pd.DataFrame = None) -> None:
     """
-    Create a sunburst HTML file from the data in 'input_annotated_###.csv' file.
+    Create a sunburst HTML file from the data in 'input_annotated_###.csv' file,
+    or from annotated_df when the annotated gene set is already in memory.
     """
     dir_path = Path(dir_path)
     rgs_file = dir_path / f"input_annotated_{run_number}.csv"
     html_file = dir_path / f"sunburst_{run_number}.html"
 
     # Load data and convert to JSON
-    data = _read_input_annotations(rgs_file)
+    data = _read_input_annotations(rgs_file if annotated_df is None else annotated_df)
     json_data = json.dumps(data)
 
     # Insert JSON data into the template and write to file
@@ -0,0 +1,185 @@
+"""
+Gene overlap and redundancy between enriched terms
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+import wormcat3.constants as cs
+from wormcat3.constants import OverlapMetric
+from wormcat3.incidence_matrix import CategoryIncidenceMatrix
+
+
+class TermOverlap:
+    """
+    Pairwise gene overlap between terms, for spotting redundant enriched terms.
+
+    Wormcat's nested categories make a Category 3 term and its Category 2 parent
+    come up together on much the same genes. Each term's genes (its GSEA leading
+    edge, or the genes of the input list annotated to it) form a row of a sparse
+    binary term by gene matrix M; the shared gene counts of all pairs of terms
+    are M @ M.T, from which the Jaccard and overlap coefficients follow. Terms
+    joined by a coefficient at or above a threshold are clustered as connected
+    components.
+
+    Terms keep the order they are given in (most significant first for the
+    from_ constructors), and the first term of each cluster is its representative.
+    """
+
+    GENE_COLUMN = "Gene"
+
+    def __init__(self, term_genes_df, term_columns=None):
+        """
+        Initialize from a long table with one row per (term, gene).
+        term_columns are the columns identifying a term (default: all but the Gene column).
+        """
+        if term_columns is None:
+            term_columns = [col for col in term_genes_df.columns if col != self.GENE_COLUMN]
+        missing_cols = [col for col in term_columns + [self.GENE_COLUMN] if col not in term_genes_df.columns]
+        if missing_cols:
+            raise ValueError(f"Missing required columns: {', '.join(missing_cols)}")
+
+        self.term_columns = list(term_columns)
+        if term_genes_df.empty:
+            # No terms (e.g. none passed the threshold): every matrix and table is empty
+            term_codes = gene_codes = np.empty(0, dtype=np.int64)
+            self.terms_df = term_genes_df[self.term_columns].reset_index(drop=True)
+            genes = []
+        else:
+            term_codes, terms = pd.factorize(pd.MultiIndex.from_frame(term_genes_df[term_columns]))
+            gene_codes, genes = pd.factorize(term_genes_df[self.GENE_COLUMN])
+            self.terms_df = terms.to_frame(index=False).set_axis(self.term_columns, axis=1)
+        self.genes = np.asarray(genes, dtype=object)
+
+        # A gene listed twice for a term counts once
+        membership = sparse.csr_matrix(
+            (np.ones(len(term_codes), dtype=np.int64), (term_codes, gene_codes)),
+            shape=(len(self.terms_df), len(genes))
+        )
+        membership.data[:] = 1
+        self.membership = membership
+        self.sizes = np.diff(membership.indptr)
+        self.intersections = (membership @ membership.T).tocsr()
+
+    @classmethod
+    def from_gsea_results(cls, gsea_results, fdr_threshold: float = 0.25):
+        """
+        Overlap of the leading edges of the terms with FDR at or below fdr_threshold.
+        gsea_results is a GSEAResult or a dictionary of category level to GSEAResult
+        (such as GSEAAnalyzer.collection_gsea_results); terms are then identified by
+        'Category Level' and 'Term'.
+        """
+        if not isinstance(gsea_results, dict):
+            gsea_results = {None: gsea_results}
+
+        leading_edge_dfs = []
+        for level, gsea_result in gsea_results.items():
+            leading_edge_df = gsea_result.leading_edges(fdr_threshold)
+            fdr = gsea_result.results_df.set_index('Term')['FDR']
+            leading_edge_df.insert(0, 'Category Level', level)
+            leading_edge_df['FDR'] = leading_edge_df['Term'].map(fdr).to_numpy()
+            leading_edge_dfs.append(leading_edge_df)
+
+        term_genes_df = pd.concat(leading_edge_dfs, ignore_index=True).sort_values('FDR', kind='stable')
+        term_columns = ['Term'] if None in gsea_results else ['Category Level', 'Term']
+        return cls(term_genes_df, term_columns)
+
+    @classmethod
+    def from_enrichment_results(cls, annotated_gene_set_df, enrichment_results):
+        """
+        Overlap of the input genes annotated to each enriched term.
+
+        annotated_gene_set_df is the annotated input gene set (Wormcat.annotated_gene_set_df).
+        enrichment_results is the list returned by Wormcat.perform_enrichment_analysis, or a
+        DataFrame of enriched terms with 'Category Level', 'Category' and 'PValue' columns.
+        Terms are identified by 'Category Level' and 'Category'.
+        """
+        if isinstance(enrichment_results, pd.DataFrame):
+            enriched_df = enrichment_results.reindex(columns=['Category Level', 'Category', 'PValue'])
+        else:
+            enriched_dfs = []
+            for level, level_results in zip(CategoryIncidenceMatrix.CATEGORIES, enrichment_results):
+                # Each level's results are {file path: DataFrame}, or an empty DataFrame
+                if isinstance(level_results, dict):
+                    level_results = next(iter(level_results.values()))
+                enriched_dfs.append(level_results.reindex(columns=['Category', 'PValue']).assign(**{'Category Level': level}))
+            enriched_df = pd.concat(enriched_dfs, ignore_index=True)
+
+        gene_col = "Wormbase.ID"
+        annotated_long_df = annotated_gene_set_df.melt(
+            id_vars=[gene_col],
+            value_vars=[f"Category.{level}" for level in CategoryIncidenceMatrix.CATEGORIES],
+            var_name='Category Level',
+            value_name='Category'
+        )
+        annotated_long_df['Category Level'] = annotated_long_df['Category Level'].str.removeprefix('Category.').astype(int)
+
+        term_genes_df = enriched_df.sort_values('PValue', kind='stable').merge(
+            annotated_long_df, on=['Category Level', 'Category'], how='inner', sort=False
+        )
+        term_genes_df = term_genes_df.rename(columns={gene_col: cls.GENE_COLUMN})
+        return cls(term_genes_df, ['Category Level', 'Category'])
+
+    def coefficients(self, metric: OverlapMetric = OverlapMetric.JACCARD):
+        """
+        Sparse term by term matrix of the overlap coefficient of every pair of terms sharing genes:
+        Jaccard (shared / union) or overlap (shared / size of the smaller term).
+        """
+        intersections = self.intersections.tocoo()
+        values = self._coefficient(intersections.data, self.sizes[intersections.row], self.sizes[intersections.col], metric)
+        return sparse.csr_matrix((values, (intersections.row, intersections.col)), shape=intersections.shape)
+
+    def pairs(self, min_coefficient: float = 0.0, metric: OverlapMetric = OverlapMetric.JACCARD) -> pd.DataFrame:
+        """
+        Every pair of distinct terms sharing genes, with the shared gene count and both
+        coefficients, keeping pairs whose metric is at least min_coefficient. Sorted by the
+        metric, highest first.
+        """
+        intersections = sparse.triu(self.intersections, k=1).tocoo()
+        term_a = intersections.row
+        term_b = intersections.col
+        shared = intersections.data
+        jaccard = self._coefficient(shared, self.sizes[term_a], self.sizes[term_b], OverlapMetric.JACCARD)
+        overlap = self._coefficient(shared, self.sizes[term_a], self.sizes[term_b], OverlapMetric.OVERLAP)
+        metric = OverlapMetric(metric)
+        keep = (jaccard if metric == OverlapMetric.JACCARD else overlap) >= min_coefficient
+
+        pairs_df = pd.concat([
+            self.terms_df.iloc[term_a[keep]].add_suffix(" A").reset_index(drop=True),
+            self.terms_df.iloc[term_b[keep]].add_suffix(" B").reset_index(drop=True)
+        ], axis=1)
+        pairs_df['Shared'] = shared[keep].astype(int)
+        pairs_df['Jaccard'] = jaccard[keep]
+        pairs_df['Overlap'] = overlap[keep]
+        sort_col = 'Jaccard' if metric == OverlapMetric.JACCARD else 'Overlap'
+        return pairs_df.sort_values(sort_col, ascending=False, kind='stable').reset_index(drop=True)
+
+    def clusters(self, threshold: float = cs.DEFAULT_TERM_OVERLAP_THRESHOLD, metric: OverlapMetric = OverlapMetric.JACCARD) -> pd.DataFrame:
+        """
+        Group terms whose metric links them, directly or through other terms, at or above threshold.
+        Returns the terms with their gene count, a cluster number (clusters numbered in term order)
+        and whether the term is its cluster's representative, sorted by cluster.
+        """
+        assert 0 < threshold <= 1, "threshold must be between 0 and 1 (exclusive lower, inclusive upper)."
+        coefficients = self.coefficients(metric)
+        links = sparse.csr_matrix(coefficients >= threshold)
+        _, labels = connected_components(links, directed=False)
+
+        # Number the clusters in the order of their first term, which is also their representative
+        _, first_terms, cluster_codes = np.unique(labels, return_index=True, return_inverse=True)
+        cluster_order = np.argsort(np.argsort(first_terms))
+        clusters = cluster_order[cluster_codes]
+
+        clusters_df = self.terms_df.copy()
+        clusters_df['Genes'] = self.sizes
+        clusters_df['Cluster'] = clusters + 1
+        clusters_df['Representative'] = np.isin(np.arange(len(clusters)), first_terms)
+        return clusters_df.sort_values('Cluster', kind='stable').reset_index(drop=True)
+
+    @staticmethod
+    def _coefficient(shared, size_a, size_b, metric):
+        """ Jaccard or overlap coefficient from the shared gene counts and the sizes of two terms. """
+        shared = shared.astype(float)
+        if OverlapMetric(metric) == OverlapMetric.JACCARD:
+            return shared / (size_a + size_b - shared)
+        return shared / np.minimum(size_a, size_b)
@@ -1,12 +1,18 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from typing import Union, List, Dict
 from wormcat3 import file_util
-from wormcat3.annotations_manger import AnnotationsManager
+from wormcat3.annotations_manger import get_annotations_manager
+from wormcat3.background_profile import BackgroundProfile
+from wormcat3.batch_manifest import BatchManifest
 from wormcat3.statistical_analysis import EnrichmentAnalyzer
-from wormcat3.gsea_analyzer import GSEAAnalyzer
-from wormcat3.constants import PAdjustMethod
+from wormcat3.gsea_analyzer import GSEAAnalyzer, run_contrast_gsea
+from wormcat3.constants import PAdjustMethod, OutputMode, GSEAEngine
+from wormcat3.output_sink import OutputSink, MemorySink, create_output_sink
+from wormcat3.result_cache import ResultCache
 from wormcat3.bubble_chart import create_bubble_chart
 from wormcat3.sunburst import create_sunburst
 from wormcat3.wormcat_excel import WormcatExcel
@@ -21,41 +27,195 @@ class Wormcat:
     def __init__(self, 
                  working_dir_path = cs.DEFAULT_WORKING_DIR_PATH, 
                  run_prefix = cs.DEFAULT_RUN_PREFIX, 
-                 annotation_file_name = cs.DEFAULT_ANNOTATION_FILE_NAME):
-        """Initialize Wormcat with working directory and annotation file."""
+                 annotation_file_name = cs.DEFAULT_ANNOTATION_FILE_NAME,
+                 *,
+                 compact_annotations = False,
+                 output_mode: Union[OutputMode, str, OutputSink] = OutputMode.CSV,
+                 run_number: str = None,
+                 use_cache: bool = False):
+        """
+        Initialize Wormcat with working directory and annotation file.
+        compact_annotations keeps only the gene ID and category columns of the
+        annotations in memory (the annotated output files then omit the other columns).
+        output_mode selects where the intermediate tables go: CSV (default) or Parquet
+        files, memory (kept on output_sink.frames) or nowhere. Plots are always written.
+        An OutputSink instance may also be given to share one sink between runs.
+        run_number reopens the directory of an earlier run instead of creating a new one,
+        for example to resume a wormcat_batch.
+        use_cache keeps the enrichment results in a result cache shared by all runs, so a gene
+        set that was tested before against the same background, annotations and p-value
+        adjustment is not tested again; its lookups are counted in enrichment_cache.hits
+        and enrichment_cache.misses.
+        """
         
         ### Create the working directory 
-        self.run_number = file_util.generate_5_digit_hash(prefix=run_prefix + "_")
+        self.run_number = run_number or file_util.generate_5_digit_hash(prefix=run_prefix + "_")
         working_dir_path = Path(working_dir_path) / self.run_number
-        self.working_dir_path = file_util.validate_directory_path(working_dir_path)
+        self.working_dir_path = file_util.validate_directory_path(working_dir_path, not_empty_check=run_number is None)
         
-        # Setup annotation manager
-        self.annotation_manager = AnnotationsManager(annotation_file_name)
+        # Setup annotation manager (shared across Wormcat instances)
+        self.annotation_manager = get_annotations_manager(annotation_file_name, compact=compact_annotations)
+        self.output_sink = create_output_sink(output_mode)
+        self.enrichment_cache = ResultCache(cs.ENRICHMENT_RESULT_CACHE_NM) if use_cache else None
+        self.annotated_gene_set_df = None
 
 
-    def perform_gsea_analysis(self, deseq2_input: Union[str, pd.DataFrame]):
+    def perform_gsea_analysis(self, deseq2_input: Union[str, pd.DataFrame], *, gsea_engine = GSEAEngine.GSEAPY, shared_null = False, 
+                              write_reports = True, plot_top_n = 0, use_cache = False, permutation_num = 1000, adaptive = False,
+                              max_permutation_num = None):
+        """
+        Run preranked GSEA of the DESeq2 results against the Category 1, 2 and 3 gene sets.
+        gsea_engine selects gseapy (default) or the built-in NumPy engine.
+        With shared_null (native engine only) the three categories are scored against one
+        set of permutations in a single pass instead of three separate runs.
+        write_reports=False stops gseapy writing its per-term reports and plots; plot_top_n
+        then renders plots for only that many top terms of each category.
+        use_cache returns the results of an identical earlier run from the GSEA result cache.
+        permutation_num is the number of permutations of each category run.
+        adaptive (native engine only) lets each term stop its permutations early once it is
+        clearly not significant, or continue up to max_permutation_num (default: ten times
+        permutation_num), which takes precedence over permutation_num; see NativePrerank.
+        """
         
         if isinstance(deseq2_input, str):
             deseq2_df = file_util.read_deseq2_file(deseq2_input)
         else:
             deseq2_df = deseq2_input
 
-        gsea_analyzer = GSEAAnalyzer(self.working_dir_path)
+        if (shared_null or adaptive) and gsea_engine != GSEAEngine.NATIVE:
+            raise ValueError("shared_null and adaptive require gsea_engine=GSEAEngine.NATIVE.")
+
+        gsea_analyzer = GSEAAnalyzer(self.working_dir_path, use_cache=use_cache)
         ranked_list_df = gsea_analyzer.create_ranked_list(deseq2_df)
 
-        for category in [1,2,3]:
-            gmt_format = self.annotation_manager.category_to_gmt_format(category)
-            results_name = f"gsea_category_{category}_{self.run_number}"
-            results_df = gsea_analyzer.run_preranked_gsea(ranked_list_df , gmt_format, results_name)
+        category_gene_sets = self._category_gene_sets(gsea_engine)
+        category_results = gsea_analyzer.run_category_gsea(ranked_list_df, category_gene_sets, self.run_number, engine=gsea_engine, shared_null=shared_null,
+                                                           write_reports=write_reports, plot_top_n=plot_top_n, permutation_num=permutation_num,
+                                                           adaptive=adaptive, max_permutation_num=max_permutation_num)
+
+        for category, results_df in category_results.items():
             # Save the results_df
-            gsea_category_path = Path(self.working_dir_path) / f"{results_name}.csv"
-            results_df.to_csv(gsea_category_path, index=False)
+            gsea_category_path = Path(self.working_dir_path) / f"gsea_category_{category}_{self.run_number}.csv"
+            self.output_sink.write(results_df, gsea_category_path)
+
+
+    def perform_rank_test(self, deseq2_input: Union[str, pd.DataFrame], *, correlation = cs.DEFAULT_RANK_TEST_CORRELATION):
+        """
+        Run a fast competitive rank-sum test of the DESeq2 results against the Category 1, 2 and 3 gene sets.
+        Uses the same ranked list as perform_gsea_analysis but needs no permutations, so the results
+        are available in milliseconds. correlation is the assumed correlation between the genes of a
+        term (0 gives the plain Wilcoxon test). Returns the results by category level.
+        """
+        if isinstance(deseq2_input, str):
+            deseq2_df = file_util.read_deseq2_file(deseq2_input)
+        else:
+            deseq2_df = deseq2_input
+
+        gsea_analyzer = GSEAAnalyzer(self.working_dir_path)
+        ranked_list_df = gsea_analyzer.create_ranked_list(deseq2_df)
+
+        category_gene_sets = self._category_gene_sets(GSEAEngine.NATIVE)
+        category_results = gsea_analyzer.run_rank_sum_test(ranked_list_df, category_gene_sets, correlation=correlation)
+
+        for category, results_df in category_results.items():
+            rank_test_category_path = Path(self.working_dir_path) / f"rank_test_category_{category}_{self.run_number}.csv"
+            self.output_sink.write(results_df, rank_test_category_path)
+
+        return category_results
+
+    def _category_gene_sets(self, gsea_engine):
+        """ Return the Category 1, 2 and 3 gene sets in the form the GSEA engine takes. """
+        if gsea_engine == GSEAEngine.NATIVE:
+            # The native engine works directly on the gene set index arrays
+            return {category: self.annotation_manager.get_category_gene_sets(category) for category in [1,2,3]}
+        return {category: self.annotation_manager.category_to_gmt_format(category) for category in [1,2,3]}
 
+    def gsea_batch(self,
+            input_data: str,
+            *,
+            gsea_engine = GSEAEngine.GSEAPY,
+            shared_null = False,
+            max_workers: int = None,
+            cores: int = None,
+            write_reports = False,
+            plot_top_n = 0,
+            use_cache = False,
+            permutation_num = 1000,
+            adaptive = False,
+            max_permutation_num = None) -> pd.DataFrame:
+        """
+        Run preranked GSEA for every DESeq2 table in a directory of CSV files or an Excel workbook.
+        The category gene sets are built once and the contrasts run in parallel worker processes.
+        cores is the CPU budget (default: all CPUs); it is split between max_workers processes
+        (default: one per contrast, up to cores) and the gseapy threads of each run.
+        Each contrast's results are written to a directory named after it, and the NES and FDR
+        of every term across contrasts to gsea_summary_<run_number>.csv, which is returned.
+        Only the result tables are written unless write_reports asks for gseapy's per-term
+        reports, or plot_top_n for plots of that many top terms per category and contrast.
+        With use_cache, contrasts that are unchanged since an earlier run come from the GSEA
+        result cache instead of being recomputed. permutation_num, adaptive and max_permutation_num
+        are as for perform_gsea_analysis.
+        When input_data holds no DESeq2 tables nothing is run or written and an empty summary
+        (only the 'Category Level' and 'Term' columns) is returned.
+        """
+        if (shared_null or adaptive) and gsea_engine != GSEAEngine.NATIVE:
+            raise ValueError("shared_null and adaptive require gsea_engine=GSEAEngine.NATIVE.")
+
+        csv_files = self._batch_csv_files(input_data)
+        if not csv_files:
+            return pd.DataFrame(columns=['Category Level', 'Term'])
+
+        category_gene_sets = self._category_gene_sets(gsea_engine)
+        workers, threads = self._split_core_budget(len(csv_files), cores, max_workers)
+
+        working_dir_path = Path(self.working_dir_path)
+        contrast_args = {
+            file.stem: (str(file), category_gene_sets, str(working_dir_path / file.stem), file.stem)
+            for file in sorted(csv_files)
+        }
+        run_options = {"engine": gsea_engine, "shared_null": shared_null, "threads": threads, "write_reports": write_reports, "plot_top_n": plot_top_n,
+                       "use_cache": use_cache, "permutation_num": permutation_num, "adaptive": adaptive, "max_permutation_num": max_permutation_num}
+
+        if workers == 1:
+            contrast_results = {contrast: run_contrast_gsea(*args, **run_options) for contrast, args in contrast_args.items()}
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {contrast: executor.submit(run_contrast_gsea, *args, **run_options) for contrast, args in contrast_args.items()}
+                contrast_results = {contrast: future.result() for contrast, future in futures.items()}
+
+        summary_frames = []
+        for contrast, category_results in contrast_results.items():
+            for category, results_df in category_results.items():
+                self.output_sink.write(results_df, working_dir_path / contrast / f"gsea_category_{category}_{contrast}.csv")
+                summary_frames.append(results_df[['Term', 'NES', 'FDR']].assign(**{'Contrast': contrast, 'Category Level': category}))
+
+        # One row per term, with the NES and FDR of each contrast side by side
+        contrasts = list(contrast_results)
+        summary_df = pd.concat(summary_frames, ignore_index=True).pivot(
+            index=['Category Level', 'Term'], columns='Contrast', values=['NES', 'FDR']
+        )
+        summary_df = summary_df.swaplevel(axis=1).reindex(columns=pd.MultiIndex.from_product([contrasts, ['NES', 'FDR']]))
+        summary_df.columns = [f"{contrast} {stat}" for contrast, stat in summary_df.columns]
+        summary_df = summary_df.reset_index()
+
+        self.output_sink.write(summary_df, working_dir_path / f"gsea_summary_{self.run_number}.csv")
+        return summary_df
+
+    @staticmethod
+    def _split_core_budget(n_tasks, cores = None, max_workers = None):
+        """
+        Split a CPU budget between worker processes and the threads of each worker.
+        Independent tasks parallelize best, so each task gets a process up to the budget
+        (or max_workers) and the remaining cores are shared out as threads.
+        """
+        cores = max(1, cores or os.cpu_count() or 1)
+        workers = max(1, min(n_tasks, cores, max_workers or cores))
+        return workers, max(1, cores // workers)
         
     def perform_enrichment_analysis(
             self, 
             gene_set_input: Union[str, list], 
-            background_input: Union[str, list] = None, 
+            background_input: Union[str, list, BackgroundProfile] = None, 
             *, 
             p_adjust_method = PAdjustMethod.BONFERRONI, 
             p_adjust_threshold = cs.DEFAULT_P_ADJUST_THRESHOLD
@@ -71,7 +231,7 @@ class Wormcat:
         if isinstance(background_input, str):
             background_list = file_util.read_gene_set_file(background_input)
         else:
-            background_list = background_input
+            background_list = background_input  # A list, a BackgroundProfile or None
 
         if not isinstance(p_adjust_method, PAdjustMethod):
             raise ValueError(f"Invalid p_adjust_method: {p_adjust_method}. Must be a valid PAdjustMethod.")
@@ -83,55 +243,184 @@ class Wormcat:
         gene_set_list = self.annotation_manager.dedup_list(gene_set_list)
         gene_type = self.annotation_manager.get_gene_id_type(gene_set_list)
         
-        # Add annotations
+        # Preprocess background list
+        background_profile = self._prepare_background(background_list, gene_type)
+        
+        # A gene set tested before with the same background, annotations and adjustment is not tested again
+        cache_key = None
+        cached_frames = None
+        if self.enrichment_cache is not None:
+            cache_key = self._enrichment_cache_key(gene_set_list, background_profile, p_adjust_method, p_adjust_threshold)
+            cached_frames = self.enrichment_cache.get(cache_key)
+        
+        # Add annotations; the cache keeps only the test results, as the key pins the annotations
         gene_set_and_categories_df, genes_not_matched_df = self.annotation_manager.segment_genes_by_annotation_match(gene_set_list, gene_type)
         
         # Save the annotated input gene set
         rgs_and_categories_path = Path(self.working_dir_path) / f"input_annotated_{self.run_number}.csv"
-        gene_set_and_categories_df.to_csv(rgs_and_categories_path, index=False)
+        self.output_sink.write(gene_set_and_categories_df, rgs_and_categories_path)
+        self.annotated_gene_set_df = gene_set_and_categories_df
         
         if not genes_not_matched_df.empty:
                 genes_not_annotated_path = Path(self.working_dir_path) / f"genes_not_annotated_{self.run_number}.csv"
-                genes_not_matched_df.to_csv(genes_not_annotated_path, index=False)
-
+                self.output_sink.write(genes_not_matched_df, genes_not_annotated_path)
 
-        # Preprocess background list
-        if background_list is not None:  
-            background_list = self.annotation_manager.dedup_list(background_list)
-            background_type = self.annotation_manager.get_gene_id_type(background_list)
-            if background_type != gene_type:
-                raise ValueError("Gene Set Type and Background Type MUST be the same. {gene_type}!={background_type}")
-            background_df, background_not_annotated_df = self.annotation_manager.segment_genes_by_annotation_match(background_list, background_type)
-
-            # Save the annotated background input
-            background_annotated_path = Path(self.working_dir_path) / f"background_annotated_{self.run_number}.csv"
-            background_df.to_csv(background_annotated_path, index=False)
-
-            if not background_not_annotated_df.empty:
-                background_not_annotated_path = Path(self.working_dir_path) / f"background_not_annotated_{self.run_number}.csv"
-                background_not_annotated_df.to_csv(background_not_annotated_path, index=False)
-        else:
-            # If no background is provided we use the whole genome  
-            background_df = self.annotation_manager.annotations_df
-        
         
         # Setup statistical analyzer
         self.analyzer = EnrichmentAnalyzer(
-            background_df, 
+            None, 
             self.working_dir_path,
-            self.run_number
+            self.run_number,
+            background_profile=background_profile,
+            output_sink=self.output_sink
         )
         
+        if cached_frames is not None:
+            return self.analyzer.restore_enrichment_test(
+                {category: cached_frames[f"fisher_{category}"] for category in self.analyzer.categories},
+                {category: cached_frames[f"padj_{category}"] for category in self.analyzer.categories if f"padj_{category}" in cached_frames},
+                p_adjust_method=p_adjust_method
+            )
+        
         # Run enrichment analysis
-        return self.analyzer.perform_enrichment_test(
+        test_results = self.analyzer.perform_enrichment_test(
             gene_set_and_categories_df,
             p_adjust_method=p_adjust_method,
             p_adjust_threshold=p_adjust_threshold
         )
+        
+        if cache_key is not None:
+            frames = {}
+            for category, test_result in zip(self.analyzer.categories, test_results):
+                frames[f"fisher_{category}"] = self.analyzer.fisher_results[category]
+                # Categories with nothing to adjust return a bare DataFrame that was not written
+                if isinstance(test_result, dict):
+                    frames[f"padj_{category}"] = next(iter(test_result.values()))
+            self.enrichment_cache.put(cache_key, frames)
+        
+        return test_results
+    
+    def _enrichment_cache_key(self, gene_set_list, background_profile, p_adjust_method, p_adjust_threshold):
+        """
+        Result cache key of an enrichment test: the gene set (deduplicated and sorted, as the test
+        does not depend on its order), the background, the annotations and the p-value adjustment.
+        """
+        return ResultCache.make_key(
+            cs.ENRICHMENT_RESULT_CACHE_NM,
+            np.array(sorted(gene_set_list), dtype=object),
+            background_profile.content_key,
+            self.annotation_manager.content_hash(),
+            self.annotation_manager.compact,
+            p_adjust_method.value,
+            p_adjust_threshold
+        )
+
+    def perform_batch_enrichment_analysis(
+            self, 
+            gene_sets_input: Union[str, Dict[str, list]], 
+            background_input: Union[str, list, BackgroundProfile] = None, 
+            *, 
+            p_adjust_method = PAdjustMethod.BONFERRONI, 
+            p_adjust_threshold = cs.DEFAULT_P_ADJUST_THRESHOLD
+        ) -> pd.DataFrame:
+        """
+        Perform the enrichment test on many gene sets against the same background.
+        
+        gene_sets_input is either a dictionary of gene set name to gene list or the path of a
+        "wide" CSV/Excel file where each column is a gene set. All gene sets are tested
+        together and the results are returned as one long-format dataframe.
+        """
+        
+        if isinstance(gene_sets_input, str):
+            gene_sets = file_util.read_gene_sets_file(gene_sets_input)
+        else:
+            gene_sets = gene_sets_input
+        
+        if isinstance(background_input, str):
+            background_list = file_util.read_gene_set_file(background_input)
+        else:
+            background_list = background_input  # A list, a BackgroundProfile or None
+
+        if not isinstance(p_adjust_method, PAdjustMethod):
+            raise ValueError(f"Invalid p_adjust_method: {p_adjust_method}. Must be a valid PAdjustMethod.")
+
+        assert 0 < p_adjust_threshold <= 1, "p_adjust_threshold must be between 0 and 1 (exclusive lower, inclusive upper)."
+        
+        if not gene_sets:
+            raise ValueError("No gene sets were provided.")
+        
+        # Annotate every gene set
+        gene_sets_and_categories = {}
+        genes_not_matched_dfs = []
+        gene_type = None
+        for gene_set_name, gene_set_list in gene_sets.items():
+            gene_set_list = self.annotation_manager.dedup_list(gene_set_list)
+            gene_set_type = self.annotation_manager.get_gene_id_type(gene_set_list)
+            if gene_type is not None and gene_set_type != gene_type:
+                raise ValueError(f"All gene sets MUST have the same gene ID type. {gene_type}!={gene_set_type} for '{gene_set_name}'")
+            gene_type = gene_set_type
+            
+            gene_set_and_categories_df, genes_not_matched_df = self.annotation_manager.segment_genes_by_annotation_match(gene_set_list, gene_type)
+            gene_sets_and_categories[gene_set_name] = gene_set_and_categories_df
+            if not genes_not_matched_df.empty:
+                genes_not_matched_dfs.append(genes_not_matched_df.assign(**{"Gene Set": gene_set_name}))
+        
+        if genes_not_matched_dfs:
+            genes_not_annotated_path = Path(self.working_dir_path) / f"batch_genes_not_annotated_{self.run_number}.csv"
+            self.output_sink.write(pd.concat(genes_not_matched_dfs, ignore_index=True), genes_not_annotated_path)
+        
+        # Preprocess background list
+        background_profile = self._prepare_background(background_list, gene_type)
+        
+        self.analyzer = EnrichmentAnalyzer(
+            None, 
+            self.working_dir_path,
+            self.run_number,
+            background_profile=background_profile,
+            output_sink=self.output_sink
+        )
+        
+        return self.analyzer.perform_batch_enrichment_test(
+            gene_sets_and_categories,
+            p_adjust_method=p_adjust_method,
+            p_adjust_threshold=p_adjust_threshold
+        )
+
+    def _prepare_background(self, background_input, gene_type):
+        """
+        Return the BackgroundProfile for the background, or the whole genome profile if there is none.
+        Profiles are shared through the annotation manager; the annotated background files are written
+        when a background list is given, but not for a profile that was prepared beforehand.
+        """
+        
+        if isinstance(background_input, BackgroundProfile):
+            background_profile = background_input
+        else:
+            background_profile = self.annotation_manager.get_background_profile(background_input)
+        
+        if background_profile.is_whole_genome:
+            return background_profile
+        
+        if background_profile.gene_type != gene_type:
+            raise ValueError(f"Gene Set Type and Background Type MUST be the same. {gene_type}!={background_profile.gene_type}")
+        
+        if not isinstance(background_input, BackgroundProfile):
+            self._save_background(background_profile)
+        
+        return background_profile
+
+    def _save_background(self, background_profile):
+        """ Save the annotated background input. """
+        background_annotated_path = Path(self.working_dir_path) / f"background_annotated_{self.run_number}.csv"
+        self.output_sink.write(background_profile.annotated_df, background_annotated_path)
+
+        if not background_profile.not_annotated_df.empty:
+            background_not_annotated_path = Path(self.working_dir_path) / f"background_not_annotated_{self.run_number}.csv"
+            self.output_sink.write(background_profile.not_annotated_df, background_not_annotated_path)
 
     def analyze_and_visualize_enrichment(self,
             gene_set_input: Union[str, list], 
-            background_input: Union[str, list] = None, 
+            background_input: Union[str, list, BackgroundProfile] = None, 
             *, 
             p_adjust_method = PAdjustMethod.BONFERRONI, 
             p_adjust_threshold = cs.DEFAULT_P_ADJUST_THRESHOLD):
@@ -141,19 +430,18 @@ class Wormcat:
             result_file_path, result_df = next(iter(test_result.items()))
             data_file_nm = os.path.basename(result_file_path)
             base_dir_path = os.path.dirname(result_file_path)
-            plot_title = data_file_nm[:-10]
-            create_bubble_chart(base_dir_path, data_file_nm, plot_title = plot_title)
+            plot_title = Path(data_file_nm).stem[:-6]
+            # The plots are built from the results in memory, whatever the output mode
+            create_bubble_chart(base_dir_path, data_file_nm, plot_title = plot_title, data_df = result_df)
             
-        run_number = os.path.basename(base_dir_path)
-        create_sunburst(base_dir_path,run_number)
-        
-    def wormcat_batch(self,
-            input_data: str, 
-            background_input: Union[str, list] = None, 
-            *, 
-            p_adjust_method = PAdjustMethod.BONFERRONI, 
-            p_adjust_threshold = cs.DEFAULT_P_ADJUST_THRESHOLD):
+        create_sunburst(self.working_dir_path, self.run_number, annotated_df = self.annotated_gene_set_df)
         
+    def _batch_csv_files(self, input_data):
+        """
+        Return the CSV files of a batch: those in a directory, or one per sheet of an Excel
+        workbook (extracted into the working directory). Prints why and returns None when
+        the input can't be used.
+        """
         input_path = Path(input_data)
         
         # Check if path exists
@@ -182,16 +470,197 @@ class Wormcat:
                     
         # Look for CSV files
         csv_files = list(csv_file_path.glob('*.csv'))  
-        if csv_files:
-            for file in csv_files:
-                wormcat = Wormcat(working_dir_path=self.working_dir_path,run_prefix=file.stem)
-                wormcat.analyze_and_visualize_enrichment(str(file), background_input, p_adjust_method = p_adjust_method, p_adjust_threshold = p_adjust_threshold)
-        else:
+        if not csv_files:
             print(f"Directory doesn't contain any CSV files: {input_path}")
-            return 
+            return
         
+        return csv_files
+
+    def _batch_gene_set_inputs(self, input_data, *, extract_csv=False):
+        """
+        Return the gene sets of a batch by name, in name order: the gene lists of the sheets of an
+        Excel workbook, read directly unless extract_csv, or the paths of the CSV files otherwise.
+        Prints why and returns None when the input can't be used.
+        """
+        input_path = Path(input_data)
+        if input_path.is_file() and input_path.suffix.lower() in ['.xlsx', '.xls', '.xlsm'] and not extract_csv:
+            try:
+                gene_lists = WormcatExcel.read_first_columns(input_data)
+            except Exception as e:
+                print(f"Invalid Excel file: {input_path}. Error: {str(e)}")
+                return
+            if not gene_lists:
+                print(f"Excel file doesn't contain any sheets: {input_path}")
+                return
+            return dict(sorted(gene_lists.items()))
+        
+        csv_files = self._batch_csv_files(input_data)
+        if not csv_files:
+            return
+        return {file.stem: str(file) for file in sorted(csv_files)}
 
+    def wormcat_batch(self,
+            input_data: str, 
+            background_input: Union[str, list, BackgroundProfile] = None, 
+            *, 
+            p_adjust_method = PAdjustMethod.BONFERRONI, 
+            p_adjust_threshold = cs.DEFAULT_P_ADJUST_THRESHOLD,
+            max_workers: int = 1,
+            extract_csv: bool = False) -> pd.DataFrame:
+        """
+        Run the enrichment analysis and plots for every gene set in a directory of CSV files or an
+        Excel workbook, and summarize them in one spreadsheet.
+        The gene lists of a workbook are streamed from the first column of each sheet; with
+        extract_csv the sheets are also written out as CSV files, as earlier versions did.
+        With max_workers above 1 (None for one per CPU) the gene sets run in parallel worker
+        processes, which share the annotations and background loaded here.
+        A gene set whose run fails does not stop the batch: its error is recorded, written to
+        batch_errors_<run_number>.csv and returned (an empty DataFrame when all runs succeed).
+        The summary lists the runs in name order however they were scheduled.
+        Completed runs are recorded in a BatchManifest in the batch directory. Running the batch
+        again from a Wormcat reopened on that directory (run_number=...) skips the gene sets
+        whose list, annotations and parameters are unchanged and rebuilds the summary from the
+        stored and the new results.
+        The run directories of gene sets that are run again, or that are no longer part of the
+        batch, are removed.
+        When this Wormcat uses the enrichment result cache, so do the runs, and their cache hits
+        and misses are added to enrichment_cache.hits and enrichment_cache.misses.
+        """
+        
+        if not isinstance(p_adjust_method, PAdjustMethod):
+            raise ValueError(f"Invalid p_adjust_method: {p_adjust_method}. Must be a valid PAdjustMethod.")
+        
+        gene_set_inputs = self._batch_gene_set_inputs(input_data, extract_csv=extract_csv)
+        if not gene_set_inputs:
+            return
+        
+        # The background is annotated and counted once for the whole batch
+        if isinstance(background_input, str):
+            background_input = file_util.read_gene_set_file(background_input)
+        if background_input is not None and not isinstance(background_input, BackgroundProfile):
+            background_input = self.annotation_manager.get_background_profile(background_input)
+            self._save_background(background_input)
+        
         annotation_file_path = self.annotation_manager.annotation_file_path
+        compact = self.annotation_manager.compact
+        
+        # Everything a run's results depend on besides its gene list
+        annotation_hash = self.annotation_manager.content_hash()
+        params = {
+            "p_adjust_method": p_adjust_method.value,
+            "p_adjust_threshold": p_adjust_threshold,
+            "background": BackgroundProfile.WHOLE_GENOME_KEY if background_input is None else background_input.content_key,
+            "compact_annotations": compact,
+            "output_sink": type(self.output_sink).__name__
+        }
+        gene_set_hashes = {
+            name: file_util.file_content_hash(gene_set_input) if isinstance(gene_set_input, str) else BatchManifest.gene_set_hash(gene_set_input)
+            for name, gene_set_input in gene_set_inputs.items()
+        }
+        
+        manifest = BatchManifest(self.working_dir_path)
+        completed = {}
+        for name in gene_set_inputs:
+            entry = manifest.completed_entry(name, gene_set_hashes[name], annotation_hash, params)
+            if entry is not None:
+                completed[name] = (entry['run_number'], manifest.load_fisher_results(entry))
+        if completed:
+            print(f"Resuming batch: {len(completed)} of {len(gene_set_inputs)} gene sets are already complete.")
+        pending_inputs = {name: gene_set_input for name, gene_set_input in gene_set_inputs.items() if name not in completed}
+        
+        # The results of an earlier run of a changed gene set are stale
+        for name in pending_inputs:
+            manifest.discard(name)
+        
+        use_cache = self.enrichment_cache is not None
+        errors = {}
+        def record_result(name, result):
+            if use_cache and result['cache_hit'] is not None:
+                if result['cache_hit']:
+                    self.enrichment_cache.hits += 1
+                else:
+                    self.enrichment_cache.misses += 1
+            if result['error'] is not None:
+                errors[name] = result['error']
+                return
+            completed[name] = (result['run_number'], result['fisher_results'])
+            manifest.record(name, gene_set_hashes[name], annotation_hash, params, result['run_number'], result['run_dir_path'], result['fisher_result_paths'])
+            if result['frames'] is not None and output_sink is not self.output_sink:
+                self.output_sink.frames.update(result['frames'])
+        
+        workers = max(1, min(len(pending_inputs), max_workers or os.cpu_count() or 1))
+        if workers == 1:
+            # The runs share this batch's output sink
+            output_sink = self.output_sink
+            for name, gene_set_input in pending_inputs.items():
+                record_result(name, run_batch_enrichment(name, gene_set_input, self.working_dir_path, annotation_file_path, compact, output_sink,
+                                                         background_input, p_adjust_method, p_adjust_threshold, use_cache))
+        else:
+            # Build what the runs share before the workers start, so forked workers inherit it
+            self.annotation_manager.get_incidence_matrix()
+            if background_input is None:
+                self.annotation_manager.get_background_profile()
+            
+            # Tables kept in memory are collected from the workers and merged into this batch's sink
+            output_sink = MemorySink() if isinstance(self.output_sink, MemorySink) else self.output_sink
+            with ProcessPoolExecutor(max_workers=workers, initializer=_load_batch_annotations, initargs=(annotation_file_path, compact)) as executor:
+                futures = {
+                    executor.submit(run_batch_enrichment, name, gene_set_input, self.working_dir_path, annotation_file_path, compact, output_sink,
+                                    background_input, p_adjust_method, p_adjust_threshold, use_cache): name
+                    for name, gene_set_input in pending_inputs.items()
+                }
+                # Record each run as it finishes, so the manifest keeps it if the batch is stopped
+                for future in as_completed(futures):
+                    record_result(futures[future], future.result())
+        
+        manifest.retain(gene_set_inputs)
+        
+        # The Fisher results feed the summary directly, in name order
+        fisher_results = {completed[name][0]: completed[name][1] for name in gene_set_inputs if name in completed}
+        errors_df = pd.DataFrame([{'Gene Set': name, 'Error': errors[name]} for name in gene_set_inputs if name in errors], columns=['Gene Set', 'Error'])
+        if not errors_df.empty:
+            self.output_sink.write(errors_df, Path(self.working_dir_path) / f"batch_errors_{self.run_number}.csv")
+
         wormcat_excel = WormcatExcel()
         working_dir_path = Path(self.working_dir_path)
-        wormcat_excel.create_summary_spreadsheet(self.working_dir_path, annotation_file_path, f"{working_dir_path}/{working_dir_path.stem}.xlsx")
\ No newline at end of file
+        wormcat_excel.create_summary_spreadsheet_from_results(fisher_results, annotation_file_path, f"{working_dir_path}/{working_dir_path.stem}.xlsx")
+        return errors_df
+
+
+def _load_batch_annotations(annotation_file_name, compact_annotations):
+    """ Load the annotations when a batch worker starts (already there in a forked worker). """
+    get_annotations_manager(annotation_file_name, compact=compact_annotations)
+
+
+def run_batch_enrichment(gene_set_name, gene_set_input, working_dir_path, annotation_file_name, compact_annotations, output_sink,
+                         background_input, p_adjust_method, p_adjust_threshold, use_cache=False):
+    """
+    Run the enrichment analysis and plots of one gene set of a wormcat_batch, in the calling
+    process or a worker process. gene_set_input is a gene list or the path of a CSV file.
+    Returns a dictionary with the run number and directory, the Fisher results and the paths
+    they were written to, the tables of a MemorySink (None for other sinks), whether the
+    enrichment results came from the result cache (None without use_cache or if the run failed
+    before the lookup) and the error message if the run failed (None otherwise).
+    """
+    result = {"run_number": None, "run_dir_path": None, "fisher_results": None, "fisher_result_paths": None, "frames": None,
+              "cache_hit": None, "error": None}
+    wormcat = None
+    try:
+        wormcat = Wormcat(working_dir_path=working_dir_path, run_prefix=gene_set_name, annotation_file_name=annotation_file_name,
+                          compact_annotations=compact_annotations, output_mode=output_sink, use_cache=use_cache)
+        wormcat.analyze_and_visualize_enrichment(gene_set_input, background_input, p_adjust_method = p_adjust_method, p_adjust_threshold = p_adjust_threshold)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    finally:
+        if wormcat is not None and wormcat.enrichment_cache is not None and wormcat.enrichment_cache.hits + wormcat.enrichment_cache.misses:
+            result["cache_hit"] = wormcat.enrichment_cache.hits > 0
+    
+    result.update({
+        "run_number": wormcat.run_number,
+        "run_dir_path": wormcat.working_dir_path,
+        "fisher_results": wormcat.analyzer.fisher_results,
+        "fisher_result_paths": wormcat.analyzer.fisher_result_paths,
+        "frames": output_sink.frames if isinstance(output_sink, MemorySink) else None
+    })
+    return result
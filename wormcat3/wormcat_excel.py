@@ -2,11 +2,15 @@
 Create the summary Excel file based on the individual Wormcat runs
 """
 import os
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from typing import List, Dict, Union, Any, Optional, Tuple, Set
 import warnings
+from openpyxl import load_workbook
 from wormcat3 import file_util
+from wormcat3.annotations_manger import get_annotations_manager
+from wormcat3.incidence_matrix import CategoryIncidenceMatrix
 
 warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -97,6 +101,66 @@ class WormcatExcel:
         except Exception as e:
             raise ExcelConversionError(f"Failed during conversion process: {str(e)}")
         
+    @staticmethod
+    def read_first_columns(excel_path: str) -> Dict[str, list]:
+        """
+        Read the first column of every sheet of an Excel workbook as a gene list.
+        
+        Sheets are streamed row by row in read-only mode and only their first cell is kept,
+        so large workbooks are neither fully parsed nor written out as CSV files. As with
+        the CSV files, the first row of each sheet is its header. Empty cells are skipped
+        and every value is returned as text stripped of surrounding whitespace, so gene IDs
+        stored as numbers or dates are strings as they were after the CSV round trip.
+        
+        Args:
+            excel_path: Path to the Excel file
+            
+        Returns:
+            Dictionary mapping sheet names to gene lists, in workbook order
+            
+        Raises:
+            FileNotFoundError: If the Excel file doesn't exist
+            ExcelConversionError: If the file can't be read as an Excel workbook
+        """
+        if not os.path.exists(excel_path):
+            raise FileNotFoundError(f"Excel file not found at path: {excel_path}")
+        
+        if Path(excel_path).suffix.lower() == '.xls':
+            # Legacy workbooks can't be streamed by openpyxl; the object dtype keeps whole
+            # numbers in a column with empty cells from being read as floats
+            try:
+                sheets = pd.read_excel(excel_path, sheet_name=None, usecols=[0], dtype=object)
+            except Exception as e:
+                raise ExcelConversionError(f"Failed to open Excel file: {str(e)}")
+            return {
+                str(sheet): WormcatExcel._gene_ids(sheet_df.iloc[:, 0].dropna()) if sheet_df.shape[1] > 0 else []
+                for sheet, sheet_df in sheets.items()
+            }
+        
+        try:
+            workbook = load_workbook(excel_path, read_only=True, data_only=True)
+        except Exception as e:
+            raise ExcelConversionError(f"File [{excel_path}] is not a valid Excel file: {str(e)}")
+        
+        gene_lists = {}
+        try:
+            for worksheet in workbook.worksheets:
+                # Skip the header row
+                values = (row[0] for row in worksheet.iter_rows(min_row=2, max_col=1, values_only=True) if row)
+                gene_lists[worksheet.title] = WormcatExcel._gene_ids(value for value in values if value is not None)
+        except Exception as e:
+            raise ExcelConversionError(f"Failed to read Excel file: {str(e)}")
+        finally:
+            workbook.close()
+        
+        return gene_lists
+        
+    @staticmethod
+    def _gene_ids(values) -> list:
+        """ Cell values as stripped text, skipping those that are blank. """
+        gene_ids = (str(value).strip() for value in values)
+        return [gene_id for gene_id in gene_ids if gene_id]
+        
     def create_summary_spreadsheet(self, wormcat_out_path: str, 
                                   annotation_file: str, 
                                   out_xsl_file_nm: str) -> None:
@@ -126,100 +190,134 @@ class WormcatExcel:
         df_process = pd.DataFrame(process_lst, columns=['sheet', 'category', 'file', 'label'])
         self._process_category_files(df_process, annotation_file, out_xsl_file_nm)
 
+    def create_summary_spreadsheet_from_results(self, fisher_results: Dict[str, Dict[int, pd.DataFrame]], 
+                                                annotation_file: str, 
+                                                out_xsl_file_nm: str) -> None:
+        """
+        Create the summary Excel spreadsheet from Fisher test results held in memory.
+        
+        Args:
+            fisher_results: Dictionary of run label to a dictionary of category to Fisher test DataFrame
+                (as kept on EnrichmentAnalyzer.fisher_results)
+            annotation_file: Path to the annotation CSV file
+            out_xsl_file_nm: Path for the output Excel file
+        """
+        process_lst = []
+        for label, category_results in fisher_results.items():
+            for cat_num in self.categories:
+                if cat_num in category_results:
+                    process_lst.append({
+                        'sheet': f"Cat{cat_num}", 
+                        'category': cat_num,
+                        'file': f"{label} Category {cat_num}", 
+                        'label': label,
+                        'data': category_results[cat_num]
+                    })
+        
+        if not process_lst:
+            print("No category results to process")
+            return
+        
+        df_process = pd.DataFrame(process_lst, columns=['sheet', 'category', 'file', 'label', 'data'])
+        self._process_category_files(df_process, annotation_file, out_xsl_file_nm)
+
 
 
-    def _create_category_summary(self, data: pd.DataFrame, category_name: str) -> pd.DataFrame:
+    def _create_category_summary(self, incidence_matrix: CategoryIncidenceMatrix, category: int) -> pd.DataFrame:
         """
         Create a summary DataFrame for a specific category.
         
         Args:
-            data: The input annotation DataFrame
-            category_name: Name of the category column to summarize
+            incidence_matrix: Gene by term incidence matrix of the annotations
+            category: Category level (1, 2 or 3) to summarize
             
         Returns:
             DataFrame with category values and their counts, sorted by category name
         """
-        if category_name not in data.columns:
-            raise ValueError(f"Category '{category_name}' not found in data columns")
-            
-        category = data[category_name].value_counts()
-        category = pd.DataFrame({
-            category_name: category.index, 
-            'Count': category.values
-        })
-        category = category.sort_values(by=[category_name])
-        return category
-
-    # Data processing methods
-    def _significant(self, value: float) -> Union[float, str]:
-        """
-        Convert p-values to significance indicators.
+        if category not in incidence_matrix.term_slices:
+            raise ValueError(f"Category '{category}' not found in the annotations")
         
-        Args:
-            value: P-value to evaluate
+        # Annotation totals for every term come from one product with the incidence matrix
+        annotation_counts = incidence_matrix.term_counts(np.ones(incidence_matrix.shape[0], dtype=np.int64))
+        category_counts = incidence_matrix.level_counts(annotation_counts, category)
         
-        Returns:
-            Original value if significant, 'NS' if not significant, 'NV' if not a value
-           
-        Notes:
-            NV = Not a Value
-            NS = Not Significant
-        """
-        if pd.isna(value):
-            return 'NV'
-        return value if value < self.significance_threshold else 'NS'
+        category_name = f"Category {category}"
+        category_summary = pd.DataFrame({
+            category_name: category_counts.index, 
+            'Count': category_counts.values
+        })
+        category_summary = category_summary.sort_values(by=[category_name])
+        return category_summary
 
-    def _process_category_file_row(self, row: pd.Series, sheet: pd.DataFrame) -> pd.DataFrame:
+    # Data processing methods
+    def _read_category_results(self, row: pd.Series) -> pd.DataFrame:
         """
-        Process a single category file and merge with the existing sheet DataFrame.
+        Read the results of one run for one category as a long table.
         
         Args:
-            row: Series containing file information (file path, category, label)
-            sheet: Existing DataFrame to merge results into
+            row: Series containing file information (file path, category, label) and optionally
+                the results DataFrame as 'data', in which case the file is not read
             
         Returns:
-            Updated DataFrame with merged results
+            DataFrame with the run's label, and the Category, RGS and PValue of each tested category
             
         Raises:
             FileNotFoundError: If the category file doesn't exist
             CategoryProcessingError: If there's an error processing the category file
         """
         file_name = row['file']
-        if not Path(file_name).exists():
+        data = row.get('data')
+        if data is None and not Path(file_name).exists():
             raise FileNotFoundError(f"Category file not found: {file_name}")
             
         try:
-            label_category = f"Category {row['category']}"
-            label_pvalue = f"{row['label']}_PValue"
-            label_rgs = f"{row['label']}_RGS"
-
-            cat_results = pd.read_csv(file_name)
-            cat_results.rename(columns={
-                'Category': label_category,
-                'RGS': label_rgs, 
-                'PValue': label_pvalue
-            }, inplace=True)
-            
-            # Clean up unnecessary columns
-            columns_to_drop = []
-            for col in ['Unnamed: 0', 'AC']:
-                if col in cat_results.columns:
-                    columns_to_drop.append(col)
-                    
-            if columns_to_drop:
-                cat_results.drop(columns_to_drop, axis=1, inplace=True)
-
-            # Merge with existing sheet
-            sheet = pd.merge(sheet, cat_results, on=label_category, how='outer')
-            
-            # Apply significance threshold and RGS formatting
-            sheet[label_pvalue] = sheet[label_pvalue].apply(self._significant)
-            sheet[label_rgs] = sheet[label_rgs].apply(lambda x: x if pd.notna(x) and x > 0 else 0)
-            
-            return sheet
+            cat_results = pd.read_csv(file_name) if data is None else data
+            return pd.DataFrame({
+                'label': row['label'],
+                'Category': cat_results['Category'].to_numpy(),
+                'RGS': cat_results['RGS'].to_numpy(),
+                'PValue': cat_results['PValue'].to_numpy(dtype=float, na_value=np.nan)
+            })
         except Exception as e:
             raise CategoryProcessingError(f"Error processing file {file_name}: {str(e)}")
 
+    def _summarize_category_results(self, category_sheet: pd.DataFrame, results_df: pd.DataFrame, 
+                                    labels: List[str], category: int) -> pd.DataFrame:
+        """
+        Add the RGS and p-value columns of every run to the category summary.
+        
+        The long table of all runs is pivoted once into a column per run and joined to the
+        summary in a single merge, rather than merging the runs one at a time.
+        
+        Args:
+            category_sheet: Summary of the category (category names and annotation counts)
+            results_df: Long table of the results of all runs (see _read_category_results)
+            labels: Run labels in the order of their columns
+            category: Category level of the summary
+            
+        Returns:
+            Summary with a '<label>_RGS' and a '<label>_PValue' column per run
+        """
+        label_category = f"Category {category}"
+        
+        # Every category of the summary gets a row, whether or not a run tested it
+        categories = pd.Index(category_sheet[label_category]).union(pd.Index(results_df['Category'].unique()))
+        rgs = results_df.pivot(index='Category', columns='label', values='RGS').reindex(index=categories, columns=labels)
+        pvalues = results_df.pivot(index='Category', columns='label', values='PValue').reindex(index=categories, columns=labels)
+        
+        # RGS is 0 where a run did not test the category; p-values become 'NS' when not
+        # significant and 'NV' (not a value) when missing
+        rgs = rgs.where(rgs > 0, 0)
+        significant = pvalues.where(pvalues < self.significance_threshold, 'NS').mask(pvalues.isna(), 'NV')
+        
+        run_columns = {}
+        for label in labels:
+            run_columns[f"{label}_RGS"] = rgs[label]
+            run_columns[f"{label}_PValue"] = significant[label]
+        run_sheet = pd.DataFrame(run_columns).rename_axis(label_category).reset_index()
+        
+        return pd.merge(category_sheet, run_sheet, on=label_category, how='outer')
+
     # Excel formatting methods
     def _get_excel_formats(self, writer: pd.ExcelWriter) -> List[Any]:
         """
@@ -313,8 +411,8 @@ class WormcatExcel:
             raise FileNotFoundError(f"Annotation file not found: {annotation_file}")
         
         try:
-            # Load annotation data
-            data = pd.read_csv(annotation_file)
+            # Load annotation data from the shared annotation registry
+            incidence_matrix = get_annotations_manager(annotation_file).get_incidence_matrix()
             
             # Create Excel writer
             with pd.ExcelWriter(out_data_xlsx, engine='xlsxwriter') as writer:
@@ -326,7 +424,7 @@ class WormcatExcel:
 
                 # Process each sheet
                 for sheet_label in sheets:
-                    self._process_sheet(files_to_process, data, writer, sheet_label)
+                    self._process_sheet(files_to_process, incidence_matrix, writer, sheet_label)
             
         except Exception as e:
             print(f"Error processing category files: {str(e)}")
@@ -342,7 +440,7 @@ class WormcatExcel:
         return result
 
     def _process_sheet(self, files_to_process: pd.DataFrame, 
-                      data: pd.DataFrame, 
+                      incidence_matrix: CategoryIncidenceMatrix, 
                       writer: pd.ExcelWriter, 
                       sheet_label: str) -> None:
         """
@@ -350,7 +448,7 @@ class WormcatExcel:
         
         Args:
             files_to_process: DataFrame with file information
-            data: Annotation data
+            incidence_matrix: Gene by term incidence matrix of the annotations
             writer: Excel writer object
             sheet_label: Name of the sheet to process
         """
@@ -360,26 +458,32 @@ class WormcatExcel:
             print(f"No files to process for sheet {sheet_label}")
             return
                 
-        label_category = f"Category {cat_files['category'].iloc[0]}"
+        category = cat_files['category'].iloc[0]
         
         try:
             # Create the initial summary sheet
-            category_sheet = self._create_category_summary(data, label_category)
+            category_sheet = self._create_category_summary(incidence_matrix, category)
             
-            # Process each file for this category
+            # Gather the results of every run for this category
             cat_files.sort_values(by='label', inplace=True)
             
+            results_dfs = []
+            labels = []
             for _, row in cat_files.iterrows():
                 try:
                     file_path = Path(row['file'])
-                    if not file_path.exists():
+                    if row.get('data') is None and not file_path.exists():
                         print(f"File not found: {row['file']}")
                         continue
                     
-                    category_sheet = self._process_category_file_row(row, category_sheet)
+                    results_dfs.append(self._read_category_results(row))
+                    labels.append(row['label'])
                 except (FileNotFoundError, CategoryProcessingError) as e:
                     print(str(e))
                     continue
+            
+            if results_dfs:
+                category_sheet = self._summarize_category_results(category_sheet, pd.concat(results_dfs, ignore_index=True), labels, category)
 
             # Write the sheet to Excel
             category_sheet.to_excel(writer, sheet_name=sheet_label, index=False)